@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+import json
+import os
+import platform
+import subprocess
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from contextlib import redirect_stdout
+from multiprocessing import Process
+from statistics import mean, quantiles
+from threading import Lock
+from time import perf_counter, sleep, time
+from types import SimpleNamespace
+
+import posix_ipc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from arena import Arena
+from CONSTS import HUNGER_THRESHOLD
+from display import Display
+from env_manager import ENGINES, main as env_main, reap_individual
+from individual import Individual, IndividualType, MAX_ENERGY, World, eat, join_simulation, live
+from instance import Instance
+from locks import WorldLocks
+from population import Population
+from stats import Stats
+
+SIZES = [10, 100, 1000, 10000, 100000]
+# Own names for the standalone world, so a running simulation is left alone
+SHM_NAME = "/circle_of_life_bench_shm"
+LOCKS_PREFIX = "/circle_of_life_bench_ipc"
+STATS_NAME = "/circle_of_life_bench_stats"
+# The env's queues, join socket and port, likewise
+BENCH_INSTANCE = "bench"
+JOIN_BURST_THREADS = 256
+
+
+def summary(samples: list[float]) -> dict:
+    """Latency statistics of samples given in seconds, reported in microseconds."""
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+    p50, p99 = (quantiles(samples, n=100, method="inclusive")[i] for i in (49, 98)) if len(samples) > 1 else (samples[0], samples[0])
+    return {
+        "count": len(samples),
+        "mean_us": mean(samples) * 1e6,
+        "p50_us": p50 * 1e6,
+        "p99_us": p99 * 1e6,
+        "max_us": samples[-1] * 1e6,
+    }
+
+
+class TimedSemaphore:
+    """Stands in for a semaphore used as a context manager, recording how long it took to get it and was held."""
+
+    def __init__(self, sem: posix_ipc.Semaphore, times: dict[str, list[float]]):
+        self.sem = sem
+        self.times = times
+        self.acquired: float = 0
+
+    def __enter__(self):
+        start = perf_counter()
+        self.sem.acquire()
+        self.acquired = perf_counter()
+        self.times["acquire"].append(self.acquired - start)
+
+    def __exit__(self, *exc):
+        self.sem.release()
+        self.times["hold"].append(perf_counter() - self.acquired)
+
+    def release(self):
+        self.sem.release()
+
+
+class LockTimes:
+    """Swaps a world's header, index and stripe semaphores for timed ones."""
+
+    def __init__(self, world: World):
+        self.times = {name: {"acquire": [], "hold": []} for name in ("stripe", "index", "header")}
+        locks = world.locks
+        locks.header = TimedSemaphore(locks.header, self.times["header"])
+        locks.index = TimedSemaphore(locks.index, self.times["index"])
+        locks.stripes = [TimedSemaphore(sem, self.times["stripe"]) for sem in locks.stripes]
+
+    def reset(self):
+        for times in self.times.values():
+            times["acquire"].clear()
+            times["hold"].clear()
+
+    def report(self) -> dict:
+        return {name: {kind: summary(samples) for kind, samples in times.items()} for name, times in self.times.items()}
+
+
+def populate(world: World, size: int, prey_energy: int):
+    """Fill even slots with preys and odd ones with predators, as their own enter() would."""
+    for slot_id in range(size):
+        if slot_id % 2 == 0:
+            world.arena.slots.write(slot_id, 1, prey_energy)
+            world.prey_index.update(slot_id)
+        else:
+            world.arena.slots.write(slot_id, 2, MAX_ENERGY)
+    world.arena.header.set_count(1, (size + 1) // 2)
+    world.arena.header.set_count(2, size // 2)
+
+def bench_world(size: int, samples: int, reap_samples: int) -> dict:
+    """Energy updates, eat() and reaping on a standalone world of size slots, without an env."""
+    arena = Arena(SHM_NAME, size)
+    creator_locks = WorldLocks(LOCKS_PREFIX, arena, create=True)
+    creator_stats = Stats(STATS_NAME, create=True)
+    world = World(SHM_NAME, LOCKS_PREFIX, STATS_NAME)
+    lock_times = LockTimes(world)
+    results = {}
+
+    try:
+        # Energy updates: a full live() of a well fed predator, which reads and writes its slot without eating
+        populate(world, size, MAX_ENERGY)
+        predator = Individual(IndividualType.PREDATOR)
+        predator_ids = range(1, size, 2)
+        latencies = []
+        lock_times.reset()
+        for i in range(samples):
+            slot_id = predator_ids[i % len(predator_ids)]
+            world.arena.slots.set_energy(slot_id, MAX_ENERGY)
+            start = perf_counter()
+            live(predator, slot_id, world)
+            latencies.append(perf_counter() - start)
+        results["energy_update"] = {"latency": summary(latencies), "locks": lock_times.report()}
+
+        # Preys grazing: the header lock for the grass, then the stripe and index to write the energy
+        world.arena.header.grass = samples
+        prey = Individual(IndividualType.PREY)
+        prey_ids = range(0, size, 2)
+        latencies = []
+        lock_times.reset()
+        for i in range(samples):
+            prey.energy = HUNGER_THRESHOLD
+            start = perf_counter()
+            eat(prey, world, prey_ids[i % len(prey_ids)])
+            latencies.append(perf_counter() - start)
+        results["eat_prey"] = {"latency": summary(latencies), "locks": lock_times.report()}
+
+        # Predators hunting: claim from the index, kill under both stripes, queue the death. Each prey dies once
+        populate(world, size, HUNGER_THRESHOLD - 1)
+        latencies = []
+        lock_times.reset()
+        for i in range(min(samples, len(prey_ids))):
+            predator.energy = HUNGER_THRESHOLD
+            start = perf_counter()
+            eat(predator, world, predator_ids[i % len(predator_ids)])
+            latencies.append(perf_counter() - start)
+        results["eat_predator"] = {"latency": summary(latencies), "locks": lock_times.report()}
+
+        results["reap"] = bench_reap(world, size, reap_samples)
+    finally:
+        creator_locks.unlink()
+        creator_stats.unlink()
+        arena.close()
+        arena.memory.unlink()
+
+    return results
+
+def standalone_env(world: World, size: int) -> SimpleNamespace:
+    """Stands in for the EnvState of a standalone world: the world's own shared memory, locks and stats, plus the env's
+    bookkeeping of individuals. Every env attribute a benchmarked env function reads is added here, and only here."""
+    return SimpleNamespace(
+        **vars(world),
+        tags=array("H", bytes(2 * size)),
+        preys_processes={}, predators_processes={}, processes_lock=Lock(),
+        population=Population(0), return_id=lambda slot_id: None,
+    )
+
+def bench_reap(world: World, size: int, reap_samples: int) -> dict:
+    """reap_individual() on dead individuals backed by real, idle processes."""
+    env = standalone_env(world, size)
+    slot_ids = list(range(0, size, 2))[:reap_samples]
+    for slot_id in slot_ids:
+        env.preys_processes[slot_id] = Process(target=sleep, args=(60,))
+        env.preys_processes[slot_id].start()
+        # Killed as by a predator, unless one did already
+        if world.arena.slots.type_of(slot_id) != 0:
+            world.arena.slots.set_type(slot_id, 0)
+            world.arena.header.add_count(1, -1)
+
+    latencies = []
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for slot_id in slot_ids:
+            start = perf_counter()
+            reap_individual(env, slot_id, 0)
+            latencies.append(perf_counter() - start)
+    return {"latency": summary(latencies)}
+
+
+def quiet_env(engine: str, population_limit: int, instance: Instance):
+    # The env prints every command's output, keep it and its individuals' out of our JSON
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    env_main(engine, population_limit, instance=instance)
+
+class EnvClient(Display):
+    """A display without the shell: runs a quiet env and times commands over its message queues."""
+
+    def __init__(self, engine: str, population_limit: int):
+        self.instance = Instance(BENCH_INSTANCE)
+        self.env_send_queue = posix_ipc.MessageQueue(self.instance.env_send, flags=posix_ipc.O_CREAT, max_messages=10, max_message_size=8192)
+        self.env_recv_queue = posix_ipc.MessageQueue(self.instance.env_recv, flags=posix_ipc.O_CREAT, max_messages=10, max_message_size=8192)
+        self.env_process = Process(target=quiet_env, args=(engine, population_limit, self.instance))
+        self.env_process.start()
+        self.sent = 0
+        self.done = 0
+        # Wait until the env parses commands
+        self.command("list grass")
+
+    def command(self, *commands: str) -> float:
+        """Time commands sent through, pipelined if more than one."""
+        start = perf_counter()
+        self.run(commands)
+        return perf_counter() - start
+
+    def stop(self):
+        self.send("quit")
+        try:
+            while self.receive(timeout=30):
+                pass
+        except posix_ipc.BusyError:
+            pass
+        self.env_process.terminate()
+        self.env_process.join()
+        for queue in (self.env_send_queue, self.env_recv_queue):
+            queue.close()
+            try:
+                queue.unlink()
+            except posix_ipc.ExistentialError:
+                pass
+
+def bench_env(client: EnvClient, added: int, repeat: int, duration: float, join_burst: int) -> dict:
+    """Spawning added preys, then list, round trip and join handshake latencies with the env at its new size."""
+    spawn = client.command(f"add prey {added}") if added > 0 else 0.0
+    results = {"spawn": {"added": added, "total_s": spawn, "per_individual_us": spawn / added * 1e6 if added else None}}
+    results["list"] = {"latency": summary([client.command("list all") for _ in range(repeat)])}
+    # list grass does next to nothing on the env side, so this is mostly the queues
+    results["round_trip"] = {"latency": summary([client.command("list grass") for _ in range(repeat * 10)])}
+    pipelined = client.command(*["list grass"] * (repeat * 100))
+    results["pipelined"] = {"commands": repeat * 100, "per_s": repeat * 100 / pipelined}
+
+    joins = 0
+    latencies = []
+    deadline = perf_counter() + duration
+    while perf_counter() < deadline:
+        start = perf_counter()
+        if join_simulation(IndividualType.PREY, instance=client.instance) is None:
+            break
+        latencies.append(perf_counter() - start)
+        joins += 1
+    results["join"] = {"per_s": joins / duration, "latency": summary(latencies)}
+
+    # Many individuals joining at once, as after a big add
+    start = perf_counter()
+    with ThreadPoolExecutor(JOIN_BURST_THREADS) as executor:
+        joined = list(executor.map(lambda _: join_simulation(IndividualType.PREY, instance=client.instance), range(join_burst)))
+    elapsed = perf_counter() - start
+    results["join_burst"] = {"joins": join_burst, "failed": joined.count(None), "total_s": elapsed}
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    arg_parser = ArgumentParser(description="Latency and throughput of the IPC hot paths, as JSON")
+    arg_parser.add_argument("--engine", choices=ENGINES, default="vector",
+                            help="engine of the env for spawn, list, round trip and join measurements")
+    arg_parser.add_argument("--sizes", type=lambda arg: [int(size) for size in arg.split(",")], default=SIZES,
+                            help="comma separated population sizes")
+    arg_parser.add_argument("--samples", type=int, default=10000, help="energy updates and eats per size")
+    arg_parser.add_argument("--reap-samples", type=int, default=20, help="dead processes reaped per size")
+    arg_parser.add_argument("--repeat", type=int, default=10, help="list commands per size")
+    arg_parser.add_argument("--duration", type=float, default=1.0, help="seconds of join handshakes per size")
+    arg_parser.add_argument("--join-burst", type=int, default=2000, help="concurrent joins per size")
+    arg_parser.add_argument("--output", help="write the JSON there instead of stdout")
+    args = arg_parser.parse_args()
+    sizes = sorted(args.sizes)
+
+    results = {
+        "meta": {
+            "timestamp": time(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "engine": args.engine,
+        },
+        "sizes": [{"size": size} for size in sizes],
+    }
+
+    # Standalone world first, so the env's individuals don't compete for the CPU
+    for result in results["sizes"]:
+        result.update(bench_world(result["size"], args.samples, args.reap_samples))
+
+    client = EnvClient(args.engine, sizes[0])
+    try:
+        population = 0
+        for result in results["sizes"]:
+            result.update(bench_env(client, result["size"] - population, args.repeat, args.duration, args.join_burst))
+            population = result["size"]
+    finally:
+        client.stop()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from multiprocessing import Process, Queue
+from random import randrange
+from time import perf_counter
+
+import posix_ipc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from arena import Arena
+from locks import WorldLocks
+
+SHM_NAME = "/circle_of_life_bench_locking_shm"
+SINGLE_SEM_NAME = "/circle_of_life_bench_sem"
+LOCKS_PREFIX = "/circle_of_life_bench"
+
+
+def energy_updates(arena: Arena, lock_for, slots: int, duration: float, results: Queue):
+    """Same critical section as individual.main writing its energy, on random slots, for duration seconds."""
+    ops = 0
+    deadline = perf_counter() + duration
+
+    while perf_counter() < deadline:
+        slot_id = randrange(slots)
+        with lock_for(slot_id):
+            _, energy, _ = arena.slots.read(slot_id)
+            arena.slots.set_energy(slot_id, energy + 1)
+        ops += 1
+
+    results.put(ops)
+
+def single_worker(slots: int, duration: float, results: Queue):
+    # Attached like an individual would, the arena's mapping isn't inherited
+    arena = Arena(SHM_NAME)
+    sem = posix_ipc.Semaphore(SINGLE_SEM_NAME)
+    energy_updates(arena, lambda _: sem, slots, duration, results)
+
+def striped_worker(slots: int, duration: float, results: Queue):
+    arena = Arena(SHM_NAME)
+    locks = WorldLocks(LOCKS_PREFIX, arena)
+    energy_updates(arena, locks.stripe, slots, duration, results)
+
+def run(worker, workers: int, slots: int, duration: float) -> float:
+    results = Queue()
+    processes = [Process(target=worker, args=(slots, duration, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    total = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return total / duration
+
+
+def main():
+    arg_parser = ArgumentParser(description="Energy update throughput, single semaphore vs striped locks")
+    arg_parser.add_argument("--slots", type=int, default=1000)
+    arg_parser.add_argument("--duration", type=float, default=2.0, help="seconds per measurement")
+    arg_parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = arg_parser.parse_args()
+
+    # Every slot holds a prey, so writes keep the stripes' energy sums like in a simulation
+    arena = Arena(SHM_NAME, args.slots)
+    for slot_id in range(args.slots):
+        arena.slots.write(slot_id, 1, 0)
+    single_sem = posix_ipc.Semaphore(SINGLE_SEM_NAME, posix_ipc.O_CREAT, initial_value=1)
+    locks = WorldLocks(LOCKS_PREFIX, arena, create=True)
+
+    results = []
+    try:
+        for workers in range(1, args.max_workers + 1):
+            single = run(single_worker, workers, args.slots, args.duration)
+            striped = run(striped_worker, workers, args.slots, args.duration)
+            results.append({"workers": workers, "single_ops_per_s": single, "striped_ops_per_s": striped})
+    finally:
+        single_sem.unlink()
+        locks.unlink()
+        arena.close()
+        arena.memory.unlink()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'workers':>8} {'single ops/s':>14} {'striped ops/s':>14} {'speedup':>8}")
+    for result in results:
+        speedup = result["striped_ops_per_s"] / result["single_ops_per_s"]
+        print(f"{result['workers']:>8} {result['single_ops_per_s']:>14.0f} {result['striped_ops_per_s']:>14.0f} {speedup:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
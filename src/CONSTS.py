@@ -1,3 +1,11 @@
 #!/usr/bin/env false
 # TODO migrate constants here
-POPULATION_LIMIT = 10
\ No newline at end of file
+POPULATION_LIMIT = 10
+HUNGER_THRESHOLD = 50 # Shared by individuals and the env's prey index
+LOCK_STRIPES = 16 # Slot i is guarded by the semaphore of stripe i % LOCK_STRIPES
+# World rules shared by the env, headless runs and shards
+GRASS_LIMIT = 5
+MIN_GRASS_WAIT = 2
+MAX_GRASS_WAIT = 5
+SHIT_HAPPENS_INTERVAL = 40
+SHIT_HAPPENS_DURATION = 3
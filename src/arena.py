@@ -0,0 +1,253 @@
+#!/usr/bin/env false
+import mmap
+import os
+import struct
+
+import posix_ipc
+
+from CONSTS import LOCK_STRIPES
+
+# Header: event byte (unused), grass, generation, capacity, prey index count, death queue head and count, the number
+# of preys and predators, kept up to date by whoever changes a slot's type, birth queue head and count, then the
+# sequence number of every stripe (I each), odd while someone holds the stripe, then for every stripe and type the sum
+# of its individuals' energies and of their squares (q each), kept up to date by every slot write
+GRASS_OFFSET = 1
+GENERATION_OFFSET = 5
+CAPACITY_OFFSET = 9
+INDEX_COUNT_OFFSET = 13
+DEATH_HEAD_OFFSET = 17
+DEATH_COUNT_OFFSET = 21
+PREY_COUNT_OFFSET = 25
+PREDATOR_COUNT_OFFSET = 29
+BIRTH_HEAD_OFFSET = 33
+BIRTH_COUNT_OFFSET = 37
+SEQUENCE_OFFSET = 41
+ENERGY_SUMS_OFFSET = SEQUENCE_OFFSET + 4 * LOCK_STRIPES
+HEADER_SIZE = ENERGY_SUMS_OFFSET + 32 * LOCK_STRIPES
+
+# Population counters by type code
+COUNT_OFFSETS = {1: PREY_COUNT_OFFSET, 2: PREDATOR_COUNT_OFFSET}
+
+# Row, one per slot: the slot itself (type B, energy i, tag H, 1 byte padding), then the slot's position in the prey
+# index (i), the prey index entry at this position (i), the death queue entry at this position (slot i, tag H,
+# 2 bytes padding), in grid mode the slot's cell and its neighbours in that cell's list (i each, plus one), and the
+# birth queue entry at this position (offspring type B, 3 bytes padding).
+# Keeping every per-slot array in the row lets the arena grow without moving anything.
+SLOT_SIZE = 8
+ENERGY_OFFSET = 1
+TAG_OFFSET = 5
+INDEX_POSITION_OFFSET = 8
+INDEX_ENTRY_OFFSET = 12
+DEATH_ENTRY_OFFSET = 16
+GRID_CELL_OFFSET = 24
+GRID_NEXT_OFFSET = 28
+GRID_PREV_OFFSET = 32
+BIRTH_ENTRY_OFFSET = 36
+ROW_SIZE = 40
+
+# Past this, add commands report the world as full
+MAX_POPULATION = 1 << 24
+
+# Compiled once, packed into and unpacked from the mapping in place, so accesses don't slice the segment
+INT = struct.Struct("=i")
+SEQUENCE = struct.Struct("=I")
+ENERGY_SUMS = struct.Struct("=qq")
+TAG = struct.Struct("=H")
+# Slot: type, energy and tag, or only type and energy which leaves the tag alone
+SLOT = struct.Struct("=BiHx")
+SLOT_BODY = struct.Struct("=Bi")
+DEATH_ENTRY = struct.Struct("=iH2x")
+BIRTH_ENTRY = struct.Struct("=B3x")
+
+
+def row_offset(slot_id: int) -> int:
+    return HEADER_SIZE + (slot_id * ROW_SIZE)
+
+def energy_sums_offset(stripe: int, type_code: int) -> int:
+    return ENERGY_SUMS_OFFSET + 32 * stripe + 16 * (type_code - 1)
+
+def map_file(fd: int, size: int | None = None, fresh: bool = False) -> mmap.mmap:
+    """Map the whole file behind fd, resized to size bytes first if given. Fresh, its previous content is wiped."""
+    if fresh:
+        # Truncating to zero first drops whatever a previous run left behind
+        os.ftruncate(fd, 0)
+    if size is not None:
+        os.ftruncate(fd, size)
+    return mmap.mmap(fd, os.fstat(fd).st_size)
+
+def close_mapping(owner, *views: str):
+    """Close owner.mapfile, dropping first the attributes of owner named in views, numpy arrays over it."""
+    # The view must go before the mapping can be closed
+    for view in views:
+        setattr(owner, view, None)
+    if owner.mapfile is not None:
+        owner.mapfile.close()
+
+
+class Arena:
+    """
+    The world's shared memory segment, a header followed by one row per slot. Only the env grows it, by extending the
+    segment and bumping the generation in the header. Attached processes call refresh() and remap when it changed.
+    """
+
+    def __init__(self, name: str, capacity: int | None = None):
+        # Given a capacity, create the segment, otherwise attach to the env's
+        self.memory = posix_ipc.SharedMemory(name, posix_ipc.O_CREAT if capacity is not None else 0)
+        created = capacity is not None
+        self.mapfile = map_file(self.memory.fd, self.size(capacity) if created else None, fresh=created)
+        self.header = Header(self)
+        self.slots = Slots(self)
+        if capacity is not None:
+            self.header.capacity = capacity
+        self.generation: int = self.header.generation
+        self.capacity: int = self.header.capacity
+
+    @staticmethod
+    def size(capacity: int) -> int:
+        return HEADER_SIZE + (capacity * ROW_SIZE)
+
+    def read(self, offset: int) -> int:
+        return INT.unpack_from(self.mapfile, offset)[0]
+
+    def write(self, offset: int, value: int):
+        INT.pack_into(self.mapfile, offset, value)
+
+    def add(self, offset: int, delta: int):
+        """Add delta to a header field. Caller holds the header lock."""
+        self.write(offset, self.read(offset) + delta)
+
+    def refresh(self):
+        """Remap the segment if the env grew it since we last looked."""
+        generation = self.header.generation
+        if generation == self.generation:
+            return
+
+        # The env writes the capacity before the generation
+        self.capacity = self.header.capacity
+        self.mapfile = mmap.mmap(self.memory.fd, self.size(self.capacity))
+        self.generation = generation
+
+    def grow(self, capacity: int):
+        """Extend the segment to capacity rows. Env only, holding every lock."""
+        # The previous mapping stays valid for whoever still holds it, and is closed once dropped
+        self.mapfile = map_file(self.memory.fd, self.size(capacity))
+        self.capacity = capacity
+        self.header.capacity = capacity
+        self.generation += 1
+        self.header.generation = self.generation
+
+    def close(self):
+        close_mapping(self)
+        self.memory.close_fd()
+
+
+class _Field:
+    """An int of the header, read and written in place."""
+    __slots__ = ("offset",)
+
+    def __init__(self, offset: int):
+        self.offset = offset
+
+    def __get__(self, header: "Header", owner=None) -> int:
+        return INT.unpack_from(header.arena.mapfile, self.offset)[0]
+
+    def __set__(self, header: "Header", value: int):
+        INT.pack_into(header.arena.mapfile, self.offset, value)
+
+
+class Header:
+    """Named fields of the arena's header, e.g. arena.header.grass -= 1. Callers hold the header lock."""
+    __slots__ = ("arena",)
+
+    grass = _Field(GRASS_OFFSET)
+    generation = _Field(GENERATION_OFFSET)
+    capacity = _Field(CAPACITY_OFFSET)
+    index_count = _Field(INDEX_COUNT_OFFSET)
+    death_head = _Field(DEATH_HEAD_OFFSET)
+    death_count = _Field(DEATH_COUNT_OFFSET)
+    birth_head = _Field(BIRTH_HEAD_OFFSET)
+    birth_count = _Field(BIRTH_COUNT_OFFSET)
+
+    def __init__(self, arena: Arena):
+        self.arena = arena
+
+    def count(self, type_code: int) -> int:
+        """Population of a type."""
+        return self.arena.read(COUNT_OFFSETS[type_code])
+
+    def set_count(self, type_code: int, count: int):
+        self.arena.write(COUNT_OFFSETS[type_code], count)
+
+    def add_count(self, type_code: int, delta: int):
+        self.arena.add(COUNT_OFFSETS[type_code], delta)
+
+    def sequence(self, stripe: int) -> int:
+        return SEQUENCE.unpack_from(self.arena.mapfile, SEQUENCE_OFFSET + 4 * stripe)[0]
+
+    def bump(self, stripe: int):
+        """Next sequence number of a stripe. Only its holder calls this, once taking it and once letting it go."""
+        offset = SEQUENCE_OFFSET + 4 * stripe
+        SEQUENCE.pack_into(self.arena.mapfile, offset, (SEQUENCE.unpack_from(self.arena.mapfile, offset)[0] + 1)
+                           & 0xFFFFFFFF)
+
+    def sequences(self) -> bytes:
+        """Every stripe's sequence number, copied in one go."""
+        return self.arena.mapfile[SEQUENCE_OFFSET:ENERGY_SUMS_OFFSET]
+
+    def energy_sums(self, stripe: int, type_code: int) -> tuple[int, int]:
+        """Sum of the energies of a type's individuals in a stripe, and of their squares. Sums only ever move by what
+        was added and removed, so the stripes always add up to the whole population's, wherever its energy was put."""
+        return ENERGY_SUMS.unpack_from(self.arena.mapfile, energy_sums_offset(stripe, type_code))
+
+    def set_energy_sums(self, stripe: int, type_code: int, total: int, squares: int):
+        ENERGY_SUMS.pack_into(self.arena.mapfile, energy_sums_offset(stripe, type_code), total, squares)
+
+
+class Slots:
+    """The slot at the start of every row: type, energy and tag. Callers hold the slot's stripe, or accept a torn
+    read. Writes keep the stripe's energy sums in the header up to date, so they never need a scan."""
+    __slots__ = ("arena",)
+
+    def __init__(self, arena: Arena):
+        self.arena = arena
+
+    def _account(self, slot_id: int, type_code: int, energy: int, sign: int):
+        """Add (sign 1) or remove (sign -1) an individual's energy from its stripe's sums. Free slots count for none."""
+        if type_code not in COUNT_OFFSETS:
+            return
+        offset = energy_sums_offset(slot_id % LOCK_STRIPES, type_code)
+        total, squares = ENERGY_SUMS.unpack_from(self.arena.mapfile, offset)
+        ENERGY_SUMS.pack_into(self.arena.mapfile, offset, total + sign * energy, squares + sign * energy * energy)
+
+    def _replace(self, slot_id: int, type_code: int, energy: int):
+        old_type, old_energy = SLOT_BODY.unpack_from(self.arena.mapfile, row_offset(slot_id))
+        self._account(slot_id, old_type, old_energy, -1)
+        self._account(slot_id, type_code, energy, 1)
+
+    def read(self, slot_id: int) -> tuple[int, int, int]:
+        """Type, energy and tag."""
+        return SLOT.unpack_from(self.arena.mapfile, row_offset(slot_id))
+
+    def type_of(self, slot_id: int) -> int:
+        return self.arena.mapfile[row_offset(slot_id)]
+
+    def write(self, slot_id: int, type_code: int, energy: int):
+        """Set type and energy, the tag stays."""
+        self._replace(slot_id, type_code, energy)
+        SLOT_BODY.pack_into(self.arena.mapfile, row_offset(slot_id), type_code, energy)
+
+    def set_type(self, slot_id: int, type_code: int):
+        self._replace(slot_id, type_code, INT.unpack_from(self.arena.mapfile, row_offset(slot_id) + ENERGY_OFFSET)[0])
+        self.arena.mapfile[row_offset(slot_id)] = type_code
+
+    def set_energy(self, slot_id: int, energy: int):
+        self._replace(slot_id, self.arena.mapfile[row_offset(slot_id)], energy)
+        INT.pack_into(self.arena.mapfile, row_offset(slot_id) + ENERGY_OFFSET, energy)
+
+    def set_tag(self, slot_id: int, tag: int):
+        TAG.pack_into(self.arena.mapfile, row_offset(slot_id) + TAG_OFFSET, tag)
+
+    def clear(self, slot_id: int):
+        """Zero type, energy and tag."""
+        self._replace(slot_id, 0, 0)
+        SLOT.pack_into(self.arena.mapfile, row_offset(slot_id), 0, 0, 0)
@@ -0,0 +1,36 @@
+#!/usr/bin/env false
+from arena import Arena, BIRTH_ENTRY, BIRTH_ENTRY_OFFSET, row_offset
+
+
+class BirthQueue:
+    """
+    Ring buffer of births requested by individuals, as the offspring's type code, kept in the arena's rows with its
+    head and count in the header. Parents only push and carry on, the env drains the whole ring now and then and starts
+    the offsprings in bulk. When the ring is full, which means the world is, requests are dropped. Callers must hold the
+    header lock.
+    """
+
+    def __init__(self, arena: Arena):
+        self.arena = arena
+
+    def push(self, type_code: int) -> bool:
+        self.arena.refresh()
+        header = self.arena.header
+        count = header.birth_count
+        if count >= self.arena.capacity:
+            return False
+        offset = row_offset((header.birth_head + count) % self.arena.capacity) + BIRTH_ENTRY_OFFSET
+        BIRTH_ENTRY.pack_into(self.arena.mapfile, offset, type_code)
+        header.birth_count = count + 1
+        return True
+
+    def drain(self) -> list[int]:
+        """Pop every request, oldest first."""
+        self.arena.refresh()
+        header = self.arena.header
+        head, count = header.birth_head, header.birth_count
+        offsets = (row_offset((head + k) % self.arena.capacity) + BIRTH_ENTRY_OFFSET for k in range(count))
+        requests = [BIRTH_ENTRY.unpack_from(self.arena.mapfile, offset)[0] for offset in offsets]
+        header.birth_head = 0
+        header.birth_count = 0
+        return requests
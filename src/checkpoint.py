@@ -0,0 +1,176 @@
+#!/usr/bin/env false
+import mmap
+import os
+import struct
+from array import array
+from collections import deque
+
+import numpy as np
+
+from arena import Arena, MAX_POPULATION, SEQUENCE_OFFSET
+from vector_engine import PREY, PREDATOR
+
+# Header: magic, version, capacity, drought remaining, then the length of each array following the arena
+MAGIC = b"COLCKPT\x00"
+VERSION = 6
+HEADER_FORMAT = "=8sIiiiiii"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+class Checkpoint:
+    """A saved world: the arena's bytes, the slot tags, free IDs, drought state, and which slots hold whom."""
+
+    def __init__(self, capacity: int, drought_remaining: int, arena: bytes | memoryview, tags: array,
+                 free_ids: array, preys: array, predators: array, wait: np.ndarray):
+        self.capacity = capacity
+        self.drought_remaining = drought_remaining
+        self.arena = arena
+        self.tags = tags
+        self.free_ids = free_ids
+        self.preys = preys
+        self.predators = predators
+        # Ticks left before each slot's next update, only saved by the vector engine
+        self.wait = wait
+
+
+def save(env, path: str):
+    """Dump the world in one write. Individuals keep running, the arena is copied while holding every lock."""
+    with env.locks.all():
+        arena = bytes(env.arena.mapfile[:Arena.size(env.arena.capacity)])
+        capacity = env.arena.capacity
+        if env.engine is not None:
+            preys = array("i", np.flatnonzero(env.engine.alive & (env.engine.types == PREY)).astype(np.int32).tobytes())
+            predators = array("i", np.flatnonzero(env.engine.alive & (env.engine.types == PREDATOR)).astype(np.int32).tobytes())
+            wait = env.engine.wait.astype(np.int32)
+        else:
+            # The reaper and the supervisor take individuals out of the dicts without the world locks
+            with env.processes_lock:
+                preys = array("i", env.preys_processes.keys())
+                predators = array("i", env.predators_processes.keys())
+            wait = np.zeros(0, dtype=np.int32)
+        free_ids = array("i", env.free_ids)
+        tags = array("H", env.tags)
+
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, capacity, env.drought_remaining, len(free_ids), len(preys),
+                         len(predators), len(wait))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        buffers = [header, arena, tags, free_ids, preys, predators, wait]
+        written = os.writev(fd, buffers)
+        # A short write only happens past 2 GiB or so, finish the job then
+        total = sum(memoryview(buffer).nbytes for buffer in buffers)
+        if written < total:
+            data = b"".join(bytes(buffer) for buffer in buffers)[written:]
+            while data:
+                data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+def read(path: str) -> Checkpoint:
+    """Map a checkpoint file. Arrays are views or copies of the mapping, nothing is replayed."""
+    with open(path, "rb") as checkpoint_file:
+        mapfile = mmap.mmap(checkpoint_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # Everything is checked before a world is stopped for it, a bad file raises ValueError and nothing else
+    if len(mapfile) < HEADER_SIZE:
+        raise ValueError(f"{path} is too short for a checkpoint")
+    magic, version, capacity, drought_remaining, free_count, prey_count, predator_count, wait_count = \
+        struct.unpack_from(HEADER_FORMAT, mapfile)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} checkpoint")
+    if not 0 < capacity <= MAX_POPULATION or min(free_count, prey_count, predator_count, wait_count) < 0 \
+            or wait_count > capacity:
+        raise ValueError(f"{path} has a corrupted header")
+    size = (HEADER_SIZE + Arena.size(capacity) + 2 * capacity
+            + 4 * (free_count + prey_count + predator_count + wait_count))
+    if len(mapfile) != size:
+        raise ValueError(f"{path} holds {len(mapfile)} bytes instead of {size}, truncated or corrupted")
+
+    view = memoryview(mapfile)
+    offset = HEADER_SIZE
+    arena = view[offset:offset + Arena.size(capacity)]
+    offset += Arena.size(capacity)
+
+    def take(typecode: str, count: int) -> array:
+        nonlocal offset
+        values = array(typecode)
+        values.frombytes(view[offset:offset + count * values.itemsize])
+        offset += count * values.itemsize
+        return values
+
+    tags = take("H", capacity)
+    free_ids = take("i", free_count)
+    preys = take("i", prey_count)
+    predators = take("i", predator_count)
+    wait = np.frombuffer(view, np.int32, count=wait_count, offset=offset)
+    if any(slot_ids and (min(slot_ids) < 0 or max(slot_ids) >= capacity) for slot_ids in (free_ids, preys, predators)):
+        raise ValueError(f"{path} has slot IDs past its capacity")
+    return Checkpoint(capacity, drought_remaining, arena, tags, free_ids, preys, predators, wait)
+
+def restore(env, checkpoint: Checkpoint):
+    """
+    Put a checkpoint's world in place of the current one, whose individuals must be gone already. The arena only
+    grows, so attached hosts and pooled processes keep their mapping. Returns the (type, slot ID) of the individuals
+    left to start, which resume from the energy in their slot.
+    """
+    if checkpoint.capacity > env.arena.capacity:
+        env.grow(checkpoint.capacity)
+
+    with env.locks.all():
+        mapfile = env.arena.mapfile
+        generation = env.arena.header.generation
+        sequences = env.arena.header.sequences()
+        capacity = env.arena.capacity
+
+        # One copy for the header and every row, then the rows the checkpoint doesn't have are wiped
+        mapfile[:len(checkpoint.arena)] = checkpoint.arena
+        mapfile[len(checkpoint.arena):Arena.size(capacity)] = bytes(Arena.size(capacity) - len(checkpoint.arena))
+        env.arena.header.generation = generation
+        env.arena.header.capacity = capacity
+        # We hold every stripe, their sequence numbers must stay odd until we let go
+        mapfile[SEQUENCE_OFFSET:SEQUENCE_OFFSET + len(sequences)] = sequences
+        # Queued deaths and births belonged to processes that are gone, their slots are freed below
+        env.arena.header.death_head = 0
+        env.arena.header.death_count = 0
+        env.arena.header.birth_head = 0
+        env.arena.header.birth_count = 0
+
+        # Slots that died but were not reaped yet when saved are just free
+        individuals = []
+        free_ids = deque(checkpoint.free_ids)
+        for individual_type, slot_ids in ((PREY, checkpoint.preys), (PREDATOR, checkpoint.predators)):
+            for slot_id in slot_ids:
+                if env.arena.slots.type_of(slot_id) == individual_type:
+                    individuals.append((individual_type, slot_id))
+                else:
+                    env.arena.slots.write(slot_id, 0, 0)
+                    free_ids.append(slot_id)
+        free_ids.extend(range(checkpoint.capacity, capacity))
+
+        # Grids are not saved, restored individuals land on random cells of a regrown one
+        if env.grid is not None:
+            env.grid.clear()
+
+        env.free_ids = free_ids
+        env.tags = array("H", checkpoint.tags)
+        env.tags.frombytes(bytes(2 * (capacity - checkpoint.capacity)))
+
+        if env.engine is not None:
+            env.engine.types[:] = env.slots["type"]
+            env.engine.energy[:] = env.slots["energy"]
+            env.engine.alive[:] = env.engine.types != 0
+            env.engine.wait[:] = 0
+            env.engine.wait[:len(checkpoint.wait)] = checkpoint.wait
+            # Everyone lives in the engine, nothing to start
+            individuals = []
+            env.publish()
+        else:
+            # The saved counters still include the slots freed above
+            for type_code in (PREY, PREDATOR):
+                count = sum(1 for individual_type, _ in individuals if individual_type == type_code)
+                env.arena.header.set_count(type_code, count)
+
+    with env.drought_lock:
+        env.drought_remaining = checkpoint.drought_remaining
+
+    return individuals
@@ -0,0 +1,45 @@
+#!/usr/bin/env false
+from arena import Arena, DEATH_ENTRY, DEATH_ENTRY_OFFSET, row_offset
+
+
+class DeathQueue:
+    """
+    Ring buffer of dead individuals as (slot ID, tag), kept in the arena's rows with its head and count in the header.
+    The tag tells the reaper whether the slot was handed to someone else since. A slot is queued at most once before
+    being reaped, so the ring can't overflow.
+
+    It is not lock free: head and count are plain header fields, so every push and pop serializes on the header lock,
+    which callers must hold, releasing the deaths semaphore after each push. Deaths already take it to update the
+    counts, so the queue adds no lock of its own, only contention on that one.
+    """
+
+    def __init__(self, arena: Arena):
+        self.arena = arena
+
+    def push(self, slot_id: int, tag: int):
+        self.arena.refresh()
+        header = self.arena.header
+        count = header.death_count
+        offset = row_offset((header.death_head + count) % self.arena.capacity) + DEATH_ENTRY_OFFSET
+        DEATH_ENTRY.pack_into(self.arena.mapfile, offset, slot_id, tag)
+        header.death_count = count + 1
+
+    def pop(self) -> tuple[int, int] | None:
+        self.arena.refresh()
+        header = self.arena.header
+        count = header.death_count
+        if count == 0:
+            return None
+
+        head = header.death_head
+        entry = DEATH_ENTRY.unpack_from(self.arena.mapfile, row_offset(head) + DEATH_ENTRY_OFFSET)
+        header.death_head = (head + 1) % self.arena.capacity
+        header.death_count = count - 1
+        return entry
+
+    def drain(self) -> list[tuple[int, int]]:
+        """Pop every entry, so they can be pushed back once the ring's capacity changed."""
+        entries = []
+        while (entry := self.pop()) is not None:
+            entries.append(entry)
+        return entries
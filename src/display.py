@@ -1,50 +1,179 @@
 #!/usr/bin/env python3
+import sys
+from argparse import ArgumentParser
+from collections.abc import Iterable
 from multiprocessing import Process
 from time import sleep
 
 import posix_ipc
 
-from env_manager import main as env_main
+from CONSTS import POPULATION_LIMIT
+from env_manager import ENGINES, RECORD_INTERVAL, SHARDS, SPAWN_POOL_SIZE, main as env_main
+from instance import Instance, instance_name
+from profiler import Profiler, clear as clear_profiles, requested as profiling_requested
+
+# Commands sent but not answered yet, kept below the queue's max_messages so sending never blocks
+MAX_IN_FLIGHT = 8
 
 
 class Display:
-    def __init__(self):
+    def __init__(self, engine: str = "process", population_limit: int = POPULATION_LIMIT, hosts: int = 0,
+                 spawn_pool: int = SPAWN_POOL_SIZE, record: str | None = None, record_interval: float = RECORD_INTERVAL,
+                 grid: tuple[int, int] | None = None, shards: int | list[str] = SHARDS, instance: Instance | None = None):
+        self.instance = instance or Instance()
         # Start env process with POSIX message queues
-        self.env_send_queue = posix_ipc.MessageQueue("/env_send", flags=posix_ipc.O_CREAT, max_messages=10, max_message_size=8192)
-        self.env_recv_queue = posix_ipc.MessageQueue("/env_recv", flags=posix_ipc.O_CREAT, max_messages=10, max_message_size=8192)
-        self.env_process = Process(target=env_main, args=())
+        self.env_send_queue = posix_ipc.MessageQueue(self.instance.env_send, flags=posix_ipc.O_CREAT, max_messages=10, max_message_size=8192)
+        self.env_recv_queue = posix_ipc.MessageQueue(self.instance.env_recv, flags=posix_ipc.O_CREAT, max_messages=10, max_message_size=8192)
+        # Samples of an earlier run would end up in this one's report
+        clear_profiles(self.instance.profile_dir)
+        self.env_process = Process(target=env_main, args=(engine, population_limit, hosts, spawn_pool, record,
+                                                          record_interval, grid, shards, self.instance))
         self.env_process.start()
+        # Commands carry increasing request IDs, and the env answers each batch with the last ID it went through
+        self.sent: int = 0
+        self.done: int = 0
+        # We sample ourselves too, following the profile commands we send along
+        self.profiling: bool = profiling_requested()
+        self.profiler = Profiler("display", lambda: self.profiling, self.instance.profile_dir)
+
+    def send(self, command: str):
+        words = command.lower().split()
+        if len(words) == 2 and words[0] == "profile" and words[1] in ("on", "off"):
+            self.profiling = words[1] == "on"
+            self.profiler.poll()
+        self.sent += 1
+        self.env_send_queue.send(f"{self.sent} {command}".encode("utf-8"))
+
+    def receive(self, timeout: float | None = None) -> bool:
+        """Wait for the env's next reply, and return False if it is quitting."""
+        msg, _ = self.env_recv_queue.receive(timeout)
+        msg = msg.decode("utf-8")
+
+        # If env tells us to quit, we do. This should only happen when we receive a quit token
+        if msg == "quit":
+            return False
+        # The last request ID of a batch, then the errors of its commands that failed
+        request_id, *errors = msg.split("\n")
+        for error in errors:
+            print(error)
+        self.done = int(request_id)
+        return True
+
+    def run(self, commands: Iterable[str]) -> bool:
+        """Pipeline commands with at most MAX_IN_FLIGHT unanswered, wait for them all, and return False if the env quit."""
+        for command in commands:
+            while self.sent - self.done >= MAX_IN_FLIGHT:
+                if not self.receive():
+                    return False
+            self.send(command)
+
+        while self.done < self.sent:
+            if not self.receive():
+                return False
+        return True
+
+
+def script_lines(lines: Iterable[str]) -> Iterable[str]:
+    """Commands of a script, skipping blank lines and # comments, with run commands replaced by their own script."""
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        words = line.split(" ", 1)
+        if words[0].lower() != "run" or len(words) == 1:
+            yield line
+            continue
+
+        # Scripts are read on our side and pipelined
+        path = words[1].strip()
+        try:
+            with open(path) as script:
+                yield from script_lines(script.readlines())
+        except OSError as e:
+            print(f"***Cannot run {path}: {e.strerror}")
         
+def grid_size(value: str) -> tuple[int, int]:
+    """Parse a --grid value like 64x48."""
+    width, _, height = value.lower().partition("x")
+    if not (width.isdigit() and height.isdigit() and int(width) >= 3 and int(height) >= 3):
+        raise ValueError(value)
+    return int(width), int(height)
+
+def shard_spec(value: str) -> int | list[str]:
+    """Parse a --shards value, a number of local shards or the host:port of running ones."""
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    addresses = value.split(",")
+    if not all(address.rpartition(":")[2].isdigit() for address in addresses):
+        raise ValueError(value)
+    return addresses
+
 def main():
-    display = Display()
+    arg_parser = ArgumentParser(description="Circle of Life ecosystem simulation")
+    arg_parser.add_argument("--engine", choices=ENGINES, default="process",
+                            help="process: one OS process per individual, vector: whole population in NumPy arrays, "
+                                 "host: many individuals per worker process, shard: population split over shard "
+                                 "servers")
+    arg_parser.add_argument("--population-limit", type=int, default=POPULATION_LIMIT,
+                            help="number of individual slots in the shared memory")
+    arg_parser.add_argument("--hosts", type=int, default=0,
+                            help="worker processes in host mode, defaults to one per core")
+    arg_parser.add_argument("--spawn-pool", type=int, default=SPAWN_POOL_SIZE,
+                            help="pre-forked individual processes kept ready in process mode, 0 to disable")
+    arg_parser.add_argument("--record", metavar="PATH",
+                            help="append population, grass and energy histograms to this time series file")
+    arg_parser.add_argument("--record-interval", type=float, default=RECORD_INTERVAL,
+                            help="seconds between two samples of --record")
+    arg_parser.add_argument("--grid", type=grid_size, metavar="WIDTHxHEIGHT",
+                            help="spatial world of WIDTHxHEIGHT cells (3 or more each), individuals eat around them")
+    arg_parser.add_argument("--shards", type=shard_spec, default=SHARDS, metavar="N|HOST:PORT,...",
+                            help="in shard mode, number of shards to run on loopback, or addresses of running ones")
+    arg_parser.add_argument("--instance", type=instance_name, metavar="NAME",
+                            help="suffix of every IPC name, so simulations with different names can run side by side")
+    arg_parser.add_argument("--port", type=int,
+                            help="TCP join port, local shards listen from 11 ports higher on; 15789 by default, any "
+                                 "free port with --instance")
+    args = arg_parser.parse_args()
+    if args.grid is not None and args.engine in ("vector", "shard"):
+        arg_parser.error(f"--grid runs individuals, not the {args.engine} engine")
+    if args.instance and args.port is None and args.engine == "shard" and isinstance(args.shards, int):
+        arg_parser.error("local shards of a named instance need a --port")
+
+    display = Display(args.engine, args.population_limit, args.hosts, args.spawn_pool, args.record,
+                      args.record_interval, args.grid, args.shards,
+                      Instance(args.instance or "", args.port))
     
     # ANSI Color Codes
     BOLD_YELLOW = "\033[1;33m"
     GREEN = "\033[92m"
     RESET = "\033[0m"
 
-    print(f"{BOLD_YELLOW}*** Honishell Ready - Parsing Commands ***{RESET}")
     try:
+        # Piped commands don't wait for each other, then stdin running out quits like ^D does
+        if not sys.stdin.isatty():
+            if display.run(script_lines(sys.stdin)):
+                raise EOFError
+            return
+
+        print(f"{BOLD_YELLOW}*** Honishell Ready - Parsing Commands ***{RESET}")
         while True:
-            # Wait for command then send it
+            # Wait for command then send it, and wait until env is done parsing. This is basically syncing
             command = input(f"{GREEN}>{RESET} ")
-            display.env_send_queue.send(command.encode("utf-8"))
-        
-            # Wait for response, until env is done parsing. This is basically syncing
-            msg, _ = display.env_recv_queue.receive()
-            msg = msg.decode("utf-8")
-            
-            # If env tells us to quit, we do. This should only happen when we receive a quit token 
-            if msg == "quit":
+            commands = script_lines([command]) if command.lower().startswith("run ") else [command]
+            if not display.run(commands):
                 break
-            
-            # If env returns a non-empty message, display it. This is what we do after all 
-            if msg != '\0':
-                print(msg)
     except (KeyboardInterrupt, EOFError):
         print()
-        display.env_send_queue.send("quit".encode("utf-8")) #Tell env to wrap up
-        msg, _ = display.env_recv_queue.receive(timeout=5) #Wait env tells us he's done (or timeout)
+        # The env merges every profile on its way out
+        display.profiler.stop()
+        display.send("quit") #Tell env to wrap up
+        try:
+            #Wait env tells us he's done (or timeout), skipping what is left of a script
+            while display.receive(timeout=5):
+                pass
+        except posix_ipc.BusyError:
+            pass
         sleep(.2) #Wait a bit more for env to actually finish its exit sequence
     finally:
         # Close everything on our end
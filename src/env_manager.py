@@ -1,173 +1,478 @@
 #!/usr/bin/env false
-import mmap
+import asyncio
 import signal
-import struct
+from array import array
+from collections import deque
 from multiprocessing import Process, Lock
+from os import cpu_count
 from random import randint
-from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR, SHUT_RDWR
-from threading import Thread
-from time import sleep
+from threading import Event, Lock as ThreadLock, Thread
+from time import perf_counter, sleep, time
 
+import numpy as np
 import posix_ipc
 
+from arena import Arena, MAX_POPULATION, row_offset
+from birth_queue import BirthQueue
 from CONSTS import *
+from death_queue import DeathQueue
+from grid import Grid
+from handshake import JOIN_TIMEOUT, LISTEN_ADDRESS, read_frame, write_frame
+from host import IndividualHost
 from individual import IndividualType
+from instance import Instance
+from locks import WorldLocks
 from parser import parse_command
+from population import POPULATION_INTERVAL, Population
+from prey_index import PreyIndex
+from profiler import Profiler, requested as profiling_requested
+from recorder import Recorder
+from runtime import close_process, free_slot, population_census, start_individuals
+from shard import ShardClient, start_local
+from scheduler import Scheduler
+from spawn_pool import SpawnPool
+from supervisor import Supervisor
+from stats import Stats, BIRTHS, COMMAND, COMMANDS, CRASHES, GRASS_GROWN, JOIN, JOINS, REAP, REAPED
+from vector_engine import VectorEngine, PREY, PREDATOR, SLOT_DTYPE
 
-LISTEN_ADDRESS = "127.0.0.1"
-LISTEN_PORT = 15789
-LISTEN_LIMIT = 5
+# Backlog of the join server, capped by the kernel's somaxconn
+LISTEN_LIMIT = 4096
 
-MIN_GRASS_WAIT = 2
-MAX_GRASS_WAIT = 5
-SHIT_HAPPENS_INTERVAL = 40
-SHIT_HAPPENS_DURATION = 3
+VECTOR_TICK = 1
+# Commands handled before answering the display, as many as its queue holds
+MAX_BATCH = 10
+# Characters of a failed command's error sent back to the display, so a whole batch's fit in a message
+MAX_ERROR_LENGTH = 500
+RECORD_INTERVAL = 1
+# Simulation seconds between two batches of births
+BIRTH_INTERVAL = 1
+SPAWN_POOL_SIZE = 16
+SHARDS = 2
 
-GRASS_LIMIT = 5
-SHM_NAME = "/circle_of_life_shm"
-SEM_NAME = "/circle_of_life_sem"
-TOTAL_SIZE = 5 + (POPULATION_LIMIT * 8) #1 byte type + 4 bytes energy + 3 bytes padding pre individual
+ENGINES = ["process", "vector", "host", "shard"]
 
 class EnvState:
-    def __init__(self):
-        # Configure parser and coms with display
-        self.send_queue: posix_ipc.MessageQueue = posix_ipc.MessageQueue("/env_recv")
-        self.recv_queue: posix_ipc.MessageQueue = posix_ipc.MessageQueue("/env_send")
-        self.parser_thread: Thread = Thread(target=display_listener, args=(self,))
-        self.parser_thread.start()
-        
-        # Configure thread to accept preys and predators
-        self.socket_thread: Thread = Thread(target=socket_listener, args=(self,))
-        self.socket_thread.start()
+    def __init__(self, engine: str = "process", population_limit: int = POPULATION_LIMIT, hosts: int = 0,
+                 spawn_pool: int = SPAWN_POOL_SIZE, record: str | None = None, record_interval: float = RECORD_INTERVAL,
+                 grid: tuple[int, int] | None = None, shards: int | list[str] = SHARDS, instance: Instance | None = None):
+        # Every IPC name, so simulations of other instances can run alongside
+        self.instance = instance or Instance()
+        # Configure coms with display
+        self.send_queue: posix_ipc.MessageQueue = posix_ipc.MessageQueue(self.instance.env_recv)
+        self.recv_queue: posix_ipc.MessageQueue = posix_ipc.MessageQueue(self.instance.env_send)
         self.preys_processes: dict[int, Process] = {}
         self.predators_processes: dict[int, Process] = {}
+        # Guards every change to the dicts: commands, births, the reaper and the supervisor all make some
+        self.processes_lock = ThreadLock()
+
+        # Create zero-filled shared memory, starting with population_limit slots and growing when they run out
+        self.arena = Arena(self.instance.shm, population_limit)
+        # In grid mode, grass grows per cell and individuals only eat around them, each region of cells has a lock
+        self.grid: Grid | None = Grid(self.instance.grid, self.arena, grid) if grid is not None else None
+        self.locks = WorldLocks(self.instance.sem, self.arena, create=True,
+                                regions=self.grid.region_count if self.grid is not None else 0)
+        # Hot path counters, the env's own included
+        self.stats = Stats(self.instance.stats, create=True)
+        self.locks.instrument(self.stats)
+        # Every process profiles itself while the switch in the stats page is on, see the profile command
+        self.stats.set_profiling(profiling_requested())
+        self.profiler = Profiler("env", self.stats.profiling, self.instance.profile_dir)
+        self.prey_index = PreyIndex(self.arena)
+        self.death_queue = DeathQueue(self.arena)
+        self.birth_queue = BirthQueue(self.arena)
+        # Initialise grass value
+        self.arena.header.grass = GRASS_LIMIT
+        # Queue of free IDs, and the tag each slot was last handed out with so stale IDs can be told apart
+        self.free_ids: deque[int] = deque(range(population_limit))
+        self.tags = array("H", bytes(2 * population_limit))
+
+        # In shard mode, the population and grass live in shard servers, started here or already running elsewhere,
+        # and the env only coordinates them. Shards are forked before any thread starts
+        self.shards: list[ShardClient] = []
+        self.shard_processes: list[Process] = []
+        if engine == "shard":
+            addresses = shards
+            if isinstance(shards, int):
+                self.shard_processes, addresses = start_local(shards, population_limit, self.instance.shard_port,
+                                                              self.instance.profile_dir)
+            self.shards = [ShardClient(address) for address in addresses]
+
+        # Every timed event goes through the scheduler: updates of the individuals, engine ticks, grass and droughts
+        self.scheduler = Scheduler(self)
+        # Streaming statistics of the population, for list population, fed by births and reaps from the start
+        self.population = Population(self.scheduler.now())
+        # Wakeup semaphore of every slot an individual process ever ran in
+        self.wakeups: dict[int, posix_ipc.Semaphore] = {}
+
+        # In vector mode, the whole population lives in the engine instead of individual processes
+        self.engine: VectorEngine | None = None
+        if engine == "vector":
+            self.engine = VectorEngine(population_limit)
+            # Zero-copy view of the individuals' slots, the engine publishes into it
+            self.slots: np.ndarray = self.arena_slots()
+            self.scheduler.schedule(VECTOR_TICK, vector_tick)
+
+        # Configure thread to accept preys and predators, once the state they work on is ready
+        self.listening = Event()
+        self.socket_thread: Thread = Thread(target=socket_listener, args=(self,), name="socket_listener")
+        self.socket_thread.start()
+        # Hosts and pooled processes join right away, with the join port once it is known
+        self.listening.wait()
+
+        # In host mode, individuals are asyncio tasks spread over a few worker processes
+        self.hosts: list[IndividualHost] = []
+        if engine == "host":
+            self.hosts = [IndividualHost(self.instance) for _ in range(hosts or cpu_count())]
 
-        # Create zero-filled shared memory
-        self.memory = posix_ipc.SharedMemory(SHM_NAME, posix_ipc.O_CREAT, size=TOTAL_SIZE)
-        self.mapfile = mmap.mmap(self.memory.fd, self.memory.size)
-        self.mapfile.seek(0)
-        self.mapfile.write(b'\x00' * TOTAL_SIZE)
-        self.sem = posix_ipc.Semaphore(SEM_NAME, posix_ipc.O_CREAT, initial_value=1)
-        # Initialise death indicator and grass value
-        self.mapfile.seek(0)
-        self.mapfile.write(struct.pack("=Bi", 0, GRASS_LIMIT))
-        # Simple stack of free IDs
-        self.free_ids = list(range(POPULATION_LIMIT))
-        self.population_limit = POPULATION_LIMIT #Needed for parser
+        # Individual processes are watched through pidfds, so one killed from outside doesn't leak its slot
+        self.supervisor = Supervisor(lambda slot_id, process, exit_code: individual_exited(self, slot_id, process,
+                                                                                          exit_code))
+
+        # In process mode, keep warm individual processes so add commands don't wait for forks and handshakes
+        self.spawn_pool: SpawnPool | None = None
+        if engine == "process" and spawn_pool > 0:
+            self.spawn_pool = SpawnPool(spawn_pool, self.instance)
+
+        # Reap dead individuals as soon as they are queued
+        self.reaper_thread = Thread(target=reaper, args=(self,), name="reaper")
+        self.reaper_thread.start()
+
+        # Sample the world into a time series file
+        self.recorder: Recorder | None = None
+        if record is not None:
+            self.recorder = Recorder(record)
+            self.recorder_thread = Thread(target=recorder, args=(self, record_interval), name="recorder")
+            self.recorder_thread.start()
+
+        # Commands and batches of births both start and stop individuals, one at a time
+        self.population_lock = ThreadLock()
+        # Offsprings of individual processes and hosted ones, the engines and shards breed on their own
+        if engine in ("process", "host"):
+            self.scheduler.schedule(BIRTH_INTERVAL, births)
 
         # Configure grass growth
-        self.grass_thread = Thread(target=grass, args=(self,))
-        self.grass_thread.start()
+        self.scheduler.schedule(randint(MIN_GRASS_WAIT, MAX_GRASS_WAIT), grass)
         # Configure drought episodes
         self.drought_lock = Lock()
         self.drought_remaining = 0
-        signal.signal(signal.SIGALRM, self.handle_shit_happened)
-        signal.setitimer(signal.ITIMER_REAL, SHIT_HAPPENS_INTERVAL, SHIT_HAPPENS_INTERVAL)
+        # Simulated time the last one started
+        self.last_drought: float | None = None
+        self.scheduler.schedule(SHIT_HAPPENS_INTERVAL, shit_happens)
+        self.scheduler.schedule(POPULATION_INTERVAL, census)
 
-    def get_free_id(self) -> int | None:
-        return self.free_ids.pop(0) if self.free_ids else None
+        # Configure parser last, piped commands arrive right away and may use any of the above
+        self.parser_thread: Thread = Thread(target=display_listener, args=(self,), name="display_listener")
+        self.parser_thread.start()
+
+    def get_free_id(self, grow: bool = True) -> int | None:
+        if not self.free_ids and (not grow or not self.grow()):
+            return None
+
+        slot_id = self.free_ids.popleft()
+        self.tags[slot_id] = (self.tags[slot_id] + 1) & 0xFFFF
+        # The individual keeps the tag when it enters its slot
+        with self.locks.stripe(slot_id):
+            self.arena.slots.set_tag(slot_id, self.tags[slot_id])
+        return slot_id
 
     def return_id(self, returned_id: int):
         self.free_ids.append(returned_id)
 
-    def handle_shit_happened(self, signum, frame):
-        with self.drought_lock:
-            self.drought_remaining = SHIT_HAPPENS_DURATION
+    def grow(self, capacity: int = 0) -> bool:
+        """Double the world's slots, or more to reach capacity. Return False if it is already at MAX_POPULATION."""
+        old_capacity = self.arena.capacity
+        new_capacity = min(max(old_capacity * 2, capacity), MAX_POPULATION)
+        if new_capacity <= old_capacity:
+            return False
+
+        with self.locks.all():
+            # The death and birth queues wrap around the capacity, so lay their entries out again
+            deaths = self.death_queue.drain()
+            requests = self.birth_queue.drain()
+            if self.engine is not None:
+                del self.slots
+            self.arena.grow(new_capacity)
+            for slot_id, tag in deaths:
+                self.death_queue.push(slot_id, tag)
+            for type_code in requests:
+                self.birth_queue.push(type_code)
+
+            if self.engine is not None:
+                self.engine.grow(new_capacity)
+                self.slots = self.arena_slots()
+                self.publish()
+
+        self.free_ids.extend(range(old_capacity, new_capacity))
+        self.tags.frombytes(bytes(2 * (new_capacity - old_capacity)))
+        return True
+
+    def arena_slots(self) -> np.ndarray:
+        # Zero-copy view of the individuals' slots
+        return np.frombuffer(self.arena.mapfile, SLOT_DTYPE, count=self.arena.capacity, offset=row_offset(0))
+
+    def publish(self):
+        """Write the engine's population into the arena, counters and energy sums included. Caller holds every
+        lock."""
+        self.engine.publish(self.slots)
+        for type_code in (PREY, PREDATOR):
+            self.arena.header.set_count(type_code, self.engine.count(type_code))
+            # Only the stripes' total means anything, so it all goes in the first one
+            self.arena.header.set_energy_sums(0, type_code, *self.engine.energy_sums(type_code))
+            for stripe in range(1, LOCK_STRIPES):
+                self.arena.header.set_energy_sums(stripe, type_code, 0, 0)
+
+    def wakeup(self, slot_id: int) -> posix_ipc.Semaphore:
+        """The slot's wakeup semaphore, with no wakeup left over from its previous individual."""
+        if slot_id not in self.wakeups:
+            self.wakeups[slot_id] = self.locks.wakeup(slot_id, create=True)
+        wakeup = self.wakeups[slot_id]
+        try:
+            while True:
+                wakeup.acquire(0)
+        except posix_ipc.BusyError:
+            pass
+        return wakeup
 
 
 def display_listener(env):
     while True:
-        command, _ = env.recv_queue.receive()
-        command = command.decode("utf-8")
-        parse_command(command, env)
-        env.send_queue.send('\0'.encode("utf-8"))
+        # Wait for a command, take whatever else is queued behind it, and answer the batch once with its last ID
+        batch = [env.recv_queue.receive()[0]]
+        while len(batch) < MAX_BATCH:
+            try:
+                batch.append(env.recv_queue.receive(timeout=0)[0])
+            except posix_ipc.BusyError:
+                break
+
+        errors = []
+        for message in batch:
+            request_id, _, command = message.decode("utf-8").partition(" ")
+            start = perf_counter()
+            # A failing command must not take the listener down, the display would wait for its answer forever
+            try:
+                with env.population_lock:
+                    parse_command(command, env)
+            except Exception as e:
+                errors.append(f"***{command} failed: {e!r}"[:MAX_ERROR_LENGTH])
+            env.stats.count(COMMANDS)
+            env.stats.time(COMMAND, perf_counter() - start)
+
+        env.stats.maybe_flush()
+        # A profile command may have switched us on
+        env.profiler.poll()
+        # The batch's errors go along with its answer, one per line, for the display to show
+        env.send_queue.send("\n".join([request_id, *errors]).encode("utf-8"))
 
 def socket_listener(env):
-    with socket(AF_INET, SOCK_STREAM) as server_socket:
-        server_socket.bind((LISTEN_ADDRESS, LISTEN_PORT))
-        server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
-        server_socket.listen(LISTEN_LIMIT)
-        
-        while True:
-            client_socket, client_address = server_socket.accept()
-            add_client(env, client_socket, client_address)
-
-def add_client(env: EnvState, client_socket: socket, client_address: tuple[str, int]):
-    # Even though it should be the case already, make sure the client IP matches the server's
-    if client_address[0] != LISTEN_ADDRESS:
-        client_socket.close()
+    asyncio.run(join_server(env))
+
+async def join_server(env: EnvState):
+    """Serve joins concurrently, over TCP and a Unix socket, so bursts of spawns never fill the backlog."""
+    def on_join(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        return add_client(env, reader, writer)
+
+    tcp_server = await asyncio.start_server(on_join, LISTEN_ADDRESS, env.instance.port, backlog=LISTEN_LIMIT,
+                                            reuse_address=True)
+    # Port 0 picked a free one, individuals started from now on get it with the instance
+    env.instance.port = tcp_server.sockets[0].getsockname()[1]
+    unix_server = await asyncio.start_unix_server(on_join, env.instance.join_socket, backlog=LISTEN_LIMIT)
+    env.listening.set()
+
+    async with tcp_server, unix_server:
+        await asyncio.gather(tcp_server.serve_forever(), unix_server.serve_forever())
+
+async def add_client(env: EnvState, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    start = perf_counter()
+    try:
+        # Even though it should be the case already, make sure the client IP matches the server's. Unix sockets are
+        # local anyway
+        peer = writer.get_extra_info("peername")
+        if isinstance(peer, tuple) and peer[0] != LISTEN_ADDRESS:
+            return
+
+        # "<type> <count>", a host or a batch registers many individuals with a single join
+        async with asyncio.timeout(JOIN_TIMEOUT):
+            individual_type, _, count = (await read_frame(reader)).partition(" ")
+        if individual_type in IndividualType and count.isdigit():
+            # Send memory, semaphore, stats and grid names to the joined individuals
+            names = f"{env.arena.memory.name} {env.locks.prefix} {env.stats.name}"
+            write_frame(writer, names if env.grid is None else f"{names} {env.grid.name}")
+            env.stats.count(JOINS, int(count))
+        else:
+            write_frame(writer, "")
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+        env.stats.time(JOIN, perf_counter() - start)
+
+def reaper(env: EnvState):
+    while True:
+        # Individuals release the semaphore once per death they queue
+        env.locks.deaths.acquire()
+        with env.locks.header:
+            death = env.death_queue.pop()
+
+        if death is not None:
+            start = perf_counter()
+            reap_individual(env, *death)
+            env.stats.time(REAP, perf_counter() - start)
+
+def reap_individual(env: EnvState, slot_id: int, tag: int):
+    """Silent cleanup of a process queued as dead in shared memory."""
+    # The slot was deleted and handed to a new individual since the death was queued
+    if tag != env.tags[slot_id]:
         return
-    
-    if client_socket.recv(1024).decode().strip() in IndividualType:
-        # Send memory and semaphore names to the joined individual
-        client_socket.send(f"{env.memory.name} {env.sem.name}".encode())
-
-    client_socket.shutdown(SHUT_RDWR)
-    client_socket.close()
-
-def cleanup_dead_individuals(env: EnvState):
-    """Silent cleanup of processes marked as dead in shared memory."""
-    for processes_dict in [env.preys_processes, env.predators_processes]:
-        for slot_id in list(processes_dict.keys()):
-            offset = 5 + (slot_id * 8)
-            with env.sem:
-                env.mapfile.seek(offset)
-                data = env.mapfile.read(8)
-            type_code, _ = struct.unpack("=Bi3x", data)
-
-            if type_code != 0:
-                continue
-            
-            # Happy path: the individual died, we must clean them up
-            # Kill process and remove it from dict of processes
-            proc = processes_dict.pop(slot_id)
-            if proc.is_alive():
-                proc.terminate()
-            proc.join()
-            proc.close()
-
-            # Zero out the slot and return the ID
-            with env.sem:
-                env.mapfile.seek(offset)
-                env.mapfile.write(b'\x00' * 8)
-            env.return_id(slot_id)
-            
-            print(f"deleted indv if {slot_id}, type_code: {type_code}")
-            
-    with env.sem:
-        env.mapfile.seek(0)
-        env.mapfile.write(struct.pack("B", 0))
-
-def grass(env: EnvState):
+
+    type_code, _, _ = env.locks.read_slot(slot_id)
+
+    if type_code != 0:
+        return
+    # The slot may have been deleted since the death was queued
+    with env.processes_lock:
+        processes_dict = env.preys_processes if slot_id in env.preys_processes else env.predators_processes
+        proc = processes_dict.pop(slot_id, None)
+    if proc is None:
+        return
+
+    # Happy path: the individual died, we must clean them up
+    # Kill process and remove it from dict of processes
+    if proc.is_alive():
+        proc.terminate()
+    close_process(proc)
+
+    # Zero out the slot and return the ID
+    free_slot(env, slot_id)
+    env.stats.count(REAPED)
+    env.population.deaths += 1
+
+    print(f"deleted indv if {slot_id}, type_code: {type_code}")
+
+def individual_exited(env: EnvState, slot_id: int, process: Process, exit_code: int | None):
+    """Called by the supervisor whenever an individual process exits. Deaths are left to the reaper, deletes to their
+    command, anything else crashed or was killed from outside and its slot is freed here."""
+    processes_dict = env.preys_processes if slot_id in env.preys_processes else env.predators_processes
+    if processes_dict.get(slot_id) is not process:
+        return
+    # A clean exit follows a death, unless the exit code is unknown, then a dead individual's slot tells
+    if exit_code == 0:
+        return
+    type_code, _, _ = env.locks.read_slot(slot_id)
+    if exit_code is None and type_code == 0:
+        return
+
+    # The reaper may have got it meanwhile, after a death queued right before the crash
+    with env.processes_lock:
+        if processes_dict.get(slot_id) is not process:
+            return
+        del processes_dict[slot_id]
+    close_process(process)
+    free_slot(env, slot_id)
+    env.stats.count(CRASHES)
+
+    print(f"individual {slot_id} exited with code {exit_code}, slot freed")
+
+def grass(env: EnvState, _):
+    env.scheduler.schedule(randint(MIN_GRASS_WAIT, MAX_GRASS_WAIT), grass)
+    # The env only flushes its stats when a command or a grass wakes it up
+    env.stats.maybe_flush()
+
+    # Check if a drought episode is occuring
+    # Acquiring the lock before reading would prevent a TOCTOU, but it wouldn't be an issue regardless
+    if env.drought_remaining > 0:
+        with env.drought_lock:
+            env.drought_remaining -= 1
+        return
+
+    # Every cell grows one, a region at a time so individuals elsewhere keep eating
+    if env.grid is not None:
+        for region, sem in enumerate(env.locks.regions):
+            with sem:
+                env.stats.count(GRASS_GROWN, env.grid.grow_grass(region))
+        return
+
+    # Add one grass (stonks)
+    with env.locks.header:
+        current_grass = env.arena.header.grass
+
+        if current_grass < GRASS_LIMIT:
+            env.arena.header.grass = current_grass + 1
+            env.stats.count(GRASS_GROWN)
+
+def births(env: EnvState, _):
+    """Start the offsprings requested since the last batch, in free slots only: births never grow the world, so its
+    capacity caps the population and requests past it are dropped."""
+    env.scheduler.schedule(BIRTH_INTERVAL, births)
+    with env.locks.header:
+        requests = env.birth_queue.drain()
+    if not requests:
+        return
+
+    if not env.scheduler.acquire(env.population_lock):
+        return
+    try:
+        offsprings = []
+        for type_code in requests:
+            slot_id = env.get_free_id(grow=False)
+            if slot_id is None:
+                break
+            offsprings.append((type_code, slot_id))
+        start_individuals(env, offsprings)
+    finally:
+        env.population_lock.release()
+    env.stats.count(BIRTHS, len(offsprings))
+    env.population.births += len(offsprings)
+
+def shit_happens(env: EnvState, _):
+    env.scheduler.schedule(SHIT_HAPPENS_INTERVAL, shit_happens)
+    with env.drought_lock:
+        env.drought_remaining = SHIT_HAPPENS_DURATION
+    env.last_drought = env.scheduler.now()
+
+def census(env: EnvState, _):
+    env.scheduler.schedule(POPULATION_INTERVAL, census)
+    if not env.shards:
+        env.population.update(env.scheduler.now(), population_census(env))
+        return
+    # Shards answer in order, so their requests can't interleave with a command's
+    if not env.scheduler.acquire(env.population_lock):
+        return
+    try:
+        env.population.update(env.scheduler.now(), population_census(env))
+    finally:
+        env.population_lock.release()
+
+def vector_tick(env: EnvState, _):
+    env.scheduler.schedule(VECTOR_TICK, vector_tick)
+
+    # Grass is still grown by its own event, the engine only consumes it
+    with env.locks.all():
+        env.arena.header.grass = env.engine.step(env.arena.header.grass)
+        env.publish()
+
+def recorder(env: EnvState, interval: float):
     while True:
-        sleep(randint(MIN_GRASS_WAIT, MAX_GRASS_WAIT))
-        
-        # Check if a drought episode is occuring
-        # Acquiring the lock before reading would prevent a TOCTOU, but it wouldn't be an issue regardless
-        if env.drought_remaining > 0:
-            with env.drought_lock:
-                env.drought_remaining -= 1
-            continue
-        
-        # Add one grass (stonks)
-        with env.sem:
-            env.mapfile.seek(0)
-            event, current_grass = struct.unpack("=Bi", env.mapfile.read(5))
-            
-            if current_grass < GRASS_LIMIT:
-                env.mapfile.seek(1)
-                env.mapfile.write(struct.pack("i", current_grass + 1))
-                
-        # If and event happen, process it
-        if event == 1:
-            cleanup_dead_individuals(env)
-
-    return
-
-
-def main():
+        sleep(interval)
+
+        # Holding the recorder's lock makes closing it on exit wait until our view into the arena is gone
+        with env.recorder.lock:
+            if env.recorder.closed:
+                return
+            # No world lock, slots are read in one go and a torn one only skews a single sample
+            slots = env.arena_slots()
+            current_grass = env.grid.total_grass() if env.grid is not None else env.arena.header.grass
+            env.recorder.append(time(), current_grass, slots["type"], slots["energy"])
+            del slots
+
+
+def main(engine: str = "process", population_limit: int = POPULATION_LIMIT, hosts: int = 0,
+         spawn_pool: int = SPAWN_POOL_SIZE, record: str | None = None, record_interval: float = RECORD_INTERVAL,
+         grid: tuple[int, int] | None = None, shards: int | list[str] = SHARDS, instance: Instance | None = None):
     # Catch SIG_INT as display handles it. This file is not meant to be executed anyway, hence the shebang.
     signal.signal(signal.SIGINT, signal.SIG_IGN)
     
-    # Do not even need to collect the object
-    EnvState()
+    # Keep the main thread until the parser exits: once it returns, multiprocessing joins every child process it
+    # knows of, including ones the env closes later on
+    env = EnvState(engine, population_limit, hosts, spawn_pool, record, record_interval, grid, shards, instance)
+    env.parser_thread.join()
@@ -0,0 +1,180 @@
+#!/usr/bin/env false
+import struct
+from collections.abc import Iterator
+from random import randrange
+
+import numpy as np
+import posix_ipc
+
+from arena import (Arena, INT, GRID_CELL_OFFSET, GRID_NEXT_OFFSET, GRID_PREV_OFFSET, ROW_SIZE, close_mapping, map_file,
+                   row_offset)
+
+# Header: width, height and region size, in cells
+HEADER_FORMAT = "=iii"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# Cell, row by row: grass (i), then the first slot of the cell's list plus one (i, 0 when nobody stands there)
+CELL_SIZE = 8
+CELL_HEAD_OFFSET = 4
+CELL_DTYPE = np.dtype([("grass", "<i4"), ("head", "<i4")])
+
+# Grass grows back up to this in every cell
+CELL_GRASS_LIMIT = 3
+# Cells per side of a lock region, more on big grids so there are never more than MAX_REGIONS_PER_SIDE² semaphores
+REGION_SIZE = 8
+MAX_REGIONS_PER_SIDE = 16
+
+# Grid fields of every row, for wiping them in one go
+ROW_GRID_DTYPE = np.dtype({"names": ["cell", "next", "prev"], "formats": ["<i4"] * 3,
+                           "offsets": [GRID_CELL_OFFSET, GRID_NEXT_OFFSET, GRID_PREV_OFFSET], "itemsize": ROW_SIZE})
+
+
+class Grid:
+    """
+    A torus of cells, each with its own grass and the list of individuals standing on it. The lists are linked through
+    the arena's rows, so moving is O(1) and a predator only walks the cells around it to find prey. Cells are locked by
+    square regions (WorldLocks.regions): callers hold the region of every cell they read or change, and refresh the
+    arena beforehand like for any row access.
+    """
+
+    def __init__(self, name: str, arena: Arena, size: tuple[int, int] | None = None):
+        # Given a size, create the segment, otherwise attach to the env's
+        self.name: str = name
+        self.arena = arena
+        self.memory = posix_ipc.SharedMemory(name, posix_ipc.O_CREAT if size is not None else 0)
+        if size is not None:
+            width, height = size
+            region_size = max(REGION_SIZE, -(-max(width, height) // MAX_REGIONS_PER_SIDE))
+            self.mapfile = map_file(self.memory.fd, HEADER_SIZE + width * height * CELL_SIZE, fresh=True)
+        else:
+            self.mapfile = map_file(self.memory.fd)
+        self.memory.close_fd()
+        if size is not None:
+            self.mapfile[:HEADER_SIZE] = struct.pack(HEADER_FORMAT, width, height, region_size)
+        self.width, self.height, self.region_size = struct.unpack(HEADER_FORMAT, self.mapfile[:HEADER_SIZE])
+
+        self.regions_x: int = -(-self.width // self.region_size)
+        self.regions_y: int = -(-self.height // self.region_size)
+        self.region_count: int = self.regions_x * self.regions_y
+
+        # Zero-copy view of the grass, as height rows of width cells
+        cells = np.frombuffer(self.mapfile, CELL_DTYPE, count=self.width * self.height, offset=HEADER_SIZE)
+        self.grass: np.ndarray = cells["grass"].reshape(self.height, self.width)
+        if size is not None:
+            self.grass[:] = CELL_GRASS_LIMIT
+
+    def cell(self, x: int, y: int) -> int:
+        return (y % self.height) * self.width + (x % self.width)
+
+    def random_cell(self) -> int:
+        return randrange(self.width * self.height)
+
+    def step(self, cell: int, dx: int, dy: int) -> int:
+        y, x = divmod(cell, self.width)
+        return self.cell(x + dx, y + dy)
+
+    def neighbourhood(self, cell: int) -> list[int]:
+        """The cell and the 8 around it, fewer on grids too small to have that many."""
+        return list(dict.fromkeys(self.step(cell, dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)))
+
+    def region(self, cell: int) -> int:
+        y, x = divmod(cell, self.width)
+        return (y // self.region_size) * self.regions_x + x // self.region_size
+
+    def regions(self, *cells: int) -> list[int]:
+        """Regions of the given cells, in locking order."""
+        return sorted({self.region(cell) for cell in cells})
+
+    def region_cells(self, region: int) -> tuple[slice, slice]:
+        """Rows and columns of a region in the grass view."""
+        ry, rx = divmod(region, self.regions_x)
+        return (slice(ry * self.region_size, (ry + 1) * self.region_size),
+                slice(rx * self.region_size, (rx + 1) * self.region_size))
+
+    def cell_of(self, slot_id: int) -> int | None:
+        cell = self.arena.read(row_offset(slot_id) + GRID_CELL_OFFSET)
+        return cell - 1 if cell else None
+
+    def residents(self, cell: int) -> Iterator[int]:
+        """Slot IDs standing on a cell, most recent arrival first."""
+        entry = self._read(HEADER_SIZE + cell * CELL_SIZE + CELL_HEAD_OFFSET)
+        while entry:
+            yield entry - 1
+            entry = self.arena.read(row_offset(entry - 1) + GRID_NEXT_OFFSET)
+
+    def place(self, slot_id: int, cell: int):
+        """Put a slot standing nowhere at the head of a cell's list."""
+        head_offset = HEADER_SIZE + cell * CELL_SIZE + CELL_HEAD_OFFSET
+        head = self._read(head_offset)
+        offset = row_offset(slot_id)
+        self.arena.write(offset + GRID_CELL_OFFSET, cell + 1)
+        self.arena.write(offset + GRID_NEXT_OFFSET, head)
+        self.arena.write(offset + GRID_PREV_OFFSET, 0)
+        if head:
+            self.arena.write(row_offset(head - 1) + GRID_PREV_OFFSET, slot_id + 1)
+        self._write(head_offset, slot_id + 1)
+
+    def remove(self, slot_id: int):
+        """Take a slot out of its cell's list, it then stands nowhere."""
+        offset = row_offset(slot_id)
+        cell = self.arena.read(offset + GRID_CELL_OFFSET) - 1
+        following = self.arena.read(offset + GRID_NEXT_OFFSET)
+        previous = self.arena.read(offset + GRID_PREV_OFFSET)
+
+        if previous:
+            self.arena.write(row_offset(previous - 1) + GRID_NEXT_OFFSET, following)
+        else:
+            self._write(HEADER_SIZE + cell * CELL_SIZE + CELL_HEAD_OFFSET, following)
+        if following:
+            self.arena.write(row_offset(following - 1) + GRID_PREV_OFFSET, previous)
+        self.arena.mapfile[offset + GRID_CELL_OFFSET:offset + GRID_PREV_OFFSET + 4] = bytes(12)
+
+    def take_grass(self, cell: int) -> bool:
+        """Eat one grass of a cell, if there is any left."""
+        offset = HEADER_SIZE + cell * CELL_SIZE
+        grass = self._read(offset)
+        if grass <= 0:
+            return False
+        self._write(offset, grass - 1)
+        return True
+
+    def grow_grass(self, region: int) -> int:
+        """One more grass in every cell of a region, up to CELL_GRASS_LIMIT. Returns how many cells grew."""
+        cells = self.grass[self.region_cells(region)]
+        grown = int(np.count_nonzero(cells < CELL_GRASS_LIMIT))
+        np.minimum(cells + 1, CELL_GRASS_LIMIT, out=cells)
+        return grown
+
+    def total_grass(self) -> int:
+        return int(self.grass.sum())
+
+    def clear(self):
+        """Empty every cell and regrow its grass, nobody stands anywhere afterwards. Env only, holding every lock."""
+        cells = np.frombuffer(self.mapfile, CELL_DTYPE, count=self.width * self.height, offset=HEADER_SIZE)
+        cells["head"] = 0
+        cells["grass"] = CELL_GRASS_LIMIT
+        rows = np.frombuffer(self.arena.mapfile, ROW_GRID_DTYPE, count=self.arena.capacity, offset=row_offset(0))
+        rows["cell"] = rows["next"] = rows["prev"] = 0
+
+    def _read(self, offset: int) -> int:
+        return INT.unpack_from(self.mapfile, offset)[0]
+
+    def _write(self, offset: int, value: int):
+        INT.pack_into(self.mapfile, offset, value)
+
+    def close(self):
+        close_mapping(self, "grass")
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+def leave(world, slot_id: int):
+    """Take a slot off the grid, holding its region. world is an individual's World or the env, with a grid and locks.
+    Only the individual itself moves, so it must be dead or stopped by then."""
+    world.arena.refresh()
+    cell = world.grid.cell_of(slot_id)
+    if cell is None:
+        return
+    with world.locks.regions_of(world.grid.region(cell)):
+        if world.grid.cell_of(slot_id) == cell:
+            world.grid.remove(slot_id)
@@ -0,0 +1,65 @@
+#!/usr/bin/env false
+import asyncio
+import struct
+from socket import socket, AF_INET, AF_UNIX, SOCK_STREAM
+
+# Where individuals join the simulation, shared by the env's join server and join_simulation
+LISTEN_ADDRESS = "127.0.0.1"
+LISTEN_PORT = 15789
+JOIN_SOCKET = "/tmp/circle_of_life_join.sock"
+JOIN_TIMEOUT = 10
+
+# Every message is a single frame: its length (I, network order) then that many bytes of UTF-8
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME = 4096
+
+
+def connect(join_socket: str = JOIN_SOCKET, port: int = LISTEN_PORT) -> socket:
+    """Connect to the join server, through its Unix socket if there is one, or over TCP."""
+    try:
+        client_socket = socket(AF_UNIX, SOCK_STREAM)
+        client_socket.settimeout(JOIN_TIMEOUT)
+        try:
+            client_socket.connect(join_socket)
+            return client_socket
+        except OSError:
+            client_socket.close()
+    except (AttributeError, OSError):
+        # No Unix sockets on this platform
+        pass
+
+    client_socket = socket(AF_INET, SOCK_STREAM)
+    client_socket.settimeout(JOIN_TIMEOUT)
+    try:
+        client_socket.connect((LISTEN_ADDRESS, port))
+    except OSError:
+        client_socket.close()
+        raise
+    return client_socket
+
+def send_frame(client_socket: socket, message: str):
+    payload = message.encode("utf-8")
+    client_socket.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+def recv_frame(client_socket: socket) -> str:
+    (length,) = FRAME_HEADER.unpack(_recv_exactly(client_socket, FRAME_HEADER.size))
+    return _recv_exactly(client_socket, length).decode("utf-8")
+
+def _recv_exactly(client_socket: socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = client_socket.recv(size - len(data))
+        if not chunk:
+            raise ConnectionResetError("join server closed the connection")
+        data += chunk
+    return data
+
+async def read_frame(reader: asyncio.StreamReader, max_frame: int = MAX_FRAME) -> str:
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    if length > max_frame:
+        raise ValueError(f"frame of {length} bytes")
+    return (await reader.readexactly(length)).decode("utf-8")
+
+def write_frame(writer: asyncio.StreamWriter, message: str):
+    payload = message.encode("utf-8")
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
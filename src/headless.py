@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+from collections.abc import Iterator
+
+import numpy as np
+
+from CONSTS import (
+    GRASS_LIMIT, MIN_GRASS_WAIT, MAX_GRASS_WAIT, POPULATION_LIMIT, SHIT_HAPPENS_INTERVAL, SHIT_HAPPENS_DURATION,
+)
+from recorder import Recorder
+from vector_engine import VectorEngine, PREY, PREDATOR
+
+TYPE_CODES = {"prey": PREY, "predator": PREDATOR}
+
+
+class HeadlessWorld:
+    """The vector engine plus the env's grass and droughts, all driven by a logical clock and a single seeded RNG.
+
+    One tick is one second of the live simulation, so ticks can be compared with the display's timings."""
+
+    def __init__(self, seed: int, capacity: int = POPULATION_LIMIT):
+        self.rng: np.random.Generator = np.random.default_rng(seed)
+        self.engine = VectorEngine(capacity, self.rng)
+        self.tick: int = 0
+        self.grass: int = GRASS_LIMIT
+        # Ticks left before the grass event fires, and grass growths skipped by the current drought
+        self.grass_wait: int = self._grass_wait()
+        self.drought_remaining: int = 0
+        # Tick the last drought started, None before the first
+        self.last_drought: int | None = None
+
+    def _grass_wait(self) -> int:
+        return int(self.rng.integers(MIN_GRASS_WAIT, MAX_GRASS_WAIT + 1))
+
+    def add(self, type_code: int, count: int) -> int:
+        self.reserve(count)
+        return self.engine.spawn(type_code, count)
+
+    def delete(self, type_code: int, count: int) -> int:
+        return self.engine.kill(type_code, count)
+
+    def reserve(self, count: int):
+        """Double the engine until count more individuals fit, like the env's arena."""
+        capacity = self.engine.capacity
+        needed = int(np.count_nonzero(self.engine.alive)) + count
+        while capacity < needed:
+            capacity *= 2
+        if capacity != self.engine.capacity:
+            self.engine.grow(capacity)
+
+    def step(self):
+        self.tick += 1
+
+        # The env's drought event, every SHIT_HAPPENS_INTERVAL seconds
+        if self.tick % SHIT_HAPPENS_INTERVAL == 0:
+            self.drought_remaining = SHIT_HAPPENS_DURATION
+            self.last_drought = self.tick
+
+        # Grass event
+        self.grass_wait -= 1
+        if self.grass_wait <= 0:
+            self.grass_wait = self._grass_wait()
+            if self.drought_remaining > 0:
+                self.drought_remaining -= 1
+            elif self.grass < GRASS_LIMIT:
+                self.grass += 1
+
+        # Every individual could give birth this tick
+        self.reserve(int(np.count_nonzero(self.engine.alive)))
+        self.grass = self.engine.step(self.grass)
+
+    def extinct(self) -> bool:
+        return not self.engine.alive.any()
+
+
+def read_script(path: str) -> dict[int, list[tuple[str, int, int]]]:
+    """Parse lines like "<tick> add prey 10" or "<tick> delete predator 2". Blank lines and # comments are skipped."""
+    script: dict[int, list[tuple[str, int, int]]] = {}
+    with open(path) as script_file:
+        for line_number, line in enumerate(script_file, 1):
+            words = line.split("#", 1)[0].split()
+            if not words:
+                continue
+            try:
+                tick, action, target, count = words
+                if action not in ("add", "delete") or target not in TYPE_CODES:
+                    raise ValueError
+                script.setdefault(int(tick), []).append((action, TYPE_CODES[target], int(count)))
+            except ValueError:
+                raise SystemExit(f"{path}:{line_number}: expected '<tick> add|delete prey|predator <count>'")
+    return script
+
+
+def run(seed: int, ticks: int, preys: int = 0, predators: int = 0,
+        script: dict[int, list[tuple[str, int, int]]] | None = None, every: int = 1,
+        capacity: int = POPULATION_LIMIT, recorder: Recorder | None = None) -> Iterator[tuple[int, int, int, int]]:
+    """Yield (tick, preys, predators, grass) every few ticks, until the last tick or extinction. The same samples go
+    to recorder if given, timestamped with their tick."""
+    world = HeadlessWorld(seed, capacity)
+    script = script or {}
+    world.add(PREY, preys)
+    world.add(PREDATOR, predators)
+
+    while True:
+        for action, type_code, count in script.get(world.tick, ()):
+            if action == "add":
+                world.add(type_code, count)
+            else:
+                world.delete(type_code, count)
+
+        done = world.tick >= ticks or (world.extinct() and max(script, default=-1) <= world.tick)
+        if world.tick % every == 0 or done:
+            if recorder is not None:
+                recorder.append(world.tick, world.grass, world.engine.types, world.engine.energy)
+            yield world.tick, world.engine.count(PREY), world.engine.count(PREDATOR), world.grass
+        if done:
+            return
+        world.step()
+
+
+def main():
+    arg_parser = ArgumentParser(description="Run the simulation without display, as fast as possible and reproducibly")
+    arg_parser.add_argument("--seed", type=int, default=0, help="seed of the only RNG, same seed same output")
+    arg_parser.add_argument("--ticks", type=int, default=3600, help="stop after this many ticks (seconds)")
+    arg_parser.add_argument("--preys", type=int, default=0, help="preys at tick 0")
+    arg_parser.add_argument("--predators", type=int, default=0, help="predators at tick 0")
+    arg_parser.add_argument("--script", help="file of '<tick> add|delete prey|predator <count>' lines")
+    arg_parser.add_argument("--every", type=int, default=1, help="print one line every this many ticks")
+    arg_parser.add_argument("--population-limit", type=int, default=POPULATION_LIMIT,
+                            help="initial number of slots, doubled when they run out")
+    arg_parser.add_argument("--record", metavar="PATH", help="also write the printed samples to this time series file")
+    args = arg_parser.parse_args()
+
+    script = read_script(args.script) if args.script else None
+    recorder = Recorder(args.record) if args.record else None
+    print("tick,preys,predators,grass")
+    try:
+        for row in run(args.seed, args.ticks, args.preys, args.predators, script, max(args.every, 1),
+                       args.population_limit, recorder):
+            print(*row, sep=",")
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env false
+import asyncio
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import Connection
+from threading import Lock
+
+from individual import IndividualType, Individual, World, join_simulation, enter, live
+from instance import Instance
+
+
+class IndividualHost:
+    """Env side of a worker process running many individuals as asyncio tasks."""
+
+    def __init__(self, instance: Instance):
+        self.conn, child_conn = Pipe()
+        # The parser and grass threads may both talk to the host
+        self.conn_lock = Lock()
+        self.load: int = 0
+        self.process = Process(target=main, args=(child_conn, instance))
+        self.process.start()
+
+    def spawn(self, individual_type: IndividualType, individual_id: int) -> "HostedIndividual":
+        self._send(("spawn", individual_type, individual_id))
+        self.load += 1
+        return HostedIndividual(self, individual_id)
+
+    def spawn_many(self, individuals: list[tuple[IndividualType, int]]) -> list["HostedIndividual"]:
+        """Start many individuals with a single message."""
+        self._send(("spawn_many", individuals))
+        self.load += len(individuals)
+        return [HostedIndividual(self, individual_id) for _, individual_id in individuals]
+
+    def wake(self, individual_ids: list[int]):
+        """Let individuals due for an update run it, with a single message."""
+        self._send(("wake", individual_ids))
+
+    def kill(self, individual_id: int):
+        self._send(("kill", individual_id))
+        self.load -= 1
+
+    def sync(self):
+        """Wait until the host went through every command sent so far."""
+        with self.conn_lock:
+            self.conn.send(("sync",))
+            self.conn.recv()
+
+    def stop(self):
+        # Not closed: hosts exist when the env's main thread returns, and multiprocessing joins them on its way out
+        self.process.terminate()
+        self.process.join()
+
+    def _send(self, command: tuple):
+        with self.conn_lock:
+            self.conn.send(command)
+
+
+class HostedIndividual:
+    """Stands for an individual's Process in the env's dicts, so deleting and cleaning up work the same way."""
+
+    def __init__(self, host: IndividualHost, individual_id: int):
+        self.host = host
+        self.individual_id = individual_id
+        self.killed = False
+
+    def is_alive(self) -> bool:
+        return not self.killed
+
+    @property
+    def exitcode(self) -> int | None:
+        return 0 if self.killed else None
+
+    def terminate(self):
+        if not self.killed:
+            self.host.kill(self.individual_id)
+            self.killed = True
+
+    def join(self, timeout: float | None = None):
+        pass
+
+    def close(self):
+        pass
+
+
+async def run_individual(individual_type: IndividualType, individual_id: int, world: World, wakeup: asyncio.Event):
+    # Same loop as individual.run, yielding to the other individuals while waiting
+    individual = Individual(individual_type)
+    enter(individual, individual_id, world)
+
+    while live(individual, individual_id, world):
+        await wakeup.wait()
+        wakeup.clear()
+
+async def serve(conn: Connection, world: World):
+    loop = asyncio.get_running_loop()
+    tasks: dict[int, asyncio.Task] = {}
+    wakeups: dict[int, asyncio.Event] = {}
+    closed = loop.create_future()
+
+    def start(individual_type: IndividualType, individual_id: int):
+        wakeups[individual_id] = asyncio.Event()
+        tasks[individual_id] = loop.create_task(run_individual(individual_type, individual_id, world,
+                                                               wakeups[individual_id]))
+
+    def on_command():
+        try:
+            command = conn.recv()
+        except EOFError:
+            # The env is gone
+            loop.remove_reader(conn.fileno())
+            closed.set_result(None)
+            return
+
+        if command[0] == "spawn":
+            _, individual_type, individual_id = command
+            start(individual_type, individual_id)
+        elif command[0] == "spawn_many":
+            for individual_type, individual_id in command[1]:
+                start(individual_type, individual_id)
+        elif command[0] == "wake":
+            for individual_id in command[1]:
+                if individual_id in wakeups:
+                    wakeups[individual_id].set()
+        elif command[0] == "kill":
+            task = tasks.pop(command[1], None)
+            wakeups.pop(command[1], None)
+            if task is not None:
+                task.cancel()
+        elif command[0] == "sync":
+            conn.send("synced")
+
+    loop.add_reader(conn.fileno(), on_command)
+    await closed
+
+def main(conn: Connection, instance: Instance):
+    # A single handshake for all the individuals this host will run
+    joined = join_simulation(IndividualType.PREY, instance=instance)
+    if joined is None:
+        return
+
+    world = World(*joined, role="host", profile_dir=instance.profile_dir)
+    asyncio.run(serve(conn, world))
+    world.profiler.stop()
@@ -1,32 +1,37 @@
 #!/usr/bin/env python3
-import mmap
-import struct
+import sys
 from enum import Enum
+from multiprocessing.connection import Connection
 from random import randint
-from socket import socket, AF_INET, SOCK_STREAM
-from time import sleep
-
-import posix_ipc
+from time import perf_counter
 
+from arena import Arena
+from birth_queue import BirthQueue
 from CONSTS import *
+from death_queue import DeathQueue
+from grid import Grid, leave
+from handshake import connect, recv_frame, send_frame
+from instance import Instance
+from locks import WorldLocks
+from prey_index import PreyIndex
+from profiler import PROFILE_DIR, Profiler
+from stats import Stats, CATCHES, DEATHS, GRAZES, HUNTS, UPDATE, UPDATES
 
 MAX_ENERGY = 100
 GRASS_NUTRIENTS = 20
 PREY_NUTRIENTS = 50
 MIN_ENERGY = 0
-HUNGER_THRESHOLD = 50
 SEX_THRESHOLD = 80
 SEX_CHANCE = 5
+# Simulation seconds between two updates, the env's scheduler wakes individuals up
 MIN_WAIT = 2
 MAX_WAIT = 8
 PREY_MIN_ENERGY_LOSS = 1
 PREY_MAX_ENERGY_LOSS = 8
 PREDATOR_MIN_ENERGY_LOSS = 1
 PREDATOR_MAX_ENERGY_LOSS = 3
-
-# I'm unhappy that these two fuckers are duplicates from env_manager.py. They should be centralized!
-LISTEN_ADDRESS = "127.0.0.1"
-LISTEN_PORT = 15789
+# Exit code when we couldn't join, so the env's supervisor frees the slot it handed us
+JOIN_FAILED = 1
 
 class IndividualType(Enum):
     PREY = "prey"
@@ -38,61 +43,161 @@ class Individual:
         self.energy: int = 100
         
         
-def eat(individual: Individual, mapfile, sem, offset) -> int:
+class World:
+    """Shared memory, locks and stats of a simulation, attached once per process however many individuals it runs."""
+
+    def __init__(self, mem: str, locks_prefix: str, stats_name: str, grid_name: str | None = None,
+                 role: str = "individual", profile_dir: str = PROFILE_DIR):
+        self.arena = Arena(mem)
+        self.stats = Stats(stats_name)
+        # In grid mode, individuals stand on cells and only eat around them
+        self.grid: Grid | None = Grid(grid_name, self.arena) if grid_name is not None else None
+        self.locks = WorldLocks(locks_prefix, self.arena, regions=self.grid.region_count if self.grid is not None else 0)
+        self.locks.instrument(self.stats)
+        self.prey_index = PreyIndex(self.arena)
+        self.death_queue = DeathQueue(self.arena)
+        self.birth_queue = BirthQueue(self.arena)
+        # Samples the process while the env's profile switch is on
+        self.profiler = Profiler(role, self.stats.profiling, profile_dir)
+
+def eat(individual: Individual, world: World, individual_id: int) -> int:
+    if world.grid is not None:
+        return eat_nearby(individual, world, individual_id)
+
+    arena, locks, prey_index = world.arena, world.locks, world.prey_index
+
     if individual.individual_type == IndividualType.PREY:
-        with sem:
-            mapfile.seek(1)
-            current_grass = struct.unpack("=i", mapfile.read(4))[0]
+        with locks.header:
+            current_grass = arena.header.grass
             
             if current_grass <= 0:
                 return individual.energy
             
             # Remove a grass
-            mapfile.seek(1)
-            mapfile.write(struct.pack("i", current_grass - 1))
+            arena.header.grass = current_grass - 1
+        world.stats.count(GRAZES)
             
-            # Update energy
-            mapfile.seek(offset + 1)
-            mapfile.write(struct.pack("i", individual.energy + GRASS_NUTRIENTS))
+        # Update energy
+        with locks.stripe(individual_id):
+            arena.slots.set_energy(individual_id, individual.energy + GRASS_NUTRIENTS)
+            with locks.index:
+                prey_index.update(individual_id)
             
         return individual.energy + GRASS_NUTRIENTS
     else:
-        with sem:
-            # If an event happened but hasn't been processed by env, don't eat
-            mapfile.seek(0)
-            if struct.unpack("=B", mapfile.read(1))[0] != 0:
+        # Claim a catchable prey from the index instead of scanning every slot, this also maps it if the world grew
+        world.stats.count(HUNTS)
+        with locks.index:
+            prey_id = prey_index.claim()
+        if prey_id is None:
+            return individual.energy
+
+        # Both slots are locked so the prey can't change between the check and the kill
+        with locks.slots(individual_id, prey_id):
+            type_code, energy, prey_tag = arena.slots.read(prey_id)
+            # The prey may have eaten or died since it was indexed
+            if type_code != 1 or energy >= HUNGER_THRESHOLD or energy == 0:
                 return individual.energy
 
-            mapfile.seek(offset + 1)
-            
-            for i in range(POPULATION_LIMIT):
-                # Move the cursor to position and read
-                mapfile.seek(5 + (i * 8))
-                data = mapfile.read(8)
-                type_code, energy = struct.unpack("=Bi3x", data)
-
-                if type_code == 1 and energy < HUNGER_THRESHOLD and energy != 0:
-                    mapfile.seek(5 + (i * 8))
-                    mapfile.write(struct.pack("B", 0))
-                    
-                    mapfile.seek(0)
-                    mapfile.write(struct.pack("B", 1))
-                    
-                    return individual.energy + PREY_NUTRIENTS
-        
+            arena.slots.set_type(prey_id, 0)
+            arena.slots.set_energy(individual_id, individual.energy + PREY_NUTRIENTS)
+            # The prey's own updates may have indexed it again since the claim
+            with locks.index:
+                prey_index.update(prey_id)
+
+        # Let the env reap the prey
+        with locks.header:
+            world.death_queue.push(prey_id, prey_tag)
+            arena.header.add_count(1, -1)
+        locks.deaths.release()
+        world.stats.count(CATCHES)
+
+        return individual.energy + PREY_NUTRIENTS
+    
+def eat_nearby(individual: Individual, world: World, individual_id: int) -> int:
+    """Grid mode eat: preys graze their own cell, predators hunt the cells around them, whatever the population."""
+    arena, locks, grid = world.arena, world.locks, world.grid
+    cell = grid.cell_of(individual_id)
+    if cell is None:
         return individual.energy
+
+    if individual.individual_type == IndividualType.PREY:
+        with locks.regions_of(grid.region(cell)):
+            if not grid.take_grass(cell):
+                return individual.energy
+        world.stats.count(GRAZES)
+
+        with locks.stripe(individual_id):
+            arena.slots.set_energy(individual_id, individual.energy + GRASS_NUTRIENTS)
+            with locks.index:
+                world.prey_index.update(individual_id)
+        return individual.energy + GRASS_NUTRIENTS
+
+    world.stats.count(HUNTS)
+    neighbourhood = grid.neighbourhood(cell)
+    # Nobody can step in or out of these cells while we look, and the stripes come after the regions
+    with locks.regions_of(*grid.regions(*neighbourhood)):
+        for prey_id in (slot_id for nearby in neighbourhood for slot_id in grid.residents(nearby)):
+            # Unlocked peek first, most residents are not catchable
+            type_code, energy, _ = arena.slots.read(prey_id)
+            if type_code != 1 or energy >= HUNGER_THRESHOLD or energy == 0:
+                continue
+
+            with locks.slots(individual_id, prey_id):
+                type_code, energy, prey_tag = arena.slots.read(prey_id)
+                if type_code != 1 or energy >= HUNGER_THRESHOLD or energy == 0:
+                    continue
+                arena.slots.set_type(prey_id, 0)
+                arena.slots.set_energy(individual_id, individual.energy + PREY_NUTRIENTS)
+                with locks.index:
+                    world.prey_index.update(prey_id)
+            grid.remove(prey_id)
+            break
+        else:
+            return individual.energy
+
+    # Let the env reap the prey
+    with locks.header:
+        world.death_queue.push(prey_id, prey_tag)
+        arena.header.add_count(1, -1)
+    locks.deaths.release()
+    world.stats.count(CATCHES)
+
+    return individual.energy + PREY_NUTRIENTS
+
+def wander(world: World, individual_id: int):
+    """Grid mode: step to one of the 8 cells around, or stay."""
+    grid = world.grid
+    cell = grid.cell_of(individual_id)
+    if cell is None:
+        return
+    destination = grid.step(cell, randint(-1, 1), randint(-1, 1))
+    if destination == cell:
+        return
+
+    with world.locks.regions_of(*grid.regions(cell, destination)):
+        # A predator may have caught us meanwhile
+        if grid.cell_of(individual_id) != cell:
+            return
+        grid.remove(individual_id)
+        grid.place(individual_id, destination)
     
-def reproduce():
-    pass
+def reproduce(individual: Individual, world: World):
+    """Ask the env for an offspring of our type. The request is only queued, the env starts offsprings in bulk."""
+    type_code = 1 if individual.individual_type == IndividualType.PREY else 2
+    with world.locks.header:
+        world.birth_queue.push(type_code)
         
         
-def join_simulation(individual_type: IndividualType, verbose: bool = False) -> tuple[str, ...] | None:
+def join_simulation(individual_type: IndividualType, verbose: bool = False, count: int = 1,
+                    instance: Instance | None = None) -> tuple[str, ...] | None:
+    """Get the names of the simulation's shared memories, registering count individuals of a type at once."""
+    instance = instance or Instance()
     try:
-        with socket(AF_INET, SOCK_STREAM) as client_socket:
-            client_socket.settimeout(10)
-            client_socket.connect((LISTEN_ADDRESS, LISTEN_PORT))
-            client_socket.send(bytes(individual_type.value, "utf-8"))
-            return tuple(client_socket.recv(1024).decode().strip().split())
+        with connect(instance.join_socket, instance.port) as client_socket:
+            send_frame(client_socket, f"{individual_type.value} {count}")
+            # An empty reply means we were turned down
+            return tuple(recv_frame(client_socket).split()) or None
 
     except ConnectionRefusedError:
         if verbose:
@@ -107,72 +212,143 @@ def join_simulation(individual_type: IndividualType, verbose: bool = False) -> t
             print(f"Connection error: {e}")
         return None
 
-def main(individual_type: IndividualType, individual_id: int, verbose: bool = False):
-    individual = Individual(individual_type)
+def enter(individual: Individual, individual_id: int, world: World):
+    # Pooled and hosted processes may have attached before the world grew to include our slot
+    world.arena.refresh()
 
-    # Join the simulation over TCP and get shared memories
-    mem, sem = join_simulation(individual_type, verbose)
+    # Initialise in shared memory (Set Type and Starting Energy), the env already set our slot's tag
+    type_code = 1 if individual.individual_type == IndividualType.PREY else 2
+    with world.locks.stripe(individual_id):
+        saved_type, saved_energy, _ = world.arena.slots.read(individual_id)
+        # A restored checkpoint already holds us, carry on with the saved energy
+        if saved_type == type_code and saved_energy > 0:
+            individual.energy = saved_energy
+        else:
+            world.arena.slots.write(individual_id, type_code, MAX_ENERGY)
+            with world.locks.index:
+                world.prey_index.update(individual_id)
+            with world.locks.header:
+                world.arena.header.add_count(type_code, 1)
+
+    # Land somewhere on the grid, regions come before stripes so only once our slot is set
+    if world.grid is not None and world.grid.cell_of(individual_id) is None:
+        cell = world.grid.random_cell()
+        with world.locks.regions_of(world.grid.region(cell)):
+            world.grid.place(individual_id, cell)
+
+def live(individual: Individual, individual_id: int, world: World, verbose: bool = False) -> bool:
+    """Run one update of the individual, and return whether it is still alive afterwards."""
+    arena, locks, prey_index, stats = world.arena, world.locks, world.prey_index, world.stats
+    start = perf_counter()
+    arena.refresh()
+
+    # By not wrapping everything by the semaphore, we could run into a TOCTOU bug.
+    # Even if we do, it isn't that critical. Reading doesn't take the stripe, only writing does
+    type_code, current_energy, _ = locks.read_slot(individual_id)
+
+    # Eaten, the predator already queued us for reaping
+    if type_code == 0:
+        return False
     
-    # Error or individual_id is None (no slots left)
-    if None in [mem, sem, individual_id]:
-        return
+    if individual.individual_type == IndividualType.PREY:
+        current_energy -= randint(PREY_MIN_ENERGY_LOSS, PREY_MAX_ENERGY_LOSS)
+    else:
+        current_energy -= randint(PREDATOR_MIN_ENERGY_LOSS, PREDATOR_MAX_ENERGY_LOSS)
+    
+    # Handle death
+    if current_energy <= 0:
+        # Mark as dead in shared memory, unless a predator was faster
+        with locks.stripe(individual_id):
+            type_code, _, my_tag = arena.slots.read(individual_id)
+            if type_code == 0:
+                return False
+            arena.slots.write(individual_id, 0, 0)
+            with locks.index:
+                prey_index.update(individual_id)
 
-    # Attach to existing resources
-    memory = posix_ipc.SharedMemory(mem)
-    sem = posix_ipc.Semaphore(sem)
-    mapfile = mmap.mmap(memory.fd, memory.size)
-
-    # Initialise in shared memory (Set Type and Starting Energy)
-    my_offset = 5 + (individual_id * 8)
-    type_code = 1 if individual_type == IndividualType.PREY else 2
-    with sem:
-        mapfile.seek(my_offset)
-        # Pack: B=unsigned char (type), i=integer (energy), 3x=padding
-        mapfile.write(struct.pack("=Bi3x", type_code, MAX_ENERGY))
-
-    while True:        
-        # By not wrapping everything by the semaphore, we could run into a TOCTOU bug.
-        # Even if we do, it isn't that critical.
-        current_energy = 0
-        with sem:
-            mapfile.seek(my_offset + 1)
-            current_energy = struct.unpack("=i", mapfile.read(4))[0]
+        # The reaper terminates us once we are queued, so get off the grid and flush first
+        if world.grid is not None:
+            leave(world, individual_id)
+        stats.count(DEATHS)
+        stats.flush()
+
+        # Let the env reap us
+        with locks.header:
+            world.death_queue.push(individual_id, my_tag)
+            arena.header.add_count(type_code, -1)
+        locks.deaths.release()
         
-        if individual_type == IndividualType.PREY:
-            current_energy -= randint(PREY_MIN_ENERGY_LOSS, PREY_MAX_ENERGY_LOSS)
-        else:
-            current_energy -= randint(PREDATOR_MIN_ENERGY_LOSS, PREDATOR_MAX_ENERGY_LOSS)
+        if verbose:
+            print(f"We just died :(")
+        return False
         
-        # Handle death
-        if current_energy <= 0:
-            # Mark as dead in shared memory
-            with sem:
-                mapfile.seek(0)
-                mapfile.write(struct.pack("B", 1))
-                mapfile.seek(my_offset)
-                mapfile.write(struct.pack("Bi3x", 0, 0))
-            
-            if verbose:
-                print(f"We just died :(")
-            break
-            
-        # Reproduce if horny
-        if current_energy > SEX_THRESHOLD and randint(1, 100) <= 5:
-            reproduce()
-            
-        # Eat if hungry
-        if current_energy <= HUNGER_THRESHOLD:
-            individual.energy = current_energy
-            current_energy = eat(individual, mapfile, sem, my_offset)
-            
-        # Write new energy value
-        with sem:
-            mapfile.seek(my_offset + 1)
-            mapfile.write(struct.pack("i", current_energy))
+    if world.grid is not None:
+        wander(world, individual_id)
+
+    # Reproduce if horny
+    if current_energy > SEX_THRESHOLD and randint(1, 100) <= SEX_CHANCE:
+        reproduce(individual, world)
+        
+    # Eat if hungry
+    if current_energy <= HUNGER_THRESHOLD:
         individual.energy = current_energy
+        current_energy = eat(individual, world, individual_id)
         
-        # Finally, wait until the next update
-        sleep(randint(MIN_WAIT, MAX_WAIT))
+    # Write new energy value
+    with locks.stripe(individual_id):
+        arena.slots.set_energy(individual_id, current_energy)
+        with locks.index:
+            prey_index.update(individual_id)
+    individual.energy = current_energy
+
+    stats.count(UPDATES)
+    stats.time(UPDATE, perf_counter() - start)
+    stats.maybe_flush()
+    # The env's profile command switches us on here
+    world.profiler.poll()
+    return True
+
+def run(individual_type: IndividualType, individual_id: int, world: World, verbose: bool = False):
+    individual = Individual(individual_type)
+    enter(individual, individual_id, world)
+    wakeup = world.locks.wakeup(individual_id)
+
+    while live(individual, individual_id, world, verbose):
+        # Finally, wait until the env tells us to update again
+        wakeup.acquire()
+    wakeup.close()
+    world.stats.flush()
+    world.profiler.stop()
+
+def main(individual_type: IndividualType, individual_id: int, verbose: bool = False, instance: Instance | None = None):
+    instance = instance or Instance()
+    # Join the simulation over TCP and get shared memories
+    joined = join_simulation(individual_type, verbose, instance=instance)
+    if joined is None:
+        sys.exit(JOIN_FAILED)
+    # No slots left
+    if individual_id is None:
+        return
+
+    # Attach to existing resources
+    run(individual_type, individual_id, World(*joined, profile_dir=instance.profile_dir), verbose)
+
+def pooled_main(conn: Connection, verbose: bool = False, instance: Instance | None = None):
+    """Join and attach ahead of time, then wait for the env to hand over a type and slot ID."""
+    instance = instance or Instance()
+    joined = join_simulation(IndividualType.PREY, verbose, instance=instance)
+    if joined is None:
+        # The env may have handed us a slot already, or will, and learns from the exit code that it's free again
+        sys.exit(JOIN_FAILED)
+    world = World(*joined, profile_dir=instance.profile_dir)
+
+    try:
+        individual_type, individual_id = conn.recv()
+    except EOFError:
+        return
+    conn.close()
+
+    run(individual_type, individual_id, world, verbose)
 
 
 if __name__ == "__main__":
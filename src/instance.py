@@ -0,0 +1,40 @@
+#!/usr/bin/env false
+from handshake import JOIN_SOCKET, LISTEN_PORT
+from profiler import PROFILE_DIR
+
+# Local shards of an instance listen from its join port + SHARD_PORT_OFFSET on, 15800 for the default one
+SHARD_PORT_OFFSET = 11
+
+
+class Instance:
+    """
+    Every name the processes of a simulation meet under: the display's message queues, the shared memories and
+    semaphores, the join socket and port, the local shards' ports and the profiles' directory. The default instance
+    keeps the historical names, any other one appends its name to them, so simulations with different names never
+    collide on a host. Processes get the env's instance along with their arguments.
+    """
+
+    def __init__(self, name: str = "", port: int | None = None):
+        suffix = f"_{name}" if name else ""
+        self.name: str = name
+        self.env_send: str = f"/env_send{suffix}"
+        self.env_recv: str = f"/env_recv{suffix}"
+        self.shm: str = f"/circle_of_life_shm{suffix}"
+        self.sem: str = f"/circle_of_life_sem{suffix}" # Prefix of the semaphores in WorldLocks
+        self.stats: str = f"/circle_of_life_stats{suffix}"
+        self.grid: str = f"/circle_of_life_grid{suffix}"
+        self.join_socket: str = JOIN_SOCKET.replace(".sock", f"{suffix}.sock")
+        self.profile_dir: str = f"{PROFILE_DIR}{suffix}"
+        # Join port over TCP, 0 lets the env's join server pick a free one, named instances do unless told otherwise
+        self.port: int = port if port is not None else (0 if name else LISTEN_PORT)
+
+    @property
+    def shard_port(self) -> int:
+        return self.port + SHARD_PORT_OFFSET
+
+
+def instance_name(value: str) -> str:
+    """Parse an --instance value, which ends up in IPC names and paths."""
+    if not value or not all(c.isalnum() or c in "-_" for c in value):
+        raise ValueError(value)
+    return value
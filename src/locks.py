@@ -0,0 +1,134 @@
+#!/usr/bin/env false
+from collections.abc import Callable
+from contextlib import ExitStack, contextmanager
+from typing import TypeVar
+
+import posix_ipc
+
+from arena import Arena
+from CONSTS import LOCK_STRIPES
+from stats import Stats, TimedLock
+
+# Optimistic reads tried before waiting for the stripe like a writer would
+READ_RETRIES = 8
+
+T = TypeVar("T")
+
+
+class SequencedStripe:
+    """
+    A stripe's semaphore, bumping the stripe's sequence number in the arena's header right after taking it and right
+    before letting it go. The number is odd while the stripe is held, and changes whenever a slot of it may have, so
+    readers can skip the semaphore and retry when they see it move (a seqlock).
+    """
+
+    def __init__(self, sem: posix_ipc.Semaphore, arena: Arena, stripe: int):
+        self.sem = sem
+        self.arena = arena
+        self.stripe = stripe
+
+    def acquire(self):
+        self.sem.acquire()
+        self.arena.header.bump(self.stripe)
+
+    def release(self):
+        self.arena.header.bump(self.stripe)
+        self.sem.release()
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def unlink(self):
+        self.sem.unlink()
+
+
+class WorldLocks:
+    """
+    Semaphores guarding the shared memory, one per region instead of a single one for everything.
+    - header: grass value and death queue
+    - index: the prey index
+    - stripe k: every slot whose ID is k modulo LOCK_STRIPES, also sequenced for lock-free reads (read_slot)
+    - region k: in grid mode, the grass and lists of the cells in the grid's k-th region
+    deaths is not a lock but counts the entries of the death queue, for the reaper to block on. Likewise, each slot has
+    a wakeup semaphore the env posts when its individual is due for an update.
+
+    Lock ordering, to avoid deadlocks: regions first and in ascending order, then stripes in ascending order, then the
+    index, then the header. Never acquire a lock while holding one that comes later in this order. A predator eating a
+    prey takes both slots' stripes through slots(), which sorts them, and hunting on the grid takes the regions around
+    the predator through regions_of() before that.
+    """
+
+    def __init__(self, prefix: str, arena: Arena, create: bool = False, regions: int = 0):
+        flags = posix_ipc.O_CREAT if create else 0
+        self.prefix: str = prefix
+        self.arena = arena
+        self.regions = [posix_ipc.Semaphore(f"{prefix}_region_{k}", flags, initial_value=1) for k in range(regions)]
+        self.header = posix_ipc.Semaphore(f"{prefix}_header", flags, initial_value=1)
+        self.index = posix_ipc.Semaphore(f"{prefix}_index", flags, initial_value=1)
+        self.stripes = [SequencedStripe(posix_ipc.Semaphore(f"{prefix}_stripe_{k}", flags, initial_value=1), arena, k)
+                        for k in range(LOCK_STRIPES)]
+        self.deaths = posix_ipc.Semaphore(f"{prefix}_deaths", flags, initial_value=0)
+
+    def instrument(self, stats: Stats):
+        """Record the wait and hold times of the header, index, stripes and regions in stats."""
+        self.regions = [TimedLock(sem, stats) for sem in self.regions]
+        self.header = TimedLock(self.header, stats)
+        self.index = TimedLock(self.index, stats)
+        self.stripes = [TimedLock(sem, stats) for sem in self.stripes]
+
+    def stripe(self, slot_id: int) -> SequencedStripe:
+        return self.stripes[slot_id % LOCK_STRIPES]
+
+    def read_stripe(self, stripe: int, reader: Callable[[], T]) -> T:
+        """Run reader without holding the stripe, again until no writer went through meanwhile, or holding the stripe
+        after READ_RETRIES attempts. reader only reads, and must cope with torn data until it is retried."""
+        header = self.arena.header
+        for _ in range(READ_RETRIES):
+            before = header.sequence(stripe)
+            if before & 1:
+                continue
+            value = reader()
+            if header.sequence(stripe) == before:
+                return value
+        with self.stripes[stripe]:
+            return reader()
+
+    def read_slot(self, slot_id: int) -> tuple[int, int, int]:
+        """Type, energy and tag of a slot, consistent, without taking its stripe."""
+        return self.read_stripe(slot_id % LOCK_STRIPES, lambda: self.arena.slots.read(slot_id))
+
+    @contextmanager
+    def slots(self, *slot_ids: int):
+        """Hold the stripes of every given slot, acquired in ascending order."""
+        with ExitStack() as stack:
+            for k in sorted({slot_id % LOCK_STRIPES for slot_id in slot_ids}):
+                stack.enter_context(self.stripes[k])
+            yield
+
+    @contextmanager
+    def regions_of(self, *regions: int):
+        """Hold the given regions, acquired in ascending order."""
+        with ExitStack() as stack:
+            for k in sorted(set(regions)):
+                stack.enter_context(self.regions[k])
+            yield
+
+    @contextmanager
+    def all(self):
+        """Hold every lock, for bulk operations on the whole world."""
+        with ExitStack() as stack:
+            for sem in self.regions + self.stripes + [self.index, self.header]:
+                stack.enter_context(sem)
+            yield
+
+    def wakeup(self, slot_id: int, create: bool = False) -> posix_ipc.Semaphore:
+        """Semaphore the env's scheduler posts whenever the individual in a slot is due for an update."""
+        return posix_ipc.Semaphore(f"{self.prefix}_wake_{slot_id}", posix_ipc.O_CREAT if create else 0,
+                                   initial_value=0)
+
+    def unlink(self):
+        for sem in self.regions + self.stripes + [self.index, self.header, self.deaths]:
+            sem.unlink()
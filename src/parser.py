@@ -5,17 +5,83 @@ from runtime import *
 ACTION_TOKENS = ["add", "list", "delete"]
 QUIT_TOKENS = ["quit", "exit", "stop"]
 HELP_TOKENS = ["help", "?"]
-TARGET_TOKENS = ["prey", "predator", "all", "gra"] #Not grass because of the strip("s")
+FILE_TOKENS = ["save", "load"] # Followed by a path instead of a target
+SPEED_TOKEN = "speed" # Followed by an optional factor, which may have decimals
+PROFILE_TOKEN = "profile" # Followed by on or off
+TARGET_TOKENS = ["prey", "predator", "all", "gra", "tat", "population"] #Not grass nor stats because of the strip("s")
+QUERY_TOKENS = ["top", "energy", "count"] # After list prey, predator or all, instead of the integer
+QUERY_ARITY = [1, 2, 0]
 
 # Functions corresponding to parsed words' positions
 WORKERS = [
-    [add_preys, add_predators, add_all, add_grass],
-    [list_preys, list_predators, list_all, list_grass],
-    [delete_preys, delete_predators, delete_all, delete_grass],
+    [add_preys, add_predators, add_all, add_grass, add_stats, add_population],
+    [list_preys, list_predators, list_all, list_grass, list_stats, list_population],
+    [delete_preys, delete_predators, delete_all, delete_grass, delete_stats, delete_population],
 ]
 
+FILE_WORKERS = [save_world, load_world]
+
+def parse_query(words: list[str]) -> Query | None:
+    """Parse the words after a list target, like "top 10", "energy 20 50" or "count"."""
+    token = words[0].lower()
+    arity = QUERY_ARITY[QUERY_TOKENS.index(token)]
+    if len(words) != 1 + arity:
+        print(f"***{arity} integer(s) expected after {token}, got {len(words) - 1}")
+        return None
+    for word in words[1:]:
+        if not word.isdigit():
+            print(f"***Integer expected, got {word}")
+            return None
+
+    if token == "top":
+        return Query(top=int(words[1]))
+    if token == "energy":
+        return Query(energy=(int(words[1]), int(words[2])))
+    return Query(count_only=True)
+
 def parse_command(command: str, env):
     words = command.split(" ")
+
+    # Paths keep their case and spaces, so they skip the normal parsing pipeline
+    if words[0].lower() in FILE_TOKENS:
+        path = command.split(" ", 1)[1].strip() if len(words) > 1 else ""
+        if not path:
+            print(f"***Path expected after {words[0]}")
+            return
+        FILE_WORKERS[FILE_TOKENS.index(words[0].lower())](path, env)
+        return
+
+    if words[0].lower() == SPEED_TOKEN:
+        factor = None
+        if len(words) > 2:
+            print("***2 words expected, got more")
+            return
+        if len(words) == 2:
+            try:
+                factor = float(words[1])
+            except ValueError:
+                factor = -1.0
+            if not 0 <= factor < float("inf"):
+                print(f"***Positive number expected, got {words[1]}")
+                return
+        set_speed(factor, env)
+        return
+
+    if words[0].lower() == PROFILE_TOKEN:
+        if len(words) != 2 or words[1].lower() not in ("on", "off"):
+            print("***on or off expected after profile")
+            return
+        set_profiling(words[1].lower() == "on", env)
+        return
+
+    # Queries replace the integer of list commands, the words before them go through the normal pipeline
+    query = None
+    if words[0].lower() == "list" and len(words) > 2 and words[2].lower() in QUERY_TOKENS:
+        query = parse_query(words[2:])
+        if query is None:
+            return
+        words = words[:2]
+
     worker_index = [0, 0]
     command_arg = 1
 
@@ -65,6 +131,13 @@ def parse_command(command: str, env):
             command_arg = int(word)  # Should work, already verified that it is a string
             break  # Not necessary, should be the last word anyway
 
+    # Only individuals are queried, and list ignores the integer anyway
+    if query is not None and worker_index[1] > TARGET_TOKENS.index("all"):
+        print("***Queries only apply to prey, predator and all")
+        return
+    if ACTION_TOKENS[worker_index[0]] == "list":
+        command_arg = query
+
     # Execute parsed command
     WORKERS[worker_index[0]][worker_index[1]](command_arg, env)
     return
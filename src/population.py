@@ -0,0 +1,72 @@
+#!/usr/bin/env false
+# Weight of the latest simulated second in the moving averages, about the last 1 / EMA_WEIGHT seconds matter
+EMA_WEIGHT = 0.1
+# Simulated seconds between two updates of the moving averages
+POPULATION_INTERVAL = 1
+
+
+class Census:
+    """The population at some point: count and energy sums (total, squares) by type code, births and deaths so far,
+    and the simulated seconds since the last drought started, None before the first."""
+
+    def __init__(self, counts: dict[int, int], sums: dict[int, tuple[int, int]], births: int, deaths: int,
+                 drought_age: float | None):
+        self.counts = counts
+        self.sums = sums
+        self.births = births
+        self.deaths = deaths
+        self.drought_age = drought_age
+
+
+class Population:
+    """
+    Streaming statistics of the population, in constant memory. Nothing here reads a slot: energy sums are kept in the
+    arena's header by every slot write, births and deaths are counted as they are served and reaped, and update()
+    folds what changed since its last call into exponential moving averages, every POPULATION_INTERVAL.
+    """
+
+    def __init__(self, now: float):
+        # Offsprings started and deaths reaped by the env, engines and shards count their own
+        self.births: int = 0
+        self.deaths: int = 0
+        self.reset(now, 0, 0)
+
+    def reset(self, now: float, births: int, deaths: int):
+        """Start over from the given totals."""
+        self.started: float = now
+        self.updated: float = now
+        self.first_births: int = births
+        self.first_deaths: int = deaths
+        self.last_births: int = births
+        self.last_deaths: int = deaths
+        # Per simulated second, None until the first update
+        self.birth_rate: float | None = None
+        self.death_rate: float | None = None
+        self.average_counts: dict[int, float] = {}
+
+    def update(self, now: float, census: Census):
+        elapsed = now - self.updated
+        # Paused
+        if elapsed <= 0:
+            return
+
+        # An update coming late weighs as much as the ones it stands for
+        weight = 1 - (1 - EMA_WEIGHT) ** elapsed
+        self.birth_rate = _ema(self.birth_rate, (census.births - self.last_births) / elapsed, weight)
+        self.death_rate = _ema(self.death_rate, (census.deaths - self.last_deaths) / elapsed, weight)
+        for type_code, count in census.counts.items():
+            self.average_counts[type_code] = _ema(self.average_counts.get(type_code), count, weight)
+        self.updated = now
+        self.last_births = census.births
+        self.last_deaths = census.deaths
+
+
+def _ema(average: float | None, value: float, weight: float) -> float:
+    return value if average is None else average + weight * (value - average)
+
+def moments(count: int, total: int, squares: int) -> tuple[float, float] | None:
+    """Mean and variance of count energies from their sum and the sum of their squares, None for nobody."""
+    if count <= 0:
+        return None
+    mean = total / count
+    return mean, max(squares / count - mean * mean, 0.0)
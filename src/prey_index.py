@@ -0,0 +1,57 @@
+#!/usr/bin/env false
+from arena import Arena, INDEX_ENTRY_OFFSET, INDEX_POSITION_OFFSET, row_offset
+from CONSTS import HUNGER_THRESHOLD
+
+
+class PreyIndex:
+    """
+    Set of catchable preys (type 1, energy below HUNGER_THRESHOLD and non-zero), kept in the arena's rows.
+    The count lives in the header, the dense list of slot IDs in the rows' index entries, and each slot's position in
+    that list plus one (0 meaning absent) in its row. Adding, removing and claiming a prey are O(1). Callers must hold
+    the index lock, and the slot's stripe when updating it.
+    """
+
+    def __init__(self, arena: Arena):
+        self.arena = arena
+
+    def update(self, slot_id: int):
+        """Add or remove a slot from the index after its type or energy was written."""
+        self.arena.refresh()
+        type_code, energy, _ = self.arena.slots.read(slot_id)
+        catchable = type_code == 1 and energy < HUNGER_THRESHOLD and energy != 0
+
+        if catchable and self._position(slot_id) == 0:
+            self._add(slot_id)
+        elif not catchable and self._position(slot_id) != 0:
+            self._remove(slot_id)
+
+    def claim(self) -> int | None:
+        """Take a catchable prey out of the index and return its slot ID, or None if there is none."""
+        self.arena.refresh()
+        count = self.arena.header.index_count
+        if count == 0:
+            return None
+
+        slot_id = self.arena.read(row_offset(count - 1) + INDEX_ENTRY_OFFSET)
+        self._remove(slot_id)
+        return slot_id
+
+    def _position(self, slot_id: int) -> int:
+        return self.arena.read(row_offset(slot_id) + INDEX_POSITION_OFFSET)
+
+    def _add(self, slot_id: int):
+        count = self.arena.header.index_count
+        self.arena.write(row_offset(count) + INDEX_ENTRY_OFFSET, slot_id)
+        self.arena.write(row_offset(slot_id) + INDEX_POSITION_OFFSET, count + 1)
+        self.arena.header.index_count = count + 1
+
+    def _remove(self, slot_id: int):
+        # Move the last entry into the removed one's place
+        count = self.arena.header.index_count
+        position = self._position(slot_id) - 1
+        last_id = self.arena.read(row_offset(count - 1) + INDEX_ENTRY_OFFSET)
+
+        self.arena.write(row_offset(position) + INDEX_ENTRY_OFFSET, last_id)
+        self.arena.write(row_offset(last_id) + INDEX_POSITION_OFFSET, position + 1)
+        self.arena.write(row_offset(slot_id) + INDEX_POSITION_OFFSET, 0)
+        self.arena.header.index_count = count - 1
@@ -0,0 +1,124 @@
+#!/usr/bin/env false
+import os
+import sys
+from collections import Counter
+from collections.abc import Callable
+from pathlib import Path
+from threading import Event, Lock, Thread, enumerate as threads, get_ident
+from time import monotonic
+
+# Set to anything but 0 to profile every process from the start, the profile command switches it while running
+PROFILE_VARIABLE = "CIRCLE_PROFILE"
+# Every process writes its samples to <pid>.folded in there, merged into REPORT_NAME on exit. Named instances add
+# their name to it
+PROFILE_DIR = "/tmp/circle_of_life_profile"
+REPORT_NAME = "profile.folded"
+# Seconds between two samples while profiling
+SAMPLE_INTERVAL = 0.01
+# Seconds between two writes while profiling, so a process killed meanwhile loses at most that much
+DUMP_INTERVAL = 1
+
+
+def requested() -> bool:
+    """Whether profiling was asked for through PROFILE_VARIABLE."""
+    return os.environ.get(PROFILE_VARIABLE, "0") not in ("", "0")
+
+
+class Profiler:
+    """
+    Wall clock sampling profiler of a process. A daemon thread reads the stack of every other thread SAMPLE_INTERVAL
+    apart, and counts them folded, "process;thread;outermost frame;...;innermost frame", the format flame graph tools
+    take. It samples while enabled() is true, and writes its counts so far to <directory>/<pid>.folded every
+    DUMP_INTERVAL, when switched off and when stopped.
+
+    The thread only exists while sampling: it starts when created switched on, or at the first poll() after the switch
+    turned on, and ends once it sees it off. Owners poll from loops they run anyway, so the thousands of processes of a
+    simulation that isn't profiled never wake up for it.
+    """
+
+    def __init__(self, name: str, enabled: Callable[[], bool], directory: str = PROFILE_DIR):
+        self.name: str = name
+        self.enabled = enabled
+        self.directory: str = directory
+        self.samples: Counter[str] = Counter()
+        self.stopped = Event()
+        self.thread: Thread | None = None
+        self.thread_lock = Lock()
+        self.poll()
+
+    def poll(self):
+        """Start sampling if switched on and not sampling already. Cheap enough for every update of an individual."""
+        if self.stopped.is_set() or not self.enabled():
+            return
+        with self.thread_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = Thread(target=self._run, name="profiler", daemon=True)
+                self.thread.start()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threads()}
+        me = get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack += [names.get(ident, str(ident)), self.name]
+            self.samples[";".join(reversed(stack))] += 1
+
+    def dump(self):
+        """Write every sample so far, replacing what this process wrote before."""
+        if not self.samples:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = Path(self.directory) / f"{os.getpid()}.folded"
+        # Renamed into place, so merge() never reads half a file
+        partial = path.with_suffix(".part")
+        partial.write_text("".join(f"{stack} {count}\n" for stack, count in self.samples.items()))
+        partial.replace(path)
+
+    def stop(self):
+        """Stop sampling for good and write the samples."""
+        self.stopped.set()
+        with self.thread_lock:
+            if self.thread is not None:
+                self.thread.join()
+        self.dump()
+
+    def _run(self):
+        dumped = monotonic()
+        while not self.stopped.wait(SAMPLE_INTERVAL) and self.enabled():
+            self.sample()
+            if monotonic() - dumped >= DUMP_INTERVAL:
+                self.dump()
+                dumped = monotonic()
+        # Switched off, the next poll() starts over
+        self.dump()
+
+
+def clear(directory: str = PROFILE_DIR):
+    """Remove the samples of earlier runs."""
+    for path in Path(directory).glob("*.folded"):
+        path.unlink(missing_ok=True)
+
+def merge(directory: str = PROFILE_DIR) -> tuple[int, int, Path] | None:
+    """Add up the samples of every process into the report, and return how many processes and samples it holds and
+    where it is, or None if nothing was sampled."""
+    samples: Counter[str] = Counter()
+    paths = [path for path in Path(directory).glob("*.folded") if path.name != REPORT_NAME]
+    for path in paths:
+        for line in path.read_text().splitlines():
+            stack, _, count = line.rpartition(" ")
+            samples[stack] += int(count)
+    if not samples:
+        return None
+
+    report = Path(directory) / REPORT_NAME
+    # Heaviest stacks first, for a quick look without a flame graph
+    report.write_text("".join(f"{stack} {count}\n" for stack, count in samples.most_common()))
+    for path in paths:
+        path.unlink()
+    return len(paths), samples.total(), report
@@ -0,0 +1,113 @@
+#!/usr/bin/env false
+import mmap
+import os
+import struct
+from threading import RLock
+
+import numpy as np
+
+from arena import close_mapping, map_file
+from vector_engine import PREY, PREDATOR
+
+# Header: magic, version, energy bins, then the number of records written so far
+MAGIC = b"COLREC\x00\x00"
+VERSION = 1
+HEADER_FORMAT = "=8sIIQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+COUNT_OFFSET = 16
+
+# Energies are binned by tens, the last bin takes everything above
+ENERGY_BINS = 11
+ENERGY_BIN_WIDTH = 10
+# The file grows by this many records at a time, and is cut back to what was written on close
+CHUNK_RECORDS = 4096
+
+
+def record_dtype(energy_bins: int = ENERGY_BINS) -> np.dtype:
+    return np.dtype([
+        ("timestamp", "<f8"),
+        ("grass", "<i4"),
+        ("preys", "<i4"),
+        ("predators", "<i4"),
+        ("prey_energy", "<u4", (energy_bins,)),
+        ("predator_energy", "<u4", (energy_bins,)),
+    ])
+
+
+class Recorder:
+    """
+    Appends one fixed-size record per sample to a memory mapped file. Records are only ever added, and the count in
+    the header is written after each one, so a reader never sees a half written record.
+    """
+
+    def __init__(self, path: str):
+        self.dtype = record_dtype()
+        # Reentrant so a sampler can hold it across reading the world and appending
+        self.lock = RLock()
+        self.count: int = 0
+        self.capacity: int = 0
+        self.records: np.ndarray | None = None
+
+        self.file = open(path, "w+b")
+        self.file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, ENERGY_BINS, 0))
+        self.file.flush()
+        self.mapfile: mmap.mmap | None = None
+        self._extend()
+
+    @property
+    def closed(self) -> bool:
+        return self.file.closed
+
+    def _extend(self):
+        close_mapping(self, "records")
+        self.capacity += CHUNK_RECORDS
+        self.mapfile = map_file(self.file.fileno(), HEADER_SIZE + self.capacity * self.dtype.itemsize)
+        self.records = np.frombuffer(self.mapfile, self.dtype, count=self.capacity, offset=HEADER_SIZE)
+
+    def append(self, timestamp: float, grass: int, types: np.ndarray, energy: np.ndarray):
+        """Add a sample of the world from its slots' types and energies."""
+        with self.lock:
+            if self.file.closed:
+                return
+            if self.count == self.capacity:
+                self._extend()
+
+            # Same rule as list_preys and list_predators, a zeroed energy is a dead individual
+            alive = energy > 0
+            bins = np.minimum(energy // ENERGY_BIN_WIDTH, ENERGY_BINS - 1)
+            preys = alive & (types == PREY)
+            predators = alive & (types == PREDATOR)
+
+            record = self.records[self.count]
+            record["timestamp"] = timestamp
+            record["grass"] = grass
+            record["preys"] = np.count_nonzero(preys)
+            record["predators"] = np.count_nonzero(predators)
+            record["prey_energy"] = np.bincount(bins[preys], minlength=ENERGY_BINS)
+            record["predator_energy"] = np.bincount(bins[predators], minlength=ENERGY_BINS)
+
+            self.count += 1
+            self.mapfile[COUNT_OFFSET:COUNT_OFFSET + 8] = struct.pack("=Q", self.count)
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            close_mapping(self, "records")
+            os.ftruncate(self.file.fileno(), HEADER_SIZE + self.count * self.dtype.itemsize)
+            self.file.close()
+
+
+def load(path: str) -> np.ndarray:
+    """
+    Map a recording and return its records as a structured array, without copying. Columns are its fields, e.g.
+    load(path)["preys"]. Works on a recording still being written, up to the last complete record.
+    """
+    with open(path, "rb") as recording:
+        magic, version, energy_bins, count = struct.unpack(HEADER_FORMAT, recording.read(HEADER_SIZE))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} recording")
+    if count == 0:
+        return np.empty(0, record_dtype(energy_bins))
+
+    return np.memmap(path, record_dtype(energy_bins), mode="r", offset=HEADER_SIZE, shape=(count,))
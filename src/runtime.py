@@ -1,13 +1,134 @@
 #!/usr/bin/env false
-import struct
+import os
 import sys
 from multiprocessing import Process
-
-from individual import IndividualType, main as individual_main
-
+from random import randint
+from time import perf_counter
+
+import numpy as np
+
+import checkpoint
+from CONSTS import LOCK_STRIPES
+from grid import leave
+from individual import IndividualType, MAX_WAIT, MIN_WAIT, main as individual_main
+from population import Census, moments
+from profiler import merge as merge_profiles
+from shard import gather, spread
+from snapshot import Query, Snapshot, population, top
+from stats import COUNTERS, SPAWN, SPAWNS, TIMINGS, percentile
+from vector_engine import PREY, PREDATOR
+
+
+def _spawn_vectorized(env, type_code: int, count: int) -> int:
+    # Make room first, the engine only fills free slots
+    population = env.engine.count(PREY) + env.engine.count(PREDATOR)
+    if population + count > env.arena.capacity:
+        env.grow(population + count)
+
+    start = perf_counter()
+    with env.locks.all():
+        added = env.engine.spawn(type_code, count)
+        env.publish()
+    # A whole batch is a single spawn here
+    env.stats.count(SPAWNS, added)
+    env.stats.time(SPAWN, perf_counter() - start)
+
+    if added < count:
+        print("Cannot add more individuals")
+    return added
+
+def _start_individual(env, individual_type: IndividualType, individual_id: int):
+    start = perf_counter()
+    # The process waits on its wakeup as soon as it lived once, so it must exist by then
+    if not env.hosts:
+        env.wakeup(individual_id)
+    individual = _start_process(env, individual_type, individual_id)
+    # Hosted individuals are looked after by their host
+    if isinstance(individual, Process):
+        env.supervisor.adopt(individual_id, individual)
+    env.stats.count(SPAWNS)
+    env.stats.time(SPAWN, perf_counter() - start)
+    return individual
+
+def _start_processes(env, individuals: list[tuple[IndividualType, int]]) -> list[Process]:
+    """Process mode _start_individual for a whole batch: the warm processes are taken from the pool at once, and only
+    the rest is forked."""
+    start = perf_counter()
+    for _, individual_id in individuals:
+        env.wakeup(individual_id)
+    warm = env.spawn_pool.take_many(individuals) if env.spawn_pool is not None else [None] * len(individuals)
+
+    processes = []
+    for (individual_type, individual_id), process in zip(individuals, warm):
+        if process is None:
+            process = Process(target=individual_main, args=(individual_type, individual_id, False, env.instance))
+            process.start()
+        env.supervisor.adopt(individual_id, process)
+        processes.append(process)
+
+    env.stats.count(SPAWNS, len(processes))
+    # Spread over the batch, so the percentiles stay per individual
+    elapsed = (perf_counter() - start) / max(len(processes), 1)
+    for _ in processes:
+        env.stats.time(SPAWN, elapsed)
+    return processes
+
+def _start_process(env, individual_type: IndividualType, individual_id: int):
+    # In host mode, the least loaded worker runs the individual instead of a process of its own
+    if env.hosts:
+        host = min(env.hosts, key=lambda host: host.load)
+        return host.spawn(individual_type, individual_id)
+
+    # Prefer a warm process from the pool, fall back to a fresh one when it runs dry
+    if env.spawn_pool is not None:
+        process = env.spawn_pool.take(individual_type, individual_id)
+        if process is not None:
+            return process
+
+    process = Process(target=individual_main, args=(individual_type, individual_id, False, env.instance))
+    process.start()
+    return process
+
+def schedule_update(env, slot_id: int):
+    """Have the scheduler wake the individual in a slot for its next update, once it is in the env's dicts."""
+    env.scheduler.schedule(randint(MIN_WAIT, MAX_WAIT), wake_individuals, (slot_id, env.tags[slot_id]))
+
+def wake_individuals(env, due: list[tuple[int, int]]):
+    """Scheduler callback: post the wakeup of every (slot ID, tag) due, one message per host in host mode, and
+    schedule their next update. Individuals that died or were deleted since are dropped."""
+    hosted: dict = {}
+    for slot_id, tag in due:
+        individual = env.preys_processes.get(slot_id) or env.predators_processes.get(slot_id)
+        if individual is None or env.tags[slot_id] != tag:
+            continue
+        if env.hosts:
+            hosted.setdefault(individual.host, []).append(slot_id)
+        else:
+            env.wakeups[slot_id].release()
+        schedule_update(env, slot_id)
+
+    for host, slot_ids in hosted.items():
+        host.wake(slot_ids)
+
+def _spawn_rate(added: int, start: float) -> str:
+    elapsed = perf_counter() - start
+    return f" ({added / elapsed:.0f} individuals/s)" if added and elapsed > 0 else ""
+
+def _shard_add(env, type_code: int, count: int) -> int:
+    # Evenly over the shards, which all work on their share at once
+    shares = spread(count, len(env.shards))
+    return sum(int(added) for added in gather(env.shards, [f"add {type_code} {share}" for share in shares]))
 
 def add_preys(arg: int, env):
+    if env.shards:
+        print(f"{_shard_add(env, PREY, arg)} prey(s) added")
+        return
+    if env.engine is not None:
+        print(f"{_spawn_vectorized(env, PREY, arg)} prey(s) added")
+        return
+
     added: int = 0
+    start = perf_counter()
 
     for _ in range(arg):
         # Get id that will be the same in the shared mem and our dicts
@@ -18,14 +139,23 @@ def add_preys(arg: int, env):
             break
 
         added += 1
-        process = Process(target=individual_main, args=(IndividualType.PREY, individual_id))
-        env.preys_processes[individual_id] = process
-        process.start()
+        proc = _start_individual(env, IndividualType.PREY, individual_id)
+        with env.processes_lock:
+            env.preys_processes[individual_id] = proc
+        schedule_update(env, individual_id)
 
-    print(f"{added} prey(s) added")
+    print(f"{added} prey(s) added{_spawn_rate(added, start)}")
 
 def add_predators(arg: int, env):
+    if env.shards:
+        print(f"{_shard_add(env, PREDATOR, arg)} predator(s) added")
+        return
+    if env.engine is not None:
+        print(f"{_spawn_vectorized(env, PREDATOR, arg)} predator(s) added")
+        return
+
     added: int = 0
+    start = perf_counter()
 
     for _ in range(arg):
         # Get id that will be the same in the shared mem and our dicts
@@ -36,112 +166,293 @@ def add_predators(arg: int, env):
             break
 
         added += 1
-        process = Process(target=individual_main, args=(IndividualType.PREDATOR, individual_id))
-        env.predators_processes[individual_id] = process
-        process.start()
+        proc = _start_individual(env, IndividualType.PREDATOR, individual_id)
+        with env.processes_lock:
+            env.predators_processes[individual_id] = proc
+        schedule_update(env, individual_id)
 
-    print(f"{added} predator(s) added")
+    print(f"{added} predator(s) added{_spawn_rate(added, start)}")
     
 def add_all(arg: int, env):
     add_preys(arg, env)
     add_predators(arg, env)
     
-def add_grass(arg: int, env):
-    with env.sem:
-        env.mapfile.seek(1)
-        current_grass = struct.unpack("=i", env.mapfile.read(4))[0]
-        env.mapfile.seek(1)
-        env.mapfile.write(struct.pack("i", current_grass + arg))
-
-
-def list_preys(_, env):
-    print("Preys in the simulation (Shared Memory View):")
-    count = 0
-
-    with env.sem:
-        for i in range(env.population_limit):
-            # Move the cursor to position and read
-            env.mapfile.seek(5 + (i * 8))
-            data = env.mapfile.read(8)
-            type_code, energy = struct.unpack("=Bi3x", data)
-
-            if type_code == 1 and energy > 0:
-                print(f" - ID {i}: Energy {energy}")
-                count += 1
-
-    if count == 0:
-        print("No active preys found in shared memory.")
-    else:
-        print(f"Total: {count} prey(s).")
+def _all_regions(env):
+    return env.locks.regions_of(*range(len(env.locks.regions)))
 
-def list_predators(_, env):
-    print("Predators in the simulation (Shared Memory View):")
-    count = 0
+def add_grass(arg: int, env):
+    if env.shards:
+        gather(env.shards, [f"grass {share}" for share in spread(arg, len(env.shards))])
+        return
 
-    with env.sem:
-        for i in range(env.population_limit):
-            # Move the cursor to position and read
-            env.mapfile.seek(5 + (i * 8))
-            data = env.mapfile.read(8)
-            type_code, energy = struct.unpack("=Bi3x", data)
+    # On the grid, scattered over random cells
+    if env.grid is not None:
+        cells = np.random.randint(0, env.grid.width * env.grid.height, arg)
+        with _all_regions(env):
+            np.add.at(env.grid.grass.reshape(-1), cells, 1)
+        return
 
-            if type_code == 2 and energy > 0:
-                print(f" - ID {i}: Energy {energy}")
-                count += 1
+    with env.locks.header:
+        env.arena.header.grass += arg
+
+
+def _shard_counts(env) -> list[tuple[int, int, int]]:
+    """(preys, predators, grass) of every shard."""
+    return [tuple(int(value) for value in reply.split()) for reply in gather(env.shards, ["count"] * len(env.shards))]
+
+def _shard_select(env, type_code: int, query: Query | None) -> tuple[np.ndarray, np.ndarray]:
+    """Like Snapshot.select over every shard, IDs being "<shard>:<slot>"."""
+    n = query.top if query is not None else None
+    low, high = query.energy if query is not None and query.energy is not None else (None, None)
+    request = "list {} {} {} {}".format(type_code, *("-" if value is None else value for value in (n, low, high)))
+
+    ids, energy = [], []
+    for k, reply in enumerate(gather(env.shards, [request] * len(env.shards))):
+        for entry in reply.split():
+            slot_id, slot_energy = entry.split(":")
+            ids.append(f"{k}:{slot_id}")
+            energy.append(int(slot_energy))
+    ids, energy = np.array(ids, dtype=object), np.array(energy, dtype=np.int32)
+
+    # Each shard sent its own top, the overall one is among them
+    if n is not None:
+        ids, energy = top(ids, energy, n)
+    return ids, energy
+
+def _list_population(type_code: int, label: str, query: Query | None, env, snapshot: Snapshot | None = None):
+    # Counting alone never needs the slots
+    if query is not None and query.count_only:
+        if env.shards:
+            total = sum(counts[type_code - 1] for counts in _shard_counts(env))
+        else:
+            total = population(env, type_code)
+        print(f"Total: {total} {label}(s).")
+        return
 
-    if count == 0:
-        print("No active predators found in shared memory.")
+    if env.shards:
+        ids, energy = _shard_select(env, type_code, query)
+        view = "Shards View"
     else:
-        print(f"Total: {count} predator(s).")
+        ids, energy = (snapshot or Snapshot(env)).select(type_code, query)
+        view = "Shared Memory View"
+    if query is not None and query.top is not None:
+        print(f"Top {query.top} {label}s by energy ({view}):")
+    elif query is not None and query.energy is not None:
+        print(f"{label.capitalize()}s with energy {query.energy[0]} to {query.energy[1]} ({view}):")
+    else:
+        print(f"{label.capitalize()}s in the simulation ({view}):")
+
+    if len(ids) == 0:
+        print(f"No active {label}s found in {'the shards' if env.shards else 'shared memory'}.")
+        return
+    # One print for the lot, there may be millions
+    print("\n".join(f" - ID {i}: Energy {e}" for i, e in zip(ids.tolist(), energy.tolist())))
+    print(f"Total: {len(ids)} {label}(s).")
+
+def list_preys(query: Query | None, env):
+    _list_population(PREY, IndividualType.PREY.value, query, env)
+
+def list_predators(query: Query | None, env):
+    _list_population(PREDATOR, IndividualType.PREDATOR.value, query, env)
         
-def list_all(_, env):
-    list_preys(None, env)
+def list_all(query: Query | None, env):
+    # Both lists come from the same copy of the world
+    snapshot = None if env.shards or (query is not None and query.count_only) else Snapshot(env)
+    _list_population(PREY, IndividualType.PREY.value, query, env, snapshot)
     print()
-    list_predators(None, env)
+    _list_population(PREDATOR, IndividualType.PREDATOR.value, query, env, snapshot)
 
 def list_grass(_, env):
-    current_grass = 0
-    with env.sem:
-        env.mapfile.seek(1)
-        current_grass = struct.unpack("=i", env.mapfile.read(4))[0]
-        
+    if env.shards:
+        grass = [counts[2] for counts in _shard_counts(env)]
+        print(f"Total: {sum(grass)} grass over {len(grass)} shards")
+        return
+
+    if env.grid is not None:
+        with _all_regions(env):
+            grass = env.grid.grass.copy()
+        print(f"Total: {int(grass.sum())} grass over {grass.size} cells, {np.count_nonzero(grass)} with some")
+        return
+
+    with env.locks.header:
+        current_grass = env.arena.header.grass
+
     print(f"Total: {current_grass} grass")
 
 
+def add_stats(_, env):
+    print("***Stats are only counted, try list stats or delete stats")
+
+def list_stats(_, env):
+    uptime, counters, histograms = env.stats.read()
+    print(f"Stats over the last {uptime:.0f}s (every process, flushed at most a second ago):")
+
+    for name, value in zip(COUNTERS, counters):
+        print(f" - {name}: {value} ({value / max(uptime, 1):.1f}/s)")
+
+    # Histogram buckets are powers of two, so percentiles are upper bounds
+    for name, histogram in zip(TIMINGS, histograms):
+        if sum(histogram) == 0:
+            print(f" - {name}: no samples")
+            continue
+        p50, p90, p99, p999 = (percentile(histogram, p) for p in (50, 90, 99, 99.9))
+        print(f" - {name}: p50 <{p50}us, p90 <{p90}us, p99 <{p99}us, p99.9 <{p999}us ({sum(histogram)} samples)")
+
+    # Shards count on their own, individuals there have no process
+    if env.shards:
+        print("Shards:")
+        for shard, reply in zip(env.shards, gather(env.shards, ["info"] * len(env.shards))):
+            tick, preys, predators, grass, emigrated, immigrated = reply.split()
+            print(f" - {shard.address}: tick {tick}, {preys} prey(s), {predators} predator(s), {grass} grass, "
+                  f"{emigrated} left, {immigrated} arrived")
+
+def delete_stats(_, env):
+    env.stats.reset()
+    print("Stats reset.")
+
+
+def population_census(env) -> Census:
+    """Counts, energy sums, births, deaths and drought age of the whole population, without reading any slot."""
+    if env.shards:
+        counts, sums, births, deaths, drought_ages = {PREY: 0, PREDATOR: 0}, {PREY: (0, 0), PREDATOR: (0, 0)}, 0, 0, []
+        for reply in gather(env.shards, ["population"] * len(env.shards)):
+            # "<preys> <predators> <prey sum> <prey squares> <predator sum> <predator squares> <births> <deaths>
+            # <drought age or ->"
+            *values, drought_age = reply.split()
+            values = [int(value) for value in values]
+            for k, type_code in enumerate((PREY, PREDATOR)):
+                counts[type_code] += values[k]
+                total, squares = sums[type_code]
+                sums[type_code] = (total + values[2 + 2 * k], squares + values[3 + 2 * k])
+            births += values[6]
+            deaths += values[7]
+            if drought_age != "-":
+                drought_ages.append(float(drought_age))
+        return Census(counts, sums, births, deaths, min(drought_ages, default=None))
+
+    header = env.arena.header
+    counts = {type_code: header.count(type_code) for type_code in (PREY, PREDATOR)}
+    sums = {}
+    for type_code in (PREY, PREDATOR):
+        # Each stripe's sums are read consistently, without holding it
+        stripes = [env.locks.read_stripe(stripe, lambda: header.energy_sums(stripe, type_code))
+                   for stripe in range(LOCK_STRIPES)]
+        sums[type_code] = (sum(total for total, _ in stripes), sum(squares for _, squares in stripes))
+    source = env.engine if env.engine is not None else env.population
+    drought_age = env.scheduler.now() - env.last_drought if env.last_drought is not None else None
+    return Census(counts, sums, source.births, source.deaths, drought_age)
+
+def add_population(_, env):
+    print("***The population is only watched, try add prey or add predator")
+
+def list_population(_, env):
+    census = population_census(env)
+    stats = env.population
+    print(f"Population over the last {env.scheduler.now() - stats.started:.0f} simulated seconds:")
+
+    for type_code, label in ((PREY, "prey"), (PREDATOR, "predator")):
+        count = census.counts[type_code]
+        line = f" - {label}s: {count}"
+        if type_code in stats.average_counts:
+            line += f" ({stats.average_counts[type_code]:.1f} on average)"
+        energy = moments(count, *census.sums[type_code])
+        if energy is not None:
+            mean, variance = energy
+            line += f", energy mean {mean:.1f}, variance {variance:.1f}"
+        print(line)
+
+    for label, total, first, rate in (("births", census.births, stats.first_births, stats.birth_rate),
+                                      ("deaths", census.deaths, stats.first_deaths, stats.death_rate)):
+        average = f"{rate:.2f}/s on average" if rate is not None else "no rate yet"
+        print(f" - {label}: {total - first} ({average})")
+
+    if census.drought_age is None:
+        print(" - no drought yet")
+    else:
+        print(f" - last drought: {census.drought_age:.0f} simulated seconds ago")
+
+def delete_population(_, env):
+    census = population_census(env)
+    env.population.reset(env.scheduler.now(), census.births, census.deaths)
+    print("Population averages reset.")
+
+
+def free_slot(env, slot_id: int):
+    """Wipe the slot of an individual that is gone, and hand its ID back. Its process must have exited."""
+    with env.locks.stripe(slot_id):
+        type_code = env.arena.slots.type_of(slot_id)
+        env.arena.slots.clear(slot_id)
+        with env.locks.index:
+            env.prey_index.update(slot_id)
+        # Unless it died meanwhile, in which case it was counted already
+        if type_code != 0:
+            with env.locks.header:
+                env.arena.header.add_count(type_code, -1)
+    if env.grid is not None:
+        leave(env, slot_id)
+
+    # Return the ID to the pool
+    env.return_id(slot_id)
+
+def close_process(proc):
+    """Join a stopped individual's process and release it. One whose exit can't be confirmed, e.g. reaped elsewhere,
+    is left to the garbage collector rather than taking down the calling thread."""
+    proc.join()
+    if proc.exitcode is None:
+        return
+    try:
+        proc.close()
+    except ValueError:
+        pass
+
 def _delete_individuals(env, processes_dict, count_to_delete, label):
     """Helper to remove N individuals from a specific dictionary."""
     if not processes_dict:
         print(f"No {label}s to delete.")
         return
 
+    # Take them out first, the reaper and the supervisor leave alone whatever is not in the dict anymore
+    with env.processes_lock:
+        stopped = [(slot_id, processes_dict.pop(slot_id)) for slot_id in list(processes_dict)[:count_to_delete]]
 
-    # Get a list of IDs currently in the dictionary
-    target_ids = list(processes_dict.keys())[:count_to_delete]
+    # Signal them all, then wait for them all at once
+    for _, proc in stopped:
+        proc.terminate()
+    env.supervisor.wait([proc for _, proc in stopped])
 
-    deleted_count = 0
-    for slot_id in target_ids:
-        # Stop the process
-        proc = processes_dict.pop(slot_id)
-        if proc.is_alive():
-            proc.terminate()
-            proc.join()
+    for slot_id, proc in stopped:
+        close_process(proc)
+        free_slot(env, slot_id)
 
-        # Clean the Shared Memory
-        offset = 5 + (slot_id * 8)
-        with env.sem:
-            env.mapfile.seek(offset)
-            env.mapfile.write(b'\x00' * 8)
+    print(f"Removed {len(stopped)} {label}(s).")
 
-        # Return the ID to the pool
-        env.return_id(slot_id)
-        deleted_count += 1
+def _delete_vectorized(env, type_code: int, count_to_delete: int, label: str):
+    if env.shards:
+        # Shard by shard, until enough are gone
+        deleted_count = 0
+        for shard in env.shards:
+            if deleted_count < count_to_delete:
+                deleted_count += int(shard.request(f"delete {type_code} {count_to_delete - deleted_count}"))
+    else:
+        with env.locks.all():
+            deleted_count = env.engine.kill(type_code, count_to_delete)
+            env.publish()
 
-    print(f"Removed {deleted_count} {label}(s).")
+    if deleted_count == 0:
+        print(f"No {label}s to delete.")
+    else:
+        print(f"Removed {deleted_count} {label}(s).")
 
 def delete_preys(arg: int, env):
+    if env.engine is not None or env.shards:
+        _delete_vectorized(env, PREY, arg, IndividualType.PREY.value)
+        return
     _delete_individuals(env, env.preys_processes, arg, IndividualType.PREY.value)
 
 def delete_predators(arg: int, env):
+    if env.engine is not None or env.shards:
+        _delete_vectorized(env, PREDATOR, arg, IndividualType.PREDATOR.value)
+        return
     _delete_individuals(env, env.predators_processes, arg, IndividualType.PREDATOR.value)
     
 def delete_all(arg: int, env):
@@ -149,40 +460,179 @@ def delete_all(arg: int, env):
     delete_predators(arg, env)
 
 def delete_grass(arg: int, env):
-    current_grass = 0
-    with env.sem:
-        env.mapfile.seek(1)
-        current_grass = struct.unpack("=i", env.mapfile.read(4))[0]
-        env.mapfile.seek(1)
-        env.mapfile.write(struct.pack("i", min(0, current_grass - arg)))
+    if env.shards:
+        removed = 0
+        for shard in env.shards:
+            if removed < arg:
+                removed -= int(shard.request(f"grass -{arg - removed}"))
+        print(f"Removed {removed} grass.")
+        return
+
+    if env.grid is not None:
+        with _all_regions(env):
+            grass = env.grid.grass.reshape(-1)
+            # Each grass is equally likely to go, wherever it grows
+            units = np.repeat(np.arange(grass.size), np.maximum(grass, 0))
+            removed = np.random.choice(units, min(arg, len(units)), replace=False)
+            np.subtract.at(grass, removed, 1)
+        print(f"Removed {len(removed)} grass.")
+        return
+
+    with env.locks.header:
+        current_grass = env.arena.header.grass
+        env.arena.header.grass = max(0, current_grass - arg)
 
     print(f"Removed {min(arg, current_grass)} grass.")
 
 
+def _stop_individuals(env):
+    """Terminate every individual process at once, then wait for them all."""
+    # Take them all out at once, the reaper and the supervisor leave alone whatever is not in the dicts anymore
+    with env.processes_lock:
+        stopped = [*env.predators_processes.values(), *env.preys_processes.values()]
+        env.predators_processes.clear()
+        env.preys_processes.clear()
+
+    # Signalled all at once through their pidfds, hosted individuals are cancelled one by one
+    env.supervisor.terminate_all(stopped)
+    env.supervisor.wait(stopped)
+
+    for proc in stopped:
+        close_process(proc)
+    # Hosts cancel their tasks asynchronously, make sure none touches the world anymore
+    for host in env.hosts:
+        host.sync()
+
+def start_individuals(env, individuals: list[tuple[int, int]]):
+    """Start individuals as (type code, slot ID) in bulk: one message per host in host mode, otherwise every warm
+    process of the spawn pool at once before forking the rest, registered under a single lock."""
+    individual_types = {PREY: IndividualType.PREY, PREDATOR: IndividualType.PREDATOR}
+    dicts = {PREY: env.preys_processes, PREDATOR: env.predators_processes}
+
+    if env.hosts:
+        # Deal them out to the hosts, least loaded first
+        hosts = sorted(env.hosts, key=lambda host: host.load)
+        for k, host in enumerate(hosts):
+            batch = individuals[k::len(hosts)]
+            hosted = host.spawn_many([(individual_types[type_code], slot_id) for type_code, slot_id in batch])
+            for (type_code, slot_id), individual in zip(batch, hosted):
+                with env.processes_lock:
+                    dicts[type_code][slot_id] = individual
+                schedule_update(env, slot_id)
+        return
+
+    processes = _start_processes(env, [(individual_types[type_code], slot_id) for type_code, slot_id in individuals])
+    with env.processes_lock:
+        for (type_code, slot_id), proc in zip(individuals, processes):
+            dicts[type_code][slot_id] = proc
+    for _, slot_id in individuals:
+        schedule_update(env, slot_id)
+
+def save_world(path: str, env):
+    if env.shards:
+        print("***Checkpoints are not supported with shards")
+        return
+    start = perf_counter()
+    try:
+        checkpoint.save(env, path)
+    except OSError as e:
+        print(f"***Cannot save to {path}: {e.strerror}")
+        return
+    print(f"World saved to {path} ({(perf_counter() - start) * 1000:.0f} ms)")
+
+def load_world(path: str, env):
+    if env.shards:
+        print("***Checkpoints are not supported with shards")
+        return
+    start = perf_counter()
+    try:
+        saved = checkpoint.read(path)
+    except (OSError, ValueError) as e:
+        print(f"***Cannot load {path}: {e}")
+        return
+
+    # The saved individuals take the place of the current ones, restored tags could match updates still scheduled
+    _stop_individuals(env)
+    env.scheduler.cancel(wake_individuals)
+    individuals = checkpoint.restore(env, saved)
+    start_individuals(env, individuals)
+
+    if env.engine is not None:
+        count = env.engine.count(PREY) + env.engine.count(PREDATOR)
+    else:
+        count = len(individuals)
+    print(f"World loaded from {path}, {count} individual(s) ({(perf_counter() - start) * 1000:.0f} ms)")
+
+
+def set_speed(factor: float | None, env):
+    """Scale the rate of every timed event, individuals' updates included. Without a factor, show the current one."""
+    if factor is None:
+        print(f"Speed: x{env.scheduler.speed:g} ({env.scheduler.now():.0f} simulated seconds so far)")
+        return
+    env.scheduler.set_speed(factor)
+    # Shards keep their own clock
+    if env.shards:
+        gather(env.shards, [f"speed {factor}"] * len(env.shards))
+    print(f"Speed set to x{factor:g}" if factor > 0 else "Simulation paused")
+
+def set_profiling(on: bool, env):
+    """Switch the sampling profiler of every process, they write their samples when switched off."""
+    env.stats.set_profiling(on)
+    if env.shards:
+        gather(env.shards, [f"profile {'on' if on else 'off'}"] * len(env.shards))
+    print(f"Profiling {'on' if on else 'off'}, samples go to {env.instance.profile_dir}")
+
+
 def graceful_exit(env, new_line: bool = False):
     print("{}Exiting...".format('\n' if new_line else ''))
 
-    # Stop threads
+    # Stop threads, no timed event may touch the world while it is torn down
+    env.scheduler.stop()
     env.socket_thread.join(timeout=0)
-    env.grass_thread.join(timeout=0)
 
     # Clear preys and predators processes
-    # This could be improved by joining them in parallel
-    for proc in env.predators_processes.values():
-        proc: Process
-        proc.terminate()
-        proc.join()
-        proc.close()
-
-    for proc in env.preys_processes.values():
-        proc: Process
-        proc.terminate()
-        proc.join()
-        proc.close()
-
-    env.mapfile.close()
-    env.memory.unlink()
-    env.sem.unlink()
+    _stop_individuals(env)
+
+    for host in env.hosts:
+        host.stop()
+    for shard in env.shards:
+        try:
+            shard.request("stop")
+        except OSError:
+            pass
+        shard.close()
+    for process in env.shard_processes:
+        process.join()
+    if env.spawn_pool is not None:
+        env.spawn_pool.stop()
+
+    # Every other process is gone, so their samples are all written
+    env.profiler.stop()
+    merged = merge_profiles(env.instance.profile_dir)
+    if merged is not None:
+        processes, samples, report = merged
+        print(f"Profile of {processes} process(es), {samples} samples, written to {report}")
+
+    # Cut the recording back to the samples it holds
+    if env.recorder is not None:
+        env.recorder.close()
+
+    # The engine's view into the shared memory must go before the mapping can be closed
+    if env.engine is not None:
+        del env.slots
+    if env.grid is not None:
+        env.grid.close()
+        env.grid.unlink()
+    env.arena.close()
+    env.arena.memory.unlink()
+    env.locks.unlink()
+    for wakeup in env.wakeups.values():
+        wakeup.unlink()
+    env.stats.unlink()
+    try:
+        os.unlink(env.instance.join_socket)
+    except FileNotFoundError:
+        pass
     del env.drought_lock
     env.send_queue.send("quit".encode("utf-8"))
     env.send_queue.close()
@@ -201,22 +651,36 @@ ACTIONS:
 - list: List all current TARGET instances
 - delete: Remove NUMBER instances of TARGET from the simulation
 - stop: Stop the simulation and exit
+- save FILE: Write the whole world to FILE
+- load FILE: Replace the world with the one saved in FILE
+- speed [FACTOR]: Run the simulation FACTOR times faster than real time (0 pauses), or show the current speed
+- profile on|off: Sample where every process spends its time, merged into a flame graph ready report on exit
 
 TARGETS:
 - prey: Simulation prey entities
 - predator: Simulation predator entities
 - all: Prey and predator entities (prey is operated on first)
 - grass: Simulation grass entities
+- stats: Hot path counters and latency percentiles (list shows them, delete resets them)
+- population: Energy moments, births, deaths and their moving averages (list shows them, delete restarts them)
 
 EXAMPLES:
 - add prey 5      : Add 5 prey
 - add all 2       : Add 2 prey and 2 predators
 - add grass 12    : Add 12 grass (regardless of the limit)
 - list predator   : Show all predators
+- list prey top 5 : Show the 5 preys with the most energy
+- list all energy 20 50 : Show individuals with 20 to 50 energy
+- list all count  : Show how many preys and predators there are
 - delete prey 2   : Remove 2 prey
+- list stats      : Show counters and latencies
+- list population : Show the population's statistics and trends
+- save world.ckpt : Checkpoint the simulation
+- speed 4         : Update individuals, grow grass and start droughts 4 times as often
+- profile on      : Start sampling every process
 - stop            : Exit simulation
 - help            : Show this help
 - ?               : Show this help
 
-NUMBER is optional. For add/delete; defaults to 1. For list; ignored.
+NUMBER is optional. For add/delete; defaults to 1. For list; ignored, or replaced by top N, energy MIN MAX or count.
 """)
\ No newline at end of file
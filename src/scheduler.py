@@ -0,0 +1,112 @@
+#!/usr/bin/env false
+import heapq
+from collections.abc import Callable
+from itertools import count
+from threading import Condition, Lock, Thread
+from time import monotonic
+
+# Seconds between two checks of stop() while a callback waits for a lock
+STOP_POLL = 0.1
+
+
+class Scheduler:
+    """
+    Every timed event of the env on a single heap, served by a single thread. Deadlines are in simulation seconds,
+    which run speed times faster than real ones, so changing the speed reschedules nothing.
+
+    Events due at once are dispatched together: callback(context, [arg, ...]) is called once per callback with the args
+    of all its due events, in deadline order. Callbacks run on the scheduler's thread and schedule their next event
+    themselves, they should be quick since every other event waits meanwhile.
+    """
+
+    def __init__(self, context, speed: float = 1.0):
+        self.context = context
+        # (deadline, sequence number, callback, arg), the sequence keeps equal deadlines in scheduling order
+        self.events: list[tuple[float, int, Callable, object]] = []
+        self.sequence = count()
+        self.condition = Condition()
+        self.speed: float = speed
+        # Simulation time at the last speed change, and when that was
+        self.anchor: float = 0.0
+        self.anchor_real: float = monotonic()
+        # Held while dispatching, so stop() returns once no callback runs anymore
+        self.dispatching = Lock()
+        self.stopped: bool = False
+
+        self.thread = Thread(target=self._run, name="scheduler", daemon=True)
+        self.thread.start()
+
+    def now(self) -> float:
+        """Current simulation time, in simulation seconds since the scheduler started."""
+        return self.anchor + (monotonic() - self.anchor_real) * self.speed
+
+    def schedule(self, delay: float, callback: Callable, arg=None):
+        """Call callback(context, [arg, ...]) in delay simulation seconds."""
+        with self.condition:
+            sequence = next(self.sequence)
+            heapq.heappush(self.events, (self.now() + delay, sequence, callback, arg))
+            # Only an event coming before the one the thread waits for changes its wait
+            if self.events[0][1] == sequence:
+                self.condition.notify()
+
+    def cancel(self, callback: Callable):
+        """Drop every pending event of a callback."""
+        with self.condition:
+            self.events = [event for event in self.events if event[2] is not callback]
+            heapq.heapify(self.events)
+
+    def set_speed(self, speed: float):
+        """Run the simulation speed times faster than real time, 0 pauses it."""
+        with self.condition:
+            self.anchor = self.now()
+            self.anchor_real = monotonic()
+            self.speed = speed
+            self.condition.notify()
+
+    def stop(self):
+        """Drop every pending event and wait for the running callback, none run afterwards."""
+        with self.condition:
+            self.stopped = True
+            self.events.clear()
+            self.condition.notify()
+        with self.dispatching:
+            pass
+
+    def acquire(self, lock) -> bool:
+        """Take a lock from a callback, or give up and return False once stopping, since whoever stops the scheduler
+        may hold it."""
+        while not lock.acquire(timeout=STOP_POLL):
+            if self.stopped:
+                return False
+        return True
+
+    def _due(self) -> list[tuple[Callable, list]]:
+        """Wait for the next events to be due, and take them all out, grouped by callback."""
+        with self.condition:
+            while not self.stopped:
+                if self.events and self.speed > 0:
+                    late = self.now() - self.events[0][0]
+                    if late >= 0:
+                        break
+                    self.condition.wait(-late / self.speed)
+                else:
+                    self.condition.wait()
+
+            now = self.now()
+            due: dict[Callable, list] = {}
+            while self.events and self.events[0][0] <= now:
+                _, _, callback, arg = heapq.heappop(self.events)
+                due.setdefault(callback, []).append(arg)
+            return list(due.items())
+
+    def _run(self):
+        while True:
+            due = self._due()
+            with self.dispatching:
+                # _due() returns right away once stopped, stop() may also come between two callbacks
+                if self.stopped:
+                    return
+                for callback, args in due:
+                    if self.stopped:
+                        return
+                    callback(self.context, args)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+import asyncio
+from argparse import ArgumentParser
+from multiprocessing import Process
+from socket import create_connection, socket
+from time import monotonic, sleep
+
+import numpy as np
+
+from CONSTS import POPULATION_LIMIT
+from handshake import read_frame, recv_frame, send_frame, write_frame
+from headless import HeadlessWorld
+from profiler import PROFILE_DIR, Profiler, requested as profiling_requested
+from snapshot import Query, select
+from vector_engine import PREY, PREDATOR
+
+# Shard k of a local run listens on SHARD_PORT + k, or from the instance's shard port on
+SHARD_ADDRESS = "127.0.0.1"
+SHARD_PORT = 15800
+SHARD_TICK = 1
+# Chance for an individual to move to a neighbouring shard at each tick
+MIGRATION_CHANCE = 0.02
+# Listings and migrant batches are bigger than joins
+MAX_SHARD_FRAME = 1 << 26
+CONNECT_TIMEOUT = 10
+
+
+class Shard:
+    """
+    One part of a sharded world: a headless world ticking in real time, with its own population, grass and droughts.
+    It answers the coordinator and swaps state and migrants with its ring neighbours, all from a single event loop, so
+    nothing needs a lock. Shards are named by their "host:port" address.
+    """
+
+    def __init__(self, address: str, peers: list[str], capacity: int = POPULATION_LIMIT, seed: int | None = None,
+                 profile_dir: str = PROFILE_DIR):
+        self.address: str = address
+        self.peers: list[str] = peers
+        self.world = HeadlessWorld(seed, capacity)
+        # (preys, predators, grass) of each peer, as of its last tick
+        self.peer_state: dict[str, tuple[int, int, int]] = {}
+        self.connections: dict[str, tuple[asyncio.StreamReader, asyncio.StreamWriter]] = {}
+        # Incoming connections being served, closed on stop
+        self.clients: dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self.emigrated: int = 0
+        self.immigrated: int = 0
+        # Set by the coordinator's speed command, 0 pauses the ticks
+        self.speed: float = 1.0
+        # Set by the coordinator's profile command
+        self.profiling: bool = profiling_requested()
+        self.profile_dir: str = profile_dir
+        self.stopped = asyncio.Event()
+
+    async def run(self):
+        host, port = self.address.rsplit(":", 1)
+        self.profiler = Profiler("shard", lambda: self.profiling, self.profile_dir)
+        server = await asyncio.start_server(self.serve, host, int(port), reuse_address=True)
+        ticker = asyncio.create_task(self.tick())
+        async with server:
+            await self.stopped.wait()
+        ticker.cancel()
+        for _, writer in self.connections.values():
+            writer.close()
+        # Closing makes every pending read fail, so the serving tasks end by themselves
+        for writer in self.clients.values():
+            writer.close()
+        await asyncio.gather(*self.clients, return_exceptions=True)
+        self.profiler.stop()
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer every request of a connection in order, from the coordinator or a peer."""
+        self.clients[asyncio.current_task()] = writer
+        try:
+            while not self.stopped.is_set():
+                write_frame(writer, self.handle(await read_frame(reader, MAX_SHARD_FRAME)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+            self.clients.pop(asyncio.current_task(), None)
+
+    def handle(self, message: str) -> str:
+        world, engine = self.world, self.world.engine
+        command, *args = message.split()
+
+        if command == "add":
+            return str(world.add(int(args[0]), int(args[1])))
+        if command == "delete":
+            return str(world.delete(int(args[0]), int(args[1])))
+        if command == "list":
+            # "list <type> <top> <low> <high>", - when unused
+            top, low, high = (None if arg == "-" else int(arg) for arg in args[1:])
+            query = Query(top=top, energy=(low, high) if low is not None else None)
+            ids, energy = select(engine.types, engine.energy, int(args[0]), query)
+            return " ".join(f"{i}:{e}" for i, e in zip(ids.tolist(), energy.tolist()))
+        if command == "count":
+            return f"{engine.count(PREY)} {engine.count(PREDATOR)} {world.grass}"
+        if command == "grass":
+            # Adding ignores the limit like the env's add grass, removing stops at zero
+            before = world.grass
+            world.grass = max(world.grass + int(args[0]), 0)
+            return str(world.grass - before)
+        if command == "population":
+            sums = [value for type_code in (PREY, PREDATOR) for value in engine.energy_sums(type_code)]
+            drought_age = world.tick - world.last_drought if world.last_drought is not None else "-"
+            return (f"{engine.count(PREY)} {engine.count(PREDATOR)} {' '.join(map(str, sums))} {engine.births} "
+                    f"{engine.deaths} {drought_age}")
+        if command == "info":
+            return (f"{world.tick} {engine.count(PREY)} {engine.count(PREDATOR)} {world.grass} {self.emigrated} "
+                    f"{self.immigrated}")
+        if command == "state":
+            # "state <peer> <preys> <predators> <grass> [<type>:<energy> ...]", migrants come with the peer's state
+            peer, preys, predators, grass, *migrants = args
+            self.peer_state[peer] = (int(preys), int(predators), int(grass))
+            if migrants:
+                arrivals = np.array([migrant.split(":") for migrant in migrants], dtype=np.int32)
+                world.reserve(len(arrivals))
+                self.immigrated += engine.immigrate(arrivals[:, 0].astype(np.uint8), arrivals[:, 1])
+            return "ok"
+        if command == "speed":
+            self.speed = float(args[0])
+            return "ok"
+        if command == "profile":
+            self.profiling = args[0] == "on"
+            self.profiler.poll()
+            return "ok"
+        if command == "stop":
+            self.stopped.set()
+            return "stopped"
+        return ""
+
+    async def tick(self):
+        while True:
+            await asyncio.sleep(SHARD_TICK / self.speed if self.speed > 0 else SHARD_TICK)
+            if self.speed == 0:
+                continue
+            self.world.step()
+            await self.migrate()
+
+    async def migrate(self):
+        """Tell every peer how we are doing, sending along the individuals moving there. Preys head to the peer with
+        the most grass, predators to the one with the most preys, as far as we know."""
+        engine, rng = self.world.engine, self.world.rng
+        state = f"{engine.count(PREY)} {engine.count(PREDATOR)} {self.world.grass}"
+        movers = np.flatnonzero(engine.alive & (rng.random(engine.capacity) < MIGRATION_CHANCE))
+
+        batches: dict[str, list[np.ndarray]] = {peer: [] for peer in self.peers}
+        for type_code, wanted in ((PREY, 2), (PREDATOR, 0)):
+            ids = movers[engine.types[movers] == type_code]
+            if len(ids) and self.peers:
+                batches[self._best_peer(wanted)].append(ids)
+
+        for peer, batch in batches.items():
+            ids = np.concatenate(batch) if batch else np.empty(0, dtype=np.int64)
+            await self._send_state(peer, state, ids)
+
+    def _best_peer(self, wanted: int) -> str:
+        known = [peer for peer in self.peers if peer in self.peer_state]
+        if not known:
+            return self.peers[int(self.world.rng.integers(len(self.peers)))]
+        return max(known, key=lambda peer: self.peer_state[peer][wanted])
+
+    async def _send_state(self, peer: str, state: str, ids: np.ndarray):
+        types, energy = self.world.engine.emigrate(ids)
+        migrants = "".join(f" {t}:{e}" for t, e in zip(types.tolist(), energy.tolist()))
+        try:
+            async with asyncio.timeout(CONNECT_TIMEOUT):
+                if peer not in self.connections:
+                    host, port = peer.rsplit(":", 1)
+                    self.connections[peer] = await asyncio.open_connection(host, int(port))
+                reader, writer = self.connections[peer]
+                write_frame(writer, f"state {self.address} {state}{migrants}")
+                await writer.drain()
+                await read_frame(reader, MAX_SHARD_FRAME)
+            self.emigrated += len(ids)
+        except (asyncio.IncompleteReadError, OSError):
+            # The peer is not up yet or went away, the migrants stay here
+            self.connections.pop(peer, None)
+            self.world.reserve(len(types))
+            self.world.engine.immigrate(types, energy)
+
+
+class ShardClient:
+    """The coordinator's connection to a shard. Requests are answered in order, so they can be sent ahead."""
+
+    def __init__(self, address: str):
+        self.address: str = address
+        host, port = address.rsplit(":", 1)
+        # Freshly started shards take a moment to listen
+        deadline = monotonic() + CONNECT_TIMEOUT
+        while True:
+            try:
+                self.socket: socket = create_connection((host, int(port)), timeout=CONNECT_TIMEOUT)
+                break
+            except OSError:
+                if monotonic() > deadline:
+                    raise
+                sleep(0.05)
+
+    def send(self, message: str):
+        send_frame(self.socket, message)
+
+    def receive(self) -> str:
+        return recv_frame(self.socket)
+
+    def request(self, message: str) -> str:
+        self.send(message)
+        return self.receive()
+
+    def close(self):
+        self.socket.close()
+
+
+def gather(shards: list[ShardClient], messages: list[str]) -> list[str]:
+    """Send one request to each shard, then collect the replies, so the shards work on them at the same time."""
+    for shard, message in zip(shards, messages):
+        shard.send(message)
+    return [shard.receive() for shard in shards]
+
+def spread(count: int, parts: int) -> list[int]:
+    """Split count as evenly as possible, the first parts taking the remainder."""
+    return [count // parts + (k < count % parts) for k in range(parts)]
+
+def ring_peers(addresses: list[str], k: int) -> list[str]:
+    """Neighbours of the k-th shard on the ring, fewer when there are less than three shards."""
+    neighbours = [addresses[k - 1], addresses[(k + 1) % len(addresses)]]
+    return [peer for peer in dict.fromkeys(neighbours) if peer != addresses[k]]
+
+def serve(address: str, peers: list[str], capacity: int = POPULATION_LIMIT, seed: int | None = None,
+          profile_dir: str = PROFILE_DIR):
+    asyncio.run(Shard(address, peers, capacity, seed, profile_dir).run())
+
+def start_local(count: int, capacity: int = POPULATION_LIMIT, port: int = SHARD_PORT,
+                profile_dir: str = PROFILE_DIR) -> tuple[list[Process], list[str]]:
+    """Run count shards on loopback from port on, in a ring, and return their processes and addresses."""
+    addresses = [f"{SHARD_ADDRESS}:{port + k}" for k in range(count)]
+    processes = []
+    for k, address in enumerate(addresses):
+        process = Process(target=serve, args=(address, ring_peers(addresses, k), capacity, None, profile_dir))
+        process.start()
+        processes.append(process)
+    return processes, addresses
+
+
+def main():
+    arg_parser = ArgumentParser(description="Run one shard of a sharded simulation, e.g. on another machine")
+    arg_parser.add_argument("--address", default=f"{SHARD_ADDRESS}:{SHARD_PORT}",
+                            help="host:port to listen on, also the name peers know this shard by")
+    arg_parser.add_argument("--peers", default="", help="comma separated host:port of the neighbouring shards")
+    arg_parser.add_argument("--population-limit", type=int, default=POPULATION_LIMIT,
+                            help="initial number of slots, doubled when they run out")
+    arg_parser.add_argument("--seed", type=int, help="seed of the shard's RNG")
+    args = arg_parser.parse_args()
+
+    serve(args.address, [peer for peer in args.peers.split(",") if peer], args.population_limit, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env false
+import numpy as np
+
+from arena import ROW_SIZE, row_offset
+from CONSTS import LOCK_STRIPES
+from vector_engine import SLOT_DTYPE
+
+
+class Query:
+    """What list shows of a population: everyone, the top N by energy, an energy range, or only how many there are."""
+
+    def __init__(self, top: int | None = None, energy: tuple[int, int] | None = None, count_only: bool = False):
+        self.top = top
+        self.energy = energy
+        self.count_only = count_only
+
+
+class Snapshot:
+    """
+    Every slot, copied in a single slice without taking any lock, then decoded in place with NumPy. The stripes'
+    sequence numbers tell which stripes a writer went through meanwhile, only those are copied again, so listing never
+    holds individuals up however often it runs.
+    """
+
+    def __init__(self, env):
+        arena, capacity = env.arena, env.arena.capacity
+        before = np.frombuffer(arena.header.sequences(), np.uint32)
+        self.data = bytearray(arena.mapfile[row_offset(0):row_offset(capacity)])
+        after = np.frombuffer(arena.header.sequences(), np.uint32)
+
+        rows = np.frombuffer(self.data, np.uint8).reshape(capacity, ROW_SIZE)
+        for stripe in np.flatnonzero((before != after) | (before & 1)).tolist():
+            env.locks.read_stripe(stripe, lambda: _copy_stripe(arena, rows, stripe))
+        slots = np.frombuffer(self.data, SLOT_DTYPE)
+        self.types: np.ndarray = slots["type"]
+        self.energy: np.ndarray = slots["energy"]
+
+    def select(self, type_code: int, query: Query | None = None) -> tuple[np.ndarray, np.ndarray]:
+        return select(self.types, self.energy, type_code, query)
+
+
+def _copy_stripe(arena, rows: np.ndarray, stripe: int):
+    # The view into the arena goes away on return, so it never keeps a mapping from closing
+    source = np.frombuffer(arena.mapfile, np.uint8, count=rows.size, offset=row_offset(0)).reshape(rows.shape)
+    rows[stripe::LOCK_STRIPES] = source[stripe::LOCK_STRIPES]
+
+def select(types: np.ndarray, energy: np.ndarray, type_code: int,
+           query: Query | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """IDs and energies of the living individuals of a type, by ID, or by decreasing energy for the top ones."""
+    # Same rule as the recorder, a zeroed energy is a dead individual
+    mask = (types == type_code) & (energy > 0)
+    if query is not None and query.energy is not None:
+        low, high = query.energy
+        mask &= (energy >= low) & (energy <= high)
+    ids = np.flatnonzero(mask)
+    selected = energy[ids]
+
+    if query is not None and query.top is not None:
+        ids, selected = top(ids, selected, query.top)
+    return ids, selected
+
+def top(ids: np.ndarray, energy: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """The n entries with the most energy, in decreasing order. Only those get sorted, ties by position."""
+    n = min(n, len(ids))
+    best = np.sort(np.argpartition(-energy, n - 1)[:n]) if 0 < n < len(ids) else np.arange(n)
+    best = best[np.argsort(-energy[best], kind="stable")]
+    return ids[best], energy[best]
+
+
+def population(env, type_code: int) -> int:
+    """How many individuals of a type are alive, from the arena's counters instead of its slots."""
+    with env.locks.header:
+        return env.arena.header.count(type_code)
@@ -0,0 +1,80 @@
+#!/usr/bin/env false
+from collections import deque
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import Connection
+from threading import Event, Lock, Thread
+
+from individual import IndividualType, pooled_main
+from instance import Instance
+
+
+class SpawnPool:
+    """Pre-forked individual processes, already joined and attached, waiting to be given a type and slot ID."""
+
+    def __init__(self, size: int, instance: Instance):
+        self.size: int = size
+        self.instance = instance
+        self.idle: deque[tuple[Process, Connection]] = deque()
+        self.idle_lock = Lock()
+        self.stopped: bool = False
+
+        # Refill in the background, so handing out a process never waits for a fork
+        self.refill_needed = Event()
+        self.refill_needed.set()
+        self.refill_thread = Thread(target=self._refill, name="spawn_pool", daemon=True)
+        self.refill_thread.start()
+
+    def take(self, individual_type: IndividualType, individual_id: int) -> Process | None:
+        """Start an individual on a warm process, or return None if none is ready."""
+        return self.take_many([(individual_type, individual_id)])[0]
+
+    def take_many(self, individuals: list[tuple[IndividualType, int]]) -> list[Process | None]:
+        """Start individuals, as (type, slot ID), on warm processes taken from the pool in one go. Those past what
+        the pool holds get None, for the caller to start fresh."""
+        with self.idle_lock:
+            warm = deque(self.idle.popleft() for _ in range(min(len(self.idle), len(individuals))))
+        if warm:
+            self.refill_needed.set()
+        return [self._hand_over(warm, individual) for individual in individuals]
+
+    @staticmethod
+    def _hand_over(warm: deque[tuple[Process, Connection]], individual: tuple[IndividualType, int]) -> Process | None:
+        while warm:
+            process, conn = warm.popleft()
+            try:
+                conn.send(individual)
+                return process
+            except OSError:
+                # The process could not join the simulation and already left, try the next one
+                process.join()
+                process.close()
+            finally:
+                conn.close()
+        return None
+
+    def stop(self):
+        self.stopped = True
+        # A process the refill thread is starting ends up idle, and its child holds its own pipe's other end so it
+        # would never see it close: wait for the thread before terminating the idle ones
+        self.refill_needed.set()
+        self.refill_thread.join()
+        with self.idle_lock:
+            while self.idle:
+                process, conn = self.idle.popleft()
+                conn.close()
+                process.terminate()
+                process.join()
+                process.close()
+
+    def _refill(self):
+        while not self.stopped:
+            self.refill_needed.wait()
+            self.refill_needed.clear()
+
+            while len(self.idle) < self.size and not self.stopped:
+                conn, child_conn = Pipe()
+                process = Process(target=pooled_main, args=(child_conn, False, self.instance))
+                process.start()
+                child_conn.close()
+                with self.idle_lock:
+                    self.idle.append((process, conn))
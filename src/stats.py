@@ -0,0 +1,140 @@
+#!/usr/bin/env false
+import mmap
+from time import monotonic, perf_counter, time
+
+import posix_ipc
+
+# Counters, and timings kept as histograms with log2 buckets of microseconds: bucket b counts durations below 2^b us
+COUNTERS = ["updates", "deaths", "hunts", "catches", "grazes", "grass_grown", "spawns", "reaped", "joins", "commands",
+            "crashes", "births"]
+TIMINGS = ["lock_wait", "lock_hold", "update", "spawn", "reap", "join", "command"]
+(UPDATES, DEATHS, HUNTS, CATCHES, GRAZES, GRASS_GROWN, SPAWNS, REAPED, JOINS, COMMANDS, CRASHES,
+ BIRTHS) = range(len(COUNTERS))
+LOCK_WAIT, LOCK_HOLD, UPDATE, SPAWN, REAP, JOIN, COMMAND = range(len(TIMINGS))
+BUCKETS = 32
+
+# Page: start time (q, seconds since epoch), then the counters, then every histogram, then the profiling switch, all q
+PROFILING = 1 + len(COUNTERS) + len(TIMINGS) * BUCKETS
+PAGE_SIZE = 8 * (PROFILING + 1)
+# Each process adds its local counts to the page at most this often, so the hot paths never wait on the page
+FLUSH_INTERVAL = 1
+
+
+class Stats:
+    """
+    Hot path counters of a process. Updates only touch local lists, which are added to the shared page, guarded by a
+    semaphore of its own, every FLUSH_INTERVAL seconds. A lost increment between the env's threads doesn't matter here.
+    """
+
+    def __init__(self, name: str, create: bool = False):
+        flags = posix_ipc.O_CREAT if create else 0
+        self.name: str = name
+        self.memory = posix_ipc.SharedMemory(name, flags, size=PAGE_SIZE if create else 0)
+        self.mapfile = mmap.mmap(self.memory.fd, PAGE_SIZE)
+        self.memory.close_fd()
+        self.page = memoryview(self.mapfile).cast("q")
+        self.sem = posix_ipc.Semaphore(f"{name}_sem", flags, initial_value=1)
+
+        self.counters = [0] * len(COUNTERS)
+        self.histograms = [0] * (len(TIMINGS) * BUCKETS)
+        self.flushed: float = monotonic()
+        if create:
+            self.reset()
+
+    def count(self, counter: int, n: int = 1):
+        self.counters[counter] += n
+
+    def time(self, timing: int, seconds: float):
+        self.histograms[timing * BUCKETS + min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def maybe_flush(self):
+        if monotonic() - self.flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.sem:
+            for i, value in enumerate(self.counters):
+                self.page[1 + i] += value
+            base = 1 + len(COUNTERS)
+            for i, value in enumerate(self.histograms):
+                if value:
+                    self.page[base + i] += value
+
+        self.counters = [0] * len(COUNTERS)
+        self.histograms = [0] * (len(TIMINGS) * BUCKETS)
+        self.flushed = monotonic()
+
+    def read(self) -> tuple[float, list[int], list[list[int]]]:
+        """Flush, then return the uptime, the counters and the histograms of every process."""
+        self.flush()
+        with self.sem:
+            page = self.page.tolist()
+        base = 1 + len(COUNTERS)
+        histograms = [page[base + timing * BUCKETS:base + (timing + 1) * BUCKETS] for timing in range(len(TIMINGS))]
+        return time() - page[0], page[1:base], histograms
+
+    def profiling(self) -> bool:
+        """Whether every process should profile itself, polled by their Profiler."""
+        return self.page[PROFILING] != 0
+
+    def set_profiling(self, on: bool):
+        self.page[PROFILING] = int(on)
+
+    def reset(self):
+        """Zero the counters and histograms, the profiling switch stays as it is."""
+        with self.sem:
+            for i in range(PROFILING):
+                self.page[i] = 0
+            self.page[0] = int(time())
+
+    def close(self):
+        self.page.release()
+        self.mapfile.close()
+        self.sem.close()
+
+    def unlink(self):
+        self.memory.unlink()
+        self.sem.unlink()
+
+
+class TimedLock:
+    """A semaphore that records its wait and hold times in stats whenever it is used as a context manager."""
+
+    def __init__(self, sem: posix_ipc.Semaphore, stats: Stats):
+        self.sem = sem
+        self.stats = stats
+        self.acquired: float = 0
+
+    def __enter__(self):
+        start = perf_counter()
+        self.sem.acquire()
+        self.acquired = perf_counter()
+        self.stats.time(LOCK_WAIT, self.acquired - start)
+
+    def __exit__(self, *exc):
+        # Only the holder writes acquired, so read it before letting the next one in
+        held = perf_counter() - self.acquired
+        self.sem.release()
+        self.stats.time(LOCK_HOLD, held)
+
+    def acquire(self):
+        self.sem.acquire()
+
+    def release(self):
+        self.sem.release()
+
+    def unlink(self):
+        self.sem.unlink()
+
+
+def percentile(histogram: list[int], p: float) -> int | None:
+    """Upper bound in microseconds of the bucket holding the p-th percentile, None if nothing was recorded."""
+    total = sum(histogram)
+    if total == 0:
+        return None
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if seen >= total * p / 100:
+            return 1 << bucket
+    return 1 << (BUCKETS - 1)
@@ -0,0 +1,100 @@
+#!/usr/bin/env false
+import os
+import select
+import signal
+from collections.abc import Callable
+from multiprocessing import Process
+from threading import Lock, Thread
+
+
+class Supervisor:
+    """
+    Watches the individuals' processes through pidfds, from a single thread waiting on all of them with epoll, and
+    calls on_exit(slot ID, process, exit code) whenever one exits, however it died. The exit code is peeked without
+    reaping the process, so its owner still joins it, and is None when it cannot be known. Stopping them all signals
+    them through the same pidfds, which unlike PIDs can never name another process once reused, and stopping a batch
+    waits for the whole batch at once.
+    """
+
+    def __init__(self, on_exit: Callable[[int, Process, int | None], None]):
+        self.on_exit = on_exit
+        self.epoll = select.epoll()
+        # Slot ID and process by pidfd
+        self.watched: dict[int, tuple[int, Process]] = {}
+        self.lock = Lock()
+
+        self.thread = Thread(target=self._watch, name="supervisor", daemon=True)
+        self.thread.start()
+
+    def adopt(self, slot_id: int, process: Process):
+        """Watch a freshly started individual."""
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except ProcessLookupError:
+            # Already gone and reaped, whoever reaped it cleans up
+            return
+
+        with self.lock:
+            self.watched[pidfd] = (slot_id, process)
+        # epoll picks up registrations made while it waits
+        self.epoll.register(pidfd, select.EPOLLIN)
+
+    def terminate_all(self, processes: list):
+        """Send SIGTERM to every individual process at once, through their pidfds. Hosted individuals are terminated
+        apart."""
+        # Held throughout, so the watcher can't close a pidfd meanwhile
+        with self.lock:
+            for pidfd in self.watched:
+                try:
+                    signal.pidfd_send_signal(pidfd, signal.SIGTERM)
+                except ProcessLookupError:
+                    # Exited already, the watcher is on its way
+                    pass
+        for process in processes:
+            if not isinstance(process, Process):
+                process.terminate()
+
+    def wait(self, processes: list):
+        """Wait until every given process exited, on all of them at once, through their pidfds. Hosted individuals are
+        not waited for, and neither are processes the watcher already saw exit."""
+        # Not on Process.sentinel: children forked meanwhile by the spawn pool inherit the sentinel pipes' write ends,
+        # which then never close. The watcher's pidfds are duplicated, so it can close its own while we wait
+        wanted = {id(process) for process in processes if isinstance(process, Process)}
+        poll = select.poll()
+        pending: set[int] = set()
+        with self.lock:
+            for pidfd, (_, process) in self.watched.items():
+                if id(process) in wanted:
+                    duplicate = os.dup(pidfd)
+                    poll.register(duplicate, select.POLLIN)
+                    pending.add(duplicate)
+        try:
+            while pending:
+                for pidfd, _ in poll.poll():
+                    poll.unregister(pidfd)
+                    pending.discard(pidfd)
+                    os.close(pidfd)
+        finally:
+            for pidfd in pending:
+                os.close(pidfd)
+
+    @staticmethod
+    def _exit_code(pidfd: int) -> int | None:
+        """Exit code like Process.exitcode, negative for a signal, leaving the process to be reaped."""
+        try:
+            result = os.waitid(os.P_PIDFD, pidfd, os.WEXITED | os.WNOWAIT)
+        except ChildProcessError:
+            return None
+        if result is None:
+            return None
+        return result.si_status if result.si_code == os.CLD_EXITED else -result.si_status
+
+    def _watch(self):
+        while True:
+            for pidfd, _ in self.epoll.poll():
+                self.epoll.unregister(pidfd)
+                with self.lock:
+                    slot_id, process = self.watched.pop(pidfd)
+                exit_code = self._exit_code(pidfd)
+                os.close(pidfd)
+                self.on_exit(slot_id, process, exit_code)
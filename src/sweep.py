@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from os import cpu_count
+
+import CONSTS
+import headless
+import individual
+import stats
+import vector_engine
+from headless import read_script, run
+
+# Modules that imported their own copy of the world's rules, a run sets a constant in every one of them
+RULE_MODULES = [CONSTS, individual, vector_engine, headless]
+# Constants a sweep may change, the rules of CONSTS and of the individuals, not the stats indices they import
+RULES = sorted({name for module in (CONSTS, individual) for name, value in vars(module).items()
+                if name.isupper() and type(value) is int and name != "LOCK_STRIPES" and not hasattr(stats, name)})
+
+
+def constant_values(value: str) -> tuple[str, list[int]]:
+    """Parse a --set value like HUNGER_THRESHOLD=40,50,60."""
+    name, _, values = value.partition("=")
+    if name not in RULES or not values:
+        raise ValueError(value)
+    return name, [int(v) for v in values.split(",")]
+
+
+def simulate(constants: dict[str, int], seed: int, ticks: int, preys: int, predators: int,
+             script: dict[int, list[tuple[str, int, int]]] | None) -> tuple[int, int, int, int]:
+    """One headless run with the given constants, in a worker of the pool. Return its last (tick, preys, predators,
+    grass)."""
+    # Workers run one simulation after the other, and every run of a sweep sets the same constants, so none leaks
+    for name, value in constants.items():
+        for module in RULE_MODULES:
+            if hasattr(module, name):
+                setattr(module, name, value)
+
+    capacity = constants.get("POPULATION_LIMIT", CONSTS.POPULATION_LIMIT)
+    for row in run(seed, ticks, preys, predators, script, ticks, capacity):
+        pass
+    return row
+
+
+def main():
+    arg_parser = ArgumentParser(description="Run headless simulations for every combination of constants, on every "
+                                            "core, and print how each one ended")
+    arg_parser.add_argument("--set", type=constant_values, action="append", default=[], metavar="NAME=V1,V2,...",
+                            help=f"values of a constant to try, one of {', '.join(RULES)}")
+    arg_parser.add_argument("--seeds", type=int, default=1, help="runs of every combination, seeded 0, 1, ...")
+    arg_parser.add_argument("--ticks", type=int, default=3600, help="stop each run after this many ticks (seconds)")
+    arg_parser.add_argument("--preys", type=int, default=0, help="preys at tick 0")
+    arg_parser.add_argument("--predators", type=int, default=0, help="predators at tick 0")
+    arg_parser.add_argument("--script", help="file of '<tick> add|delete prey|predator <count>' lines")
+    arg_parser.add_argument("--workers", type=int, default=cpu_count(), help="simulations running at once")
+    args = arg_parser.parse_args()
+
+    names = [name for name, _ in args.set]
+    if len(set(names)) != len(names):
+        arg_parser.error("every constant can only be set once")
+    script = read_script(args.script) if args.script else None
+    runs = [(dict(zip(names, values)), seed)
+            for values in product(*(values for _, values in args.set)) for seed in range(args.seeds)]
+
+    print(*names, "seed", "tick", "preys", "predators", "grass", sep=",")
+    with ProcessPoolExecutor(max(args.workers, 1)) as pool:
+        results = pool.map(simulate, *zip(*((constants, seed, args.ticks, args.preys, args.predators, script)
+                                             for constants, seed in runs)))
+        # In order, as soon as the runs before are done too
+        for (constants, seed), result in zip(runs, results):
+            print(*constants.values(), seed, *result, sep=",")
+
+
+if __name__ == "__main__":
+    main()
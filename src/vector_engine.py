@@ -0,0 +1,142 @@
+#!/usr/bin/env false
+import numpy as np
+
+from arena import ROW_SIZE
+from CONSTS import HUNGER_THRESHOLD
+from individual import (
+    MAX_ENERGY, GRASS_NUTRIENTS, PREY_NUTRIENTS, SEX_THRESHOLD, SEX_CHANCE, MIN_WAIT, MAX_WAIT,
+    PREY_MIN_ENERGY_LOSS, PREY_MAX_ENERGY_LOSS, PREDATOR_MIN_ENERGY_LOSS, PREDATOR_MAX_ENERGY_LOSS,
+)
+
+# Type codes, as written by individual.main in shared memory
+PREY = 1
+PREDATOR = 2
+
+# Slot at the start of each arena row: B=unsigned char (type), i=integer (energy), the rest is left alone
+SLOT_DTYPE = np.dtype({"names": ["type", "energy"], "formats": ["u1", "i4"], "offsets": [0, 1], "itemsize": ROW_SIZE})
+
+
+class VectorEngine:
+    """Whole population held in NumPy arrays and updated in batches, one tick being one second of individual.main."""
+
+    def __init__(self, capacity: int, rng: np.random.Generator | None = None):
+        self.capacity: int = capacity
+        self.rng: np.random.Generator = rng if rng is not None else np.random.default_rng()
+        self.types = np.zeros(capacity, dtype=np.uint8)
+        self.energy = np.zeros(capacity, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        # Ticks left before the individual wakes up, replaces the sleep at the end of individual.main
+        self.wait = np.zeros(capacity, dtype=np.int32)
+        # Offsprings born and individuals dead of hunger or eaten so far, commands and migrations aside
+        self.births: int = 0
+        self.deaths: int = 0
+
+    def grow(self, capacity: int):
+        """Extend the arrays with free slots, up to capacity."""
+        extra = capacity - self.capacity
+        self.types = np.concatenate([self.types, np.zeros(extra, dtype=np.uint8)])
+        self.energy = np.concatenate([self.energy, np.zeros(extra, dtype=np.int32)])
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+        self.wait = np.concatenate([self.wait, np.zeros(extra, dtype=np.int32)])
+        self.capacity = capacity
+
+    def count(self, type_code: int) -> int:
+        return int(np.count_nonzero(self.alive & (self.types == type_code)))
+
+    def energy_sums(self, type_code: int) -> tuple[int, int]:
+        """Sum of the energies of a type's individuals and of their squares, like the arena's header keeps."""
+        energy = self.energy[self.alive & (self.types == type_code)].astype(np.int64)
+        return int(energy.sum()), int((energy * energy).sum())
+
+    def spawn(self, type_code: int, count: int) -> int:
+        """Put up to count new individuals in free slots and return how many fit."""
+        new_ids = np.flatnonzero(~self.alive)[:count]
+        self.types[new_ids] = type_code
+        self.energy[new_ids] = MAX_ENERGY
+        self.alive[new_ids] = True
+        # Individuals update right after joining, then sleep
+        self.wait[new_ids] = 0
+        return len(new_ids)
+
+    def kill(self, type_code: int, count: int) -> int:
+        """Remove up to count individuals of a type, lowest slot IDs first."""
+        ids = np.flatnonzero(self.alive & (self.types == type_code))[:count]
+        self._bury(ids)
+        return len(ids)
+
+    def emigrate(self, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Take individuals out of the engine, returning their types and energies to put them in another."""
+        types, energy = self.types[ids].copy(), self.energy[ids].copy()
+        self._bury(ids)
+        return types, energy
+
+    def immigrate(self, types: np.ndarray, energy: np.ndarray) -> int:
+        """Put individuals from another engine in free slots, keeping their energy, and return how many fit."""
+        new_ids = np.flatnonzero(~self.alive)[:len(types)]
+        self.types[new_ids] = types[:len(new_ids)]
+        self.energy[new_ids] = energy[:len(new_ids)]
+        self.alive[new_ids] = True
+        self.wait[new_ids] = 0
+        return len(new_ids)
+
+    def step(self, grass: int) -> int:
+        """Advance the simulation by one tick and return the grass left."""
+        self.wait[self.alive] -= 1
+        ids = np.flatnonzero(self.alive & (self.wait <= 0))
+        if len(ids) == 0:
+            return grass
+
+        # Lose energy
+        types = self.types[ids]
+        is_prey = types == PREY
+        energy = self.energy[ids] - np.where(
+            is_prey,
+            self.rng.integers(PREY_MIN_ENERGY_LOSS, PREY_MAX_ENERGY_LOSS + 1, len(ids)),
+            self.rng.integers(PREDATOR_MIN_ENERGY_LOSS, PREDATOR_MAX_ENERGY_LOSS + 1, len(ids)),
+        )
+
+        # Handle death
+        dead = energy <= 0
+        self._bury(ids[dead])
+        self.deaths += int(np.count_nonzero(dead))
+        ids, types, is_prey, energy = ids[~dead], types[~dead], is_prey[~dead], energy[~dead]
+        self.energy[ids] = energy
+
+        # Reproduce if horny, offsprings start acting next tick
+        horny = (energy > SEX_THRESHOLD) & (self.rng.integers(1, 101, len(ids)) <= SEX_CHANCE)
+        parents = types[horny]
+
+        # Eat if hungry. Preys first, each grass feeds a single prey
+        hungry = energy <= HUNGER_THRESHOLD
+        grazers = self.rng.permutation(ids[hungry & is_prey])[:max(grass, 0)]
+        self.energy[grazers] += GRASS_NUTRIENTS
+        grass -= len(grazers)
+
+        # Then predators, each catching a distinct prey that is still weak enough
+        hunters = self.rng.permutation(ids[hungry & ~is_prey])
+        catchable = np.flatnonzero(
+            self.alive & (self.types == PREY) & (self.energy < HUNGER_THRESHOLD) & (self.energy != 0)
+        )
+        caught = min(len(hunters), len(catchable))
+        if caught:
+            self._bury(self.rng.choice(catchable, caught, replace=False))
+            self.energy[hunters[:caught]] += PREY_NUTRIENTS
+            self.deaths += caught
+
+        # Finally, wait until the next update
+        self.wait[ids] = self.rng.integers(MIN_WAIT, MAX_WAIT + 1, len(ids))
+
+        for type_code in (PREY, PREDATOR):
+            self.births += self.spawn(type_code, int(np.count_nonzero(parents == type_code)))
+
+        return grass
+
+    def publish(self, slots: np.ndarray):
+        """Write the population into a SLOT_DTYPE view of the shared memory. Caller holds the semaphore."""
+        slots["type"] = self.types
+        slots["energy"] = self.energy
+
+    def _bury(self, ids: np.ndarray):
+        self.types[ids] = 0
+        self.energy[ids] = 0
+        self.alive[ids] = False
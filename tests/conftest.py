@@ -0,0 +1,24 @@
+import os
+import sys
+from itertools import count
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from arena import Arena
+from locks import WorldLocks
+
+# Own names for every test world, so a running simulation and other test runs are left alone
+NAMES = count()
+
+
+@pytest.fixture
+def world():
+    """A standalone world of 16 slots: a fresh arena and its locks, unlinked afterwards."""
+    name = f"/circle_of_life_test_{os.getpid()}_{next(NAMES)}"
+    arena = Arena(name, 16)
+    locks = WorldLocks(name, arena, create=True)
+    yield arena, locks
+    locks.unlink()
+    arena.memory.unlink()
+    arena.close()
@@ -0,0 +1,115 @@
+import os
+import struct
+from array import array
+from collections import deque
+from threading import Lock
+from types import SimpleNamespace
+
+import pytest
+
+import checkpoint
+from checkpoint import HEADER_FORMAT, HEADER_SIZE, VERSION
+from vector_engine import PREY, PREDATOR
+
+
+def make_env(arena, locks) -> SimpleNamespace:
+    """The env attributes save() and restore() use, for a process mode world without a grid."""
+    return SimpleNamespace(
+        arena=arena, locks=locks, engine=None, grid=None,
+        preys_processes={}, predators_processes={}, processes_lock=Lock(),
+        free_ids=deque(range(arena.capacity)), tags=array("H", bytes(2 * arena.capacity)),
+        drought_remaining=0, drought_lock=Lock(),
+    )
+
+def populate(env, individuals: list[tuple[int, int, int]]):
+    """Put (type code, slot ID, energy) individuals in their slots, as if they were running."""
+    for type_code, slot_id, energy in individuals:
+        env.free_ids.remove(slot_id)
+        env.tags[slot_id] += 1
+        env.arena.slots.write(slot_id, type_code, energy)
+        env.arena.slots.set_tag(slot_id, env.tags[slot_id])
+        env.arena.header.add_count(type_code, 1)
+        processes = env.preys_processes if type_code == PREY else env.predators_processes
+        processes[slot_id] = None
+
+@pytest.fixture
+def saved(world, tmp_path):
+    env = make_env(*world)
+    populate(env, [(PREY, 0, 70), (PREY, 3, 25), (PREDATOR, 5, 90)])
+    env.drought_remaining = 4
+    path = str(tmp_path / "world.ckpt")
+    checkpoint.save(env, path)
+    return env, path
+
+
+def test_round_trip(saved):
+    env, path = saved
+    loaded = checkpoint.read(path)
+    assert loaded.capacity == env.arena.capacity
+    assert loaded.drought_remaining == 4
+    assert sorted(loaded.preys) == [0, 3]
+    assert list(loaded.predators) == [5]
+    assert list(loaded.free_ids) == list(env.free_ids)
+    assert loaded.tags == env.tags
+
+    # Everyone is gone meanwhile, restoring brings them back with their saved energy
+    for slot_id in (0, 3, 5):
+        env.arena.slots.clear(slot_id)
+    env.arena.header.set_count(PREY, 0)
+    env.arena.header.set_count(PREDATOR, 0)
+    env.drought_remaining = 0
+    individuals = checkpoint.restore(env, loaded)
+
+    assert sorted(individuals) == [(PREY, 0), (PREY, 3), (PREDATOR, 5)]
+    assert env.arena.slots.read(3) == (PREY, 25, env.tags[3])
+    assert env.arena.slots.read(5) == (PREDATOR, 90, env.tags[5])
+    assert env.arena.header.count(PREY) == 2
+    assert env.arena.header.count(PREDATOR) == 1
+    assert env.drought_remaining == 4
+
+def test_dead_slots_are_freed_on_restore(world, tmp_path):
+    env = make_env(*world)
+    populate(env, [(PREY, 0, 70), (PREY, 3, 25)])
+    # Eaten right before the save, the reaper didn't get to it yet
+    env.arena.slots.set_type(3, 0)
+    env.arena.header.add_count(PREY, -1)
+    path = str(tmp_path / "world.ckpt")
+    checkpoint.save(env, path)
+
+    individuals = checkpoint.restore(env, checkpoint.read(path))
+    assert individuals == [(PREY, 0)]
+    assert 3 in env.free_ids
+    assert env.arena.header.count(PREY) == 1
+
+@pytest.mark.parametrize("length", [0, HEADER_SIZE - 1, HEADER_SIZE, -1])
+def test_truncated_file(saved, length):
+    _, path = saved
+    size = os.path.getsize(path)
+    os.truncate(path, length if length >= 0 else size + length)
+    with pytest.raises(ValueError):
+        checkpoint.read(path)
+
+def test_old_version(saved):
+    _, path = saved
+    with open(path, "r+b") as checkpoint_file:
+        header = list(struct.unpack(HEADER_FORMAT, checkpoint_file.read(HEADER_SIZE)))
+        header[1] = VERSION - 1
+        checkpoint_file.seek(0)
+        checkpoint_file.write(struct.pack(HEADER_FORMAT, *header))
+    with pytest.raises(ValueError, match=f"version {VERSION}"):
+        checkpoint.read(path)
+
+def test_not_a_checkpoint(tmp_path):
+    path = tmp_path / "world.ckpt"
+    path.write_bytes(b"COLREC\x00\x00" + bytes(HEADER_SIZE))
+    with pytest.raises(ValueError):
+        checkpoint.read(str(path))
+
+def test_slot_ids_past_capacity(saved):
+    env, path = saved
+    with open(path, "r+b") as checkpoint_file:
+        checkpoint_file.seek(HEADER_SIZE + env.arena.size(env.arena.capacity) + 2 * env.arena.capacity)
+        # First free ID
+        checkpoint_file.write(struct.pack("=i", env.arena.capacity))
+    with pytest.raises(ValueError, match="past its capacity"):
+        checkpoint.read(path)
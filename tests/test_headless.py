@@ -0,0 +1,41 @@
+import numpy as np
+
+from headless import read_script, run
+from recorder import load, Recorder
+from vector_engine import PREY, PREDATOR
+
+# Small enough to run in a blink, long enough for births, hunts, grass and a drought or two
+TICKS = 1500
+
+
+def samples(seed: int, **kwargs) -> list[tuple[int, int, int, int]]:
+    return list(run(seed, TICKS, preys=40, predators=6, every=50, **kwargs))
+
+
+def test_same_seed_same_run():
+    assert samples(7) == samples(7)
+
+def test_seeds_differ():
+    assert samples(7) != samples(8)
+
+def test_growth_is_deterministic():
+    # Starting with 4 slots, the world doubles many times along the way
+    assert samples(7, capacity=4) == samples(7, capacity=4)
+
+def test_script_is_deterministic(tmp_path):
+    path = tmp_path / "scenario.txt"
+    path.write_text("# Second wave\n100 add predator 5\n\n300 delete prey 10\n")
+    script = read_script(str(path))
+    assert script == {100: [("add", PREDATOR, 5)], 300: [("delete", PREY, 10)]}
+    assert samples(7, script=script) == samples(7, script=script)
+
+def test_recording_matches_the_samples(tmp_path):
+    recorders = [Recorder(str(tmp_path / f"run{k}.rec")) for k in range(2)]
+    for recorder in recorders:
+        rows = samples(7, recorder=recorder)
+        recorder.close()
+
+    first, second = (load(str(tmp_path / f"run{k}.rec")) for k in range(2))
+    assert np.array_equal(first, second)
+    assert first["timestamp"].tolist() == [tick for tick, _, _, _ in rows]
+    assert first["preys"].tolist() == [preys for _, preys, _, _ in rows]
@@ -0,0 +1,52 @@
+from CONSTS import LOCK_STRIPES
+from locks import READ_RETRIES, WorldLocks
+
+
+def interfering_reader(locks: WorldLocks, slot_id: int, writes: int):
+    """Reader of a slot that a writer goes through while the first writes reads run, and which records whether the
+    stripe was held for each read."""
+    arena = locks.arena
+    held = []
+
+    def reader():
+        stripe = slot_id % LOCK_STRIPES
+        held.append(bool(arena.header.sequence(stripe) & 1))
+        value = arena.slots.read(slot_id)
+        if len(held) <= writes:
+            with locks.stripe(slot_id):
+                arena.slots.set_energy(slot_id, value[1] + 1)
+        return value
+
+    return reader, held
+
+
+def test_stripe_sequence_is_odd_while_held(world):
+    arena, locks = world
+    before = arena.header.sequence(3)
+    with locks.stripe(3):
+        assert arena.header.sequence(3) == before + 1
+    assert arena.header.sequence(3) == before + 2
+
+def test_read_slot_without_writer(world):
+    arena, locks = world
+    arena.slots.write(3, 1, 50)
+    before = arena.header.sequence(3)
+    assert locks.read_slot(3) == (1, 50, 0)
+    # Readers never touch the sequence
+    assert arena.header.sequence(3) == before
+
+def test_read_retries_after_a_write(world):
+    arena, locks = world
+    arena.slots.write(3, 1, 50)
+    reader, held = interfering_reader(locks, 3, writes=1)
+    # The first read saw 50, then the writer moved the sequence, so it is read again
+    assert locks.read_stripe(3, reader) == (1, 51, 0)
+    assert held == [False, False]
+
+def test_read_holds_the_stripe_after_retries(world):
+    arena, locks = world
+    arena.slots.write(3, 1, 50)
+    reader, held = interfering_reader(locks, 3, writes=READ_RETRIES)
+    assert locks.read_stripe(3, reader) == (1, 50 + READ_RETRIES, 0)
+    # Every optimistic read was spoiled, the last one waits for the stripe like a writer
+    assert held == [False] * READ_RETRIES + [True]
@@ -0,0 +1,97 @@
+import os
+from array import array
+from collections import deque
+from multiprocessing import Process
+from threading import Lock
+from types import SimpleNamespace
+
+import pytest
+
+from env_manager import EnvState, reap_individual
+from population import Population
+from prey_index import PreyIndex
+from stats import Stats
+from vector_engine import PREY
+
+
+@pytest.fixture
+def env(world):
+    """The env attributes handing out, reaping and freeing slots use, on a standalone world."""
+    arena, locks = world
+    stats = Stats(f"{locks.prefix}_stats", create=True)
+    free_ids = deque(range(arena.capacity))
+    yield SimpleNamespace(
+        arena=arena, locks=locks, stats=stats, prey_index=PreyIndex(arena), grid=None,
+        free_ids=free_ids, tags=array("H", bytes(2 * arena.capacity)), return_id=free_ids.append,
+        preys_processes={}, predators_processes={}, processes_lock=Lock(), population=Population(0),
+        # A world that can't grow, so get_free_id() only hands out free_ids
+        grow=lambda capacity=0: False,
+    )
+    stats.unlink()
+
+def enter(env, slot_id: int, process=None):
+    """What an individual does on start, plus the env's bookkeeping of it."""
+    env.arena.slots.write(slot_id, PREY, 100)
+    env.arena.header.add_count(PREY, 1)
+    env.preys_processes[slot_id] = process
+
+def die(env, slot_id: int) -> tuple[int, int]:
+    """Mark a slot dead, and return its death queue entry."""
+    env.arena.slots.set_type(slot_id, 0)
+    env.arena.header.add_count(PREY, -1)
+    return slot_id, env.arena.slots.read(slot_id)[2]
+
+def finished_process() -> Process:
+    process = Process(target=os.getpid)
+    process.start()
+    process.join()
+    return process
+
+
+def test_each_hand_out_gets_a_new_tag(env):
+    slot_id = EnvState.get_free_id(env)
+    assert env.arena.slots.read(slot_id)[2] == env.tags[slot_id] == 1
+
+    env.free_ids.appendleft(slot_id)
+    assert EnvState.get_free_id(env) == slot_id
+    assert env.arena.slots.read(slot_id)[2] == env.tags[slot_id] == 2
+
+def test_tags_wrap_around(env):
+    env.tags[0] = 0xFFFF
+    assert EnvState.get_free_id(env) == 0
+    assert env.tags[0] == 0
+
+def test_full_world_hands_out_nothing(env):
+    env.free_ids.clear()
+    assert EnvState.get_free_id(env) is None
+
+def test_death_is_reaped(env):
+    slot_id = EnvState.get_free_id(env)
+    enter(env, slot_id, finished_process())
+    death = die(env, slot_id)
+
+    reap_individual(env, *death)
+    assert slot_id not in env.preys_processes
+    assert env.arena.slots.read(slot_id) == (0, 0, 0)
+    assert env.free_ids[-1] == slot_id
+    assert env.population.deaths == 1
+
+def test_stale_death_spares_the_slot_new_individual(env):
+    slot_id = EnvState.get_free_id(env)
+    enter(env, slot_id)
+    death = die(env, slot_id)
+
+    # Deleted before the reaper got to its death, and the slot handed to someone else
+    del env.preys_processes[slot_id]
+    env.arena.slots.clear(slot_id)
+    env.free_ids.appendleft(slot_id)
+    assert EnvState.get_free_id(env) == slot_id
+    newcomer = object()
+    enter(env, slot_id, newcomer)
+    # Even dead, the newcomer is not the one the death was queued for
+    die(env, slot_id)
+
+    reap_individual(env, *death)
+    assert env.preys_processes[slot_id] is newcomer
+    assert slot_id not in env.free_ids
+    assert env.population.deaths == 0